@@ -9,6 +9,8 @@
     
 from . import Tag
 from . import String
+from . import Domain
+from . import Cache
 import copy, logging
 
 
@@ -27,6 +29,27 @@ import copy, logging
 #significant in some context. 
 attrdomain = ['_'] + [i for i in map(chr, range(97, 123))] + [i for i in map(chr, range(32, 48))] + [i for i in map(chr, range(58, 65))] + ['\\'] + [i for i in map(chr, range(65, 91))] + [i for i in map(chr, range(48, 58))] 
 
+#compiled once, see Domain.py
+_domain = Domain.Domain(attrdomain)
+
+#every character allowed in XML attribute values, for documents with characters that
+#are not in attrdomain, see Domain.ArithmeticDomain and setDomain(). XML parsers turn
+#tabs, newlines and carriage returns in attribute values into spaces, so they are left out.
+xmlattrdomain = Domain.ArithmeticDomain('_', exclude='\t\n\r')
+
+
+def setDomain(domain):
+    """Use domain, a list or a Domain object, for all attribute values. The unit of the
+    domain must be '_'."""
+    global _domain
+    domain = Domain.compile(domain)
+    if domain.unit != '_':
+        raise ValueError('the unit of the attribute domain must be "_", not "%s"' % domain.unit)
+    _domain = domain
+    #cached results were computed in the previous domain
+    _addValues.cache.clear()
+    _valueInverse.cache.clear()
+
 
 def isUnitAttrib(a):
     if dict(a) == {}:
@@ -38,7 +61,7 @@ def isUnitAttrib(a):
 def cleanKeys(attr):
     deletekeys = []
     for key in attr.keys():
-        if (attr[key] == attrdomain[0]) or (attr[key] == '') or (attr[key] is False) or (attr[key] is None): 
+        if (attr[key] == _domain.unit) or (attr[key] == '') or (attr[key] is False) or (attr[key] is None): 
             deletekeys.append(key)
     for key in deletekeys:
         del attr[key]
@@ -61,7 +84,7 @@ def addAttribs(attrib1, attrib2):
             result[key] = attrib2[key]
         else:
             #log.debug('result key: %s\tvalue: %s' % (key, result[key]))
-            result[key] = String._addstrings(result[key], attrib2[key], attrdomain)
+            result[key] = _addValues(result[key], attrib2[key])
     
     cleanKeys(result)        
 #    log.debug('result: %s' % str(result))
@@ -74,5 +97,18 @@ def attribInverse(attrib):
     result = {}
     cleanKeys(attrib)
     for key in attrib.keys():
-        result[key] = String._stringinverse(attrib[key], attrdomain)
-    return result    
\ No newline at end of file
+        result[key] = _valueInverse(attrib[key])
+    return result
+
+
+
+#attribute values are added and inverted as strings, the results are cached since
+#documents reuse a small number of values, see Cache.py
+@Cache.cached('Attrib.addValues')
+def _addValues(value1, value2):
+    return String._addstrings(value1, value2, _domain)
+
+
+@Cache.cached('Attrib.valueInverse')
+def _valueInverse(value):
+    return String._stringinverse(value, _domain)
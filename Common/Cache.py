@@ -0,0 +1,139 @@
+"""This file defines bounded caches for the results of the string operations."""
+
+import collections, functools
+
+
+#Documents reuse a small vocabulary of tags and attribute values, so most calls to
+#Tag.addTags(), Tag.tagInverse() and the attribute value arithmetic in Attrib.py repeat
+#a call that was made before. The functions are wrapped with cached(), below, which
+#keeps their results in an LRUCache keyed on their arguments. When the cache is full the
+#least recently used result is evicted.
+#
+#Only calls where every argument is a str are cached. GroupStrings compare equal to the
+#str with the same characters, but the functions return GroupStrings for them, see
+#GroupString.py, so they always go through to the function.
+#
+#Every cache is registered under a name, usually the name of the function it wraps. Use
+#stats() to read the hit, miss and eviction counters, and resize() to change the size
+#of a cache. A size of 0 disables the cache.
+
+
+#default number of results kept by each cache
+MAXSIZE = 4096
+
+
+class LRUCache:
+    def __init__(self, maxsize=MAXSIZE):
+        self.maxsize = maxsize
+        self._results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key):
+        return key in self._results
+
+    def get(self, key, default=None):
+        """Return the result stored for key and mark it as the most recently used, or
+        default if there is none"""
+        try:
+            result = self._results[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store the result for key, evicting the least recently used results if the
+        cache is full"""
+        if self.maxsize <= 0:
+            return
+        self._results[key] = result
+        self._results.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize):
+        """Change the number of results kept, evicting results if needed"""
+        self.maxsize = maxsize
+        self._evict()
+
+    def clear(self):
+        """Remove all the results and reset the counters"""
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return the counters and the size of the cache as a dictionary"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._results),
+                'maxsize': self.maxsize,
+                'hitrate': float(self.hits) / lookups if lookups else 0.0}
+
+    def _evict(self):
+        while len(self._results) > max(self.maxsize, 0):
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+
+
+#caches by name, see register()
+caches = {}
+
+def register(name, cache):
+    """Register the cache under name and return it"""
+    caches[name] = cache
+    return cache
+
+
+def stats():
+    """Return the stats of every registered cache, by name"""
+    return dict([(name, cache.stats()) for name, cache in caches.items()])
+
+
+def resize(maxsize, names=None):
+    """Change the size of the registered caches, or only of those listed in names"""
+    for name, cache in caches.items():
+        if names is None or name in names:
+            cache.resize(maxsize)
+
+
+def clear():
+    """Clear every registered cache"""
+    for cache in caches.values():
+        cache.clear()
+
+
+#returned by LRUCache.get() on a miss, results can be None or False
+_missing = object()
+
+def cached(name, maxsize=MAXSIZE):
+    """Decorator that keeps the results of a function of str arguments in an LRUCache
+    registered under name. The cache is available as the cache attribute of the
+    wrapped function."""
+    def decorator(function):
+        cache = register(name, LRUCache(maxsize))
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            for arg in args:
+                if type(arg) is not str:
+                    return function(*args)
+            result = cache.get(args, _missing)
+            if result is _missing:
+                result = function(*args)
+                cache.put(args, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,308 @@
+import logging, re, bisect
+
+#a domain is the cyclic group of characters that strings are built from, see String.py.
+#Domains used to be passed around as plain lists and every character operation called
+#list.index() on them, which is a linear scan of the domain for every character of every
+#string. The Domain object below is built once per domain list and holds the lookup
+#tables needed to do the arithmetic in constant time per character:
+#   char -> index
+#   index -> char
+#   char + char -> char
+#   char -> inverse char, as a str.translate() table so whole strings are inverted at once
+#
+#Domain objects also behave like the lists they are built from (domain[0] is the unit,
+#len(domain), domain.index(char)), so they can be passed anywhere a domain list was
+#passed before.
+
+
+class Domain:
+    def __init__(self, chars):
+        self.chars = tuple(chars)
+        self.size = len(self.chars)
+        self.unit = self.chars[0]
+
+        self._indices = {}
+        for index, char in enumerate(self.chars):
+            self._indices[char] = index
+        self._charset = frozenset(self.chars)
+
+        #addition table, self._sums[char1][char2] is char1 + char2
+        self._sums = {}
+        for index1, char1 in enumerate(self.chars):
+            row = {}
+            for index2, char2 in enumerate(self.chars):
+                row[char2] = self.chars[(index1 + index2) % self.size]
+            self._sums[char1] = row
+
+        inverses = {}
+        for index, char in enumerate(self.chars):
+            inverses[char] = self.chars[(self.size - index) % self.size]
+        self._inversetable = str.maketrans(inverses)
+
+        #numpy lookup tables, see encodeArray()
+        self._lookup = None
+        self._codes = None
+
+    def __getitem__(self, index):
+        return self.chars[index]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.chars)
+
+    def __contains__(self, char):
+        return char in self._charset
+
+    def index(self, char):
+        """Return the index of the character in the domain. Raise ValueError if the
+        character is not part of the domain."""
+        try:
+            return self._indices[char]
+        except KeyError:
+            self._notFound(char)
+
+    def char(self, index):
+        """Return the character at index, taken modulo the size of the domain"""
+        return self.chars[index % self.size]
+
+    def contains(self, string):
+        """Return True if every character in string belongs to the domain"""
+        return self._charset.issuperset(string)
+
+    def invalidChars(self, string):
+        """Return the set of characters in string that do not belong to the domain"""
+        return set(string).difference(self._charset)
+
+    def validate(self, string):
+        """Raise ValueError if any character in the string is not part of the domain"""
+        if not self._charset.issuperset(string):
+            self._notFound(''.join(sorted(self.invalidChars(string))))
+
+    def addChars(self, char1, char2):
+        """Add two characters of the domain"""
+        try:
+            return self._sums[char1][char2]
+        except KeyError:
+            self.validate(char1 + char2)
+            raise
+
+    def invertChar(self, char1):
+        """Return the inverse of a character of the domain"""
+        return self.chars[(self.size - self.index(char1)) % self.size]
+
+    def addStrings(self, string1, string2):
+        """Add two strings character by character and return the result. The shorter
+        string is padded at the end with units. The result is not cleaned."""
+        if len(string1) < len(string2):
+            string1 = string1.ljust(len(string2), self.unit)
+        elif len(string2) < len(string1):
+            string2 = string2.ljust(len(string1), self.unit)
+
+        sums = self._sums
+        try:
+            return ''.join([sums[char1][char2] for char1, char2 in zip(string1, string2)])
+        except KeyError:
+            self.validate(string1 + string2)
+            raise
+
+    def invertString(self, string1):
+        """Invert every character of the string and return the result. The result is
+        not cleaned."""
+        self.validate(string1)
+        return string1.translate(self._inversetable)
+
+    def clean(self, string1):
+        """Remove trailing units from the string"""
+        return string1.rstrip(self.unit)
+
+    def encodeArray(self, codes):
+        """Return the indices of an array of code points as a numpy array. Raise
+        ValueError if any of the characters is not part of the domain. See Segments.py"""
+        import numpy
+
+        if self._lookup is None:
+            #code points past the table are looked up as its last entry, which is -1
+            #the sum of two indices must fit in the type too, see Segments.add()
+            dtype = numpy.int16 if self.size < 2 ** 14 else numpy.int32
+            lookup = numpy.full(max([ord(char) for char in self.chars]) + 2, -1, dtype=dtype)
+            for index, char in enumerate(self.chars):
+                lookup[ord(char)] = index
+            self._lookup = lookup
+            self._codes = numpy.array([ord(char) for char in self.chars], dtype=numpy.uint32)
+
+        codes = numpy.asarray(codes, dtype=numpy.int64) if len(codes) == 0 else numpy.asarray(codes)
+        if numpy.iinfo(codes.dtype).max >= len(self._lookup):
+            codes = numpy.minimum(codes, len(self._lookup) - 1)
+        indices = self._lookup[codes]
+        invalid = indices < 0
+        if invalid.any():
+            self._notFound(''.join(sorted(set([chr(code) for code in codes[invalid].tolist()]))))
+        return indices
+
+    def decodeArray(self, indices):
+        """Return the code points of an array of indices as a numpy array"""
+        if self._codes is None:
+            self.encodeArray([])
+        return self._codes[indices]
+
+    def _notFound(self, chars):
+        log = logging.getLogger()
+        log.error('"%s" not found in domain' % chars)
+        raise ValueError('"%s" not found in domain' % chars)
+
+    def __repr__(self):
+        return '%s(%i characters, unit %r)' % (type(self).__name__, self.size, self.unit)
+
+
+
+
+#The Domain above needs every character of the domain in its tables. To do arithmetic on
+#any character that can appear in a document, the ArithmeticDomain below treats the
+#characters allowed in XML as one cyclic group instead: the characters are numbered in
+#code point order, skipping the code points that are not allowed, and the numbers are
+#rotated so that the unit has index 0. The index of a character is then its code point
+#minus an offset that depends on the range it falls in, and there are no tables.
+
+#the characters allowed in XML documents, as ranges of code points, see
+#https://www.w3.org/TR/xml/#charsets
+XMLRANGES = ((0x9, 0xA), (0xD, 0xD), (0x20, 0xD7FF), (0xE000, 0xFFFD), (0x10000, 0x10FFFF))
+
+
+class ArithmeticDomain(Domain):
+    def __init__(self, unit, exclude=''):
+        """Build the domain of the XML characters, except those in exclude, with the
+        given unit"""
+        excluded = sorted(set([ord(char) for char in exclude]))
+        ranges = []
+        for first, last in XMLRANGES:
+            for code in excluded:
+                if first <= code <= last:
+                    if first < code:
+                        ranges.append((first, code - 1))
+                    first = code + 1
+            if first <= last:
+                ranges.append((first, last))
+        self.ranges = tuple(ranges)
+
+        #self._offsets[i] is the number of characters in the ranges before range i
+        self._firsts = [first for first, last in self.ranges]
+        self._lasts = [last for first, last in self.ranges]
+        self._offsets = []
+        size = 0
+        for first, last in self.ranges:
+            self._offsets.append(size)
+            size += last - first + 1
+        self.size = size
+
+        pattern = ''.join(['%s-%s' % (re.escape(chr(first)), re.escape(chr(last))) for first, last in self.ranges])
+        self._invalid = re.compile('[^%s]' % pattern)
+
+        self.unit = unit
+        if unit not in self:
+            self._notFound(unit)
+        self._unitposition = self._position(ord(unit))
+
+        self._lookup = None
+        self._codes = None
+
+    def _position(self, code):
+        """Return the number of the code point in the ranges, before rotation"""
+        i = bisect.bisect_right(self._firsts, code) - 1
+        return code - self._firsts[i] + self._offsets[i]
+
+    def _code(self, position):
+        """Return the code point numbered position in the ranges, before rotation"""
+        i = bisect.bisect_right(self._offsets, position) - 1
+        return position - self._offsets[i] + self._firsts[i]
+
+    def __getitem__(self, index):
+        return self.char(index)
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self.char(index)
+
+    def __contains__(self, char):
+        return isinstance(char, str) and len(char) == 1 and self._invalid.match(char) is None
+
+    def index(self, char):
+        if char not in self:
+            self._notFound(char)
+        return (self._position(ord(char)) - self._unitposition) % self.size
+
+    def char(self, index):
+        return chr(self._code((index + self._unitposition) % self.size))
+
+    def contains(self, string):
+        return self._invalid.search(string) is None
+
+    def invalidChars(self, string):
+        return set(self._invalid.findall(string))
+
+    def validate(self, string):
+        if self._invalid.search(string) is not None:
+            self._notFound(''.join(sorted(self.invalidChars(string))))
+
+    def addChars(self, char1, char2):
+        return self.char(self.index(char1) + self.index(char2))
+
+    def invertChar(self, char1):
+        return self.char(-self.index(char1))
+
+    def addStrings(self, string1, string2):
+        if len(string1) < len(string2):
+            string1 = string1.ljust(len(string2), self.unit)
+        elif len(string2) < len(string1):
+            string2 = string2.ljust(len(string1), self.unit)
+
+        self.validate(string1)
+        self.validate(string2)
+        #the unit is added to the positions twice and has to be taken out once
+        position, code, size, unitposition = self._position, self._code, self.size, self._unitposition
+        return ''.join([chr(code((position(ord(char1)) + position(ord(char2)) - unitposition) % size)) for char1, char2 in zip(string1, string2)])
+
+    def invertString(self, string1):
+        self.validate(string1)
+        #the inverse of position p is 2 * unit - p
+        position, code, size, unitposition = self._position, self._code, self.size, self._unitposition
+        return ''.join([chr(code((2 * unitposition - position(ord(char))) % size)) for char in string1])
+
+    def encodeArray(self, codes):
+        import numpy
+
+        codes = numpy.asarray(codes, dtype=numpy.int64)
+        firsts = numpy.array(self._firsts, dtype=numpy.int64)
+        ranges = numpy.searchsorted(firsts, codes, side='right') - 1
+        invalid = (ranges < 0) | (codes > numpy.array(self._lasts, dtype=numpy.int64)[ranges])
+        if invalid.any():
+            self._notFound(''.join(sorted(set([chr(code) for code in codes[invalid].tolist()]))))
+        positions = codes - firsts[ranges] + numpy.array(self._offsets, dtype=numpy.int64)[ranges]
+        #the sum of two indices must fit in the type, see Segments.add()
+        return ((positions - self._unitposition) % self.size).astype(numpy.int32)
+
+    def decodeArray(self, indices):
+        import numpy
+
+        offsets = numpy.array(self._offsets, dtype=numpy.int64)
+        positions = (numpy.asarray(indices, dtype=numpy.int64) + self._unitposition) % self.size
+        ranges = numpy.searchsorted(offsets, positions, side='right') - 1
+        return (positions - offsets[ranges] + numpy.array(self._firsts, dtype=numpy.int64)[ranges]).astype(numpy.uint32)
+
+
+
+_compiled = {}
+
+def compile(stringdomain):
+    """Return the Domain object for a domain list. Domain objects are returned
+    unchanged, lists are compiled once and then reused."""
+    if isinstance(stringdomain, Domain):
+        return stringdomain
+    key = tuple(stringdomain)
+    try:
+        return _compiled[key]
+    except KeyError:
+        domain = Domain(key)
+        _compiled[key] = domain
+        return domain
@@ -0,0 +1,173 @@
+"""This file defines GroupString, a string stored as the indices of its characters
+in a domain."""
+
+import array, operator
+
+from . import Domain
+
+
+#The functions in Tag.py, Text.py and Attrib.py take and return str, so every operation
+#looks up the index of every character of its operands and turns the result back into
+#characters. A GroupString keeps the indices instead, so a chain of operations such as
+#   addTags(tag3, tagInverse(addTags(tag1, tag2)))
+#only converts from and to str at the ends of the chain. Tag, Text and Attrib accept
+#GroupStrings wherever they accept str, and return GroupStrings when any of their
+#operands is one. Use str() to get the characters back, eg before setting a value on an
+#lxml element.
+#
+#The indices are stored in an array.array of the smallest type that holds the size of
+#the domain. Domains of up to 128 characters, which includes the tag, text and attribute
+#domains, are handled as bytes: inverting is a bytes.translate(), removing units is a
+#bytes.rstrip(), and adding is one translate() of the sums, with no Python loop over the
+#characters.
+
+
+
+class _Codec:
+    """Conversion tables of a domain, see _codec()"""
+    def __init__(self, domain):
+        size = domain.size
+        if size <= 0x100:
+            self.typecode = 'B'
+        elif size <= 0x10000:
+            self.typecode = 'H'
+        else:
+            self.typecode = 'I'
+        #the sum of two indices must fit in a byte
+        self.bytewise = size <= 0x80
+
+        if self.typecode == 'B':
+            self.encodetable = str.maketrans(dict([(char, chr(index)) for index, char in enumerate(domain.chars)]))
+            self.decodetable = str.maketrans(dict([(chr(index), char) for index, char in enumerate(domain.chars)]))
+        if self.bytewise:
+            self.sumtable = bytes([index % size for index in range(0x100)])
+            self.inversetable = bytes([(size - index) % size for index in range(size)] + [0] * (0x100 - size))
+
+        #indices of the characters for which str.isspace() is True, see Text.addText()
+        self.whitespace = tuple([domain.index(chr(code)) for code in range(0x3001) if chr(code).isspace() and chr(code) in domain])
+
+
+_codecs = {}
+
+def _codec(domain):
+    try:
+        return _codecs[domain]
+    except KeyError:
+        codec = _Codec(domain)
+        _codecs[domain] = codec
+        return codec
+
+
+
+class GroupString:
+    __slots__ = ('domain', 'indices', '_hash')
+
+    def __init__(self, indices, domain):
+        """indices is an array.array of the type used for the domain, use encode()
+        to build a GroupString from a str."""
+        self.domain = domain
+        self.indices = indices
+        self._hash = None
+
+    def __str__(self):
+        codec = _codec(self.domain)
+        if codec.typecode == 'B':
+            return self.indices.tobytes().decode('latin-1').translate(codec.decodetable)
+        return ''.join(map(self.domain.char, self.indices))
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, str(self))
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        """Return the index of a character, or a GroupString for a slice"""
+        if isinstance(index, slice):
+            return GroupString(self.indices[index], self.domain)
+        return self.indices[index]
+
+    def __eq__(self, other):
+        if isinstance(other, GroupString):
+            return self.domain is other.domain and self.indices == other.indices
+        if isinstance(other, str):
+            return str(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        #equal to the hash of the str, since they compare equal
+        if self._hash is None:
+            self._hash = hash(str(self))
+        return self._hash
+
+    def add(self, other, alignright=False):
+        """Add two strings of the same domain character by character and return the
+        result. The shorter string is padded with units at the end, or at the start if
+        alignright is True. The result is not cleaned, see Domain.addStrings()."""
+        codec = _codec(self.domain)
+        longer, shorter = self.indices, other.indices
+        if len(longer) < len(shorter):
+            longer, shorter = shorter, longer
+        offset = len(longer) - len(shorter) if alignright else 0
+
+        if codec.bytewise:
+            sums = array.array('B', bytes(map(operator.add, longer[offset:offset + len(shorter)], shorter)).translate(codec.sumtable))
+        else:
+            size = self.domain.size
+            sums = array.array(codec.typecode, [(index1 + index2) % size for index1, index2 in zip(longer[offset:offset + len(shorter)], shorter)])
+        return GroupString(longer[:offset] + sums + longer[offset + len(shorter):], self.domain)
+
+    def invert(self):
+        """Invert every character and return the result. The result is not cleaned."""
+        codec = _codec(self.domain)
+        if codec.bytewise:
+            return GroupString(array.array('B', self.indices.tobytes().translate(codec.inversetable)), self.domain)
+        size = self.domain.size
+        return GroupString(array.array(codec.typecode, [(size - index) % size for index in self.indices]), self.domain)
+
+    def rstrip(self, indices=(0,)):
+        """Remove the trailing characters with the given indices, units by default"""
+        codec = _codec(self.domain)
+        if codec.typecode == 'B':
+            return GroupString(array.array('B', self.indices.tobytes().rstrip(bytes(indices))), self.domain)
+        end = len(self.indices)
+        while end > 0 and self.indices[end - 1] in indices:
+            end -= 1
+        return GroupString(self.indices[:end], self.domain)
+
+    def lstrip(self, indices=(0,)):
+        """Remove the leading characters with the given indices, units by default"""
+        codec = _codec(self.domain)
+        if codec.typecode == 'B':
+            return GroupString(array.array('B', self.indices.tobytes().lstrip(bytes(indices))), self.domain)
+        start = 0
+        while start < len(self.indices) and self.indices[start] in indices:
+            start += 1
+        return GroupString(self.indices[start:], self.domain)
+
+    def prepend(self, index):
+        """Return the string with the character at index added at the start"""
+        return GroupString(array.array(self.indices.typecode, [index]) + self.indices, self.domain)
+
+
+
+def encode(string, stringdomain):
+    """Return string as a GroupString of the domain. Raise ValueError if any of its
+    characters is not part of the domain. GroupStrings of the domain are returned
+    unchanged."""
+    domain = Domain.compile(stringdomain)
+    if isinstance(string, GroupString):
+        if string.domain is domain:
+            return string
+        string = str(string)
+
+    codec = _codec(domain)
+    domain.validate(string)
+    if codec.typecode == 'B':
+        return GroupString(array.array('B', string.translate(codec.encodetable).encode('latin-1')), domain)
+    return GroupString(array.array(codec.typecode, [domain.index(char) for char in string]), domain)
+
+
+def whitespace(stringdomain):
+    """Return the indices of the whitespace characters of the domain"""
+    return _codec(Domain.compile(stringdomain)).whitespace
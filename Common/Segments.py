@@ -0,0 +1,252 @@
+"""This file defines the group operations on many strings at once, using numpy."""
+
+import numpy
+
+from . import Text
+from . import Attrib
+
+
+#The functions in String.py, Text.py and Attrib.py work on one string at a time, and
+#every character of every string goes through the Python interpreter. The functions
+#below work on segments instead: all the strings are stored in one array of code points,
+#the heap, and each string is a segment of the heap given by its start and its length.
+#A length of -1 is a missing string, ie None, which lxml uses for missing text and tail.
+#
+#Arithmetic is done on the indices of the characters in a domain (Domain.encodeArray())
+#so adding two segments is one numpy addition modulo the size of the domain, whatever
+#the number and the lengths of the strings. The results are returned as one array of
+#indices and an array of lengths, the segments being stored one after the other.
+#
+#Arrays of lengths are int64 throughout, so they can be used to index any heap.
+
+
+#True for the code points of the characters for which str.isspace() is True, the last
+#one is U+3000. Used to implement str.rstrip() and str.isspace() on segments.
+_whitespace = numpy.array([chr(code).isspace() for code in range(0x3002)], dtype=bool)
+
+
+
+#heaps are stored with the smallest type that holds all their code points, the
+#encoding of the string with the same code units is used to convert them
+_encodings = ((0x100, '<u1', 'latin-1'), (0x10000, '<u2', 'utf-16-le'), (0x110000, '<u4', 'utf-32-le'))
+
+def encode(strings):
+    """Store a list of strings, which may contain None, in a heap. Return the heap,
+    the starts and the lengths of the strings."""
+    lengths = numpy.array([-1 if string is None else len(string) for string in strings], dtype=numpy.int64)
+    joined = ''.join([string for string in strings if string is not None])
+    if joined.isascii():
+        largest = 0
+    else:
+        largest = ord(max(joined))
+    for limit, dtype, encoding in _encodings:
+        if largest < limit:
+            break
+    heap = numpy.frombuffer(joined.encode(encoding), dtype=dtype)
+    return heap, starts(lengths), lengths
+
+
+def decode(heap):
+    """Return the heap as one string, segments of the heap are slices of that string"""
+    heap = compact(heap)
+    for limit, dtype, encoding in _encodings:
+        if heap.dtype == numpy.dtype(dtype):
+            return heap.tobytes().decode(encoding)
+
+
+def compact(heap):
+    """Return the heap stored with the smallest type that holds all its code points"""
+    heap = numpy.asarray(heap)
+    largest = int(heap.max()) if len(heap) else 0
+    for limit, dtype, encoding in _encodings:
+        if largest < limit:
+            return heap.astype(dtype, copy=False)
+
+
+def split(codes, lengths):
+    """Return segments stored one after the other as a list of strings, which may
+    contain None"""
+    joined = decode(codes)
+    result = []
+    start = 0
+    for length in numpy.asarray(lengths).tolist():
+        if length < 0:
+            result.append(None)
+        else:
+            result.append(joined[start:start + length])
+            start += length
+    return result
+
+
+def starts(lengths):
+    """Return the starts of segments stored one after the other"""
+    lengths = numpy.maximum(lengths, 0)
+    result = numpy.zeros(len(lengths), dtype=numpy.int64)
+    numpy.cumsum(lengths[:-1], out=result[1:])
+    return result
+
+
+def positions(lengths):
+    """Return, for every character of segments stored one after the other, the number
+    of its segment and its position within the segment"""
+    lengths = numpy.maximum(lengths, 0)
+    segment = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    position = numpy.arange(len(segment), dtype=numpy.int64) - numpy.repeat(starts(lengths), lengths)
+    return segment, position
+
+
+def _spread(lengths, segmentstarts):
+    """Return the index in the heap of every character of the segments given by the
+    starts and lengths, the segments being stored one after the other"""
+    lengths = numpy.maximum(lengths, 0)
+    result = numpy.repeat(numpy.asarray(segmentstarts, dtype=numpy.int64) - starts(lengths), lengths)
+    result += numpy.arange(len(result), dtype=numpy.int64)
+    return result
+
+
+def gather(heap, segmentstarts, lengths):
+    """Return the segments of the heap given by the starts and lengths, stored one
+    after the other. Missing strings are empty."""
+    return heap[_spread(lengths, segmentstarts)]
+
+
+def select(values, lengths, mask):
+    """Return the values and the lengths of the segments for which mask is True"""
+    lengths = numpy.asarray(lengths)
+    return gather(values, starts(lengths)[mask], lengths[mask]), lengths[mask]
+
+
+def join(parts):
+    """Store segments from several arrays in one heap. parts is a list of (values, lengths)
+    pairs, return the heap and the list of the starts of the segments of every part."""
+    heap = compact(numpy.concatenate([values for values, lengths in parts])) if parts else numpy.zeros(0, dtype=numpy.uint8)
+    offset = 0
+    result = []
+    for values, lengths in parts:
+        result.append(starts(lengths) + offset)
+        offset += len(values)
+    return heap, result
+
+
+def isWhitespace(codes):
+    """Return True for every code point that is whitespace, see str.isspace()"""
+    #code points past the table are looked up as its last entry, which is False
+    codes = numpy.asarray(codes)
+    if numpy.iinfo(codes.dtype).max >= len(_whitespace):
+        codes = numpy.minimum(codes, len(_whitespace) - 1)
+    return _whitespace[codes]
+
+
+def isBlank(codes, lengths):
+    """Return True for every segment that is missing, empty or whitespace only"""
+    #number of characters that are not whitespace before every position
+    counts = numpy.zeros(len(codes) + 1, dtype=numpy.int64)
+    numpy.cumsum(~isWhitespace(codes), out=counts[1:])
+    segmentstarts = starts(lengths)
+    return counts[segmentstarts + numpy.maximum(lengths, 0)] == counts[segmentstarts]
+
+
+def add(domain, indices1, lengths1, indices2, lengths2):
+    """Add segments of indices character by character, the shorter one of each pair
+    padded at the end with units, see Domain.addStrings(). Missing segments are empty.
+    Return the indices and the lengths of the sums."""
+    lengths1 = numpy.maximum(lengths1, 0)
+    lengths2 = numpy.maximum(lengths2, 0)
+    dtype = numpy.result_type(indices1, indices2)
+    if numpy.array_equal(lengths1, lengths2):
+        lengths = lengths1
+        result = numpy.add(indices1, indices2, dtype=dtype)
+    else:
+        #the unit has index 0, so padding is simply not adding anything
+        lengths = numpy.maximum(lengths1, lengths2)
+        resultstarts = starts(lengths)
+        result = numpy.zeros(int(lengths.sum()), dtype=dtype)
+        result[_spread(lengths1, resultstarts)] = indices1
+        result[_spread(lengths2, resultstarts)] += indices2
+    numpy.subtract(result, domain.size, out=result, where=result >= domain.size)
+    return result, lengths
+
+
+def invert(domain, indices):
+    """Invert every index in the domain"""
+    indices = numpy.asarray(indices)
+    return numpy.where(indices == 0, 0, domain.size - indices).astype(indices.dtype, copy=False)
+
+
+def rstrip(values, lengths, strip):
+    """Remove the trailing characters of every segment for which strip is True, see
+    str.rstrip(). Missing segments stay missing. Return the values and the lengths of
+    the stripped segments."""
+    lengths = numpy.asarray(lengths)
+    positivelengths = numpy.maximum(lengths, 0)
+    segmentstarts = starts(positivelengths)
+
+    #the length of a stripped segment is one past its last character that is kept
+    last = numpy.full(len(lengths), -1, dtype=numpy.int64)
+    nonempty = positivelengths > 0
+    if nonempty.any():
+        kept = numpy.where(strip, -1, numpy.arange(len(values), dtype=numpy.int64))
+        last[nonempty] = numpy.maximum.reduceat(kept, segmentstarts[nonempty])
+    newlengths = numpy.where(last >= 0, last - segmentstarts + 1, 0)
+    newlengths[lengths < 0] = -1
+    if numpy.array_equal(newlengths, lengths):
+        return values, newlengths
+
+    #the characters kept are those between the start of every segment and its new end
+    bounds = (numpy.bincount(segmentstarts, minlength=len(values) + 1) -
+              numpy.bincount(segmentstarts + numpy.maximum(newlengths, 0), minlength=len(values) + 1))
+    return values[numpy.cumsum(bounds[:-1]) > 0], newlengths
+
+
+
+#The functions below are the operations of Text.py and Attrib.py on segments of code
+#points. They give the same results as calling the string functions on every segment.
+
+def _encodeText(codes):
+    """Return the indices of text code points, newlines are units, see Text.py"""
+    codes = numpy.where(numpy.asarray(codes) == ord('\n'), ord(Text._domain.unit), codes)
+    return Text._domain.encodeArray(codes)
+
+
+def addText(codes1, lengths1, codes2, lengths2):
+    """Text.addText() on segments"""
+    domain = Text._domain
+    indices, lengths = add(domain, _encodeText(codes1), lengths1, _encodeText(codes2), lengths2)
+    indices, lengths = rstrip(indices, lengths, indices == 0)
+    codes = domain.decodeArray(indices)
+    codes, lengths = rstrip(codes, lengths, isWhitespace(codes))
+    lengths[(numpy.asarray(lengths1) < 0) & (numpy.asarray(lengths2) < 0)] = -1
+    return codes, lengths
+
+
+def textInverse(codes, lengths):
+    """Text.textInverse() on segments"""
+    domain = Text._domain
+    indices = invert(domain, _encodeText(codes))
+    indices, lengths = rstrip(indices, lengths, indices == 0)
+    return domain.decodeArray(indices), lengths
+
+
+def addValues(codes1, lengths1, codes2, lengths2):
+    """String._addstrings() on segments of attribute values"""
+    domain = Attrib._domain
+    indices, lengths = add(domain, domain.encodeArray(codes1), lengths1, domain.encodeArray(codes2), lengths2)
+    indices, lengths = rstrip(indices, lengths, indices == 0)
+    return domain.decodeArray(indices), lengths
+
+
+def valueInverse(codes, lengths):
+    """String._stringinverse() on segments of attribute values"""
+    domain = Attrib._domain
+    indices = invert(domain, domain.encodeArray(codes))
+    indices, lengths = rstrip(indices, lengths, indices == 0)
+    return domain.decodeArray(indices), lengths
+
+
+def isUnitValue(codes, lengths):
+    """Return True for every attribute value that Attrib.cleanKeys() deletes"""
+    lengths = numpy.asarray(lengths)
+    single = numpy.nonzero(lengths == 1)[0]
+    result = lengths <= 0
+    result[single] = numpy.asarray(codes)[starts(lengths)[single]] == ord(Attrib._domain.unit)
+    return result
@@ -1,4 +1,5 @@
-import logging
+from . import Domain
+from . import GroupString
 
 #strings form a group by considering each character in the strings to be a
 #member of the cyclic group defined by the stringdomain list, which should be passed. We form
@@ -9,6 +10,13 @@ import logging
 
 #the unit of the group is the first element in the domain, ie stringdomain[0]
 
+#stringdomain can be a list or a Domain object. Lists are compiled into Domain
+#objects on first use, see Domain.py. Callers that use the same domain over and
+#over (Tag, Text, Attrib) should pass their Domain object directly.
+
+#strings can also be GroupStrings, see GroupString.py. If either operand is a 
+#GroupString the arithmetic is done on the indices and a GroupString is returned.
+
 
 def equal(string1, string2, stringdomain):
     if cleanstring(string1, stringdomain) == cleanstring(string2, stringdomain):
@@ -20,83 +28,44 @@ def equal(string1, string2, stringdomain):
 def _addstrings(string1, string2, stringdomain):
     """Add two strings and return the result. The addition must be the operation 
     used by a cyclic group over the stringdomain"""
-    log = logging.getLogger()
     
     #why do this? empty strings can be viewed as unit strings, consistent 
     #with the treatment below. 
 #    if string1 == '' or string2 == '':
 #        return False
     
-    #first make them the same length
-    if len(string1) == len(string2):
-        pass
-    elif len(string1) > len(string2):
-        for i in range(0, len(string1) - len(string2)): string2 += stringdomain[0]
-    elif len(string1) < len(string2):
-        for i in range(0, len(string2) - len(string1)): string1 += stringdomain[0]
-                
-    #then iterate over the characters in string1
-    result = ''
-    for index, char in enumerate(string1):
-        result += _addchars(string1[index], string2[index], stringdomain)
-        
-    result = cleanstring(result, stringdomain)
-#    log.debug('result: %s' % result)
-    #add the corresponding character in string 2
-    return result
+    #the domain pads the shorter string with units and adds the strings 
+    #character by character
+    domain = Domain.compile(stringdomain)
+    if isinstance(string1, GroupString.GroupString) or isinstance(string2, GroupString.GroupString):
+        return GroupString.encode(string1, domain).add(GroupString.encode(string2, domain)).rstrip()
+    return domain.clean(domain.addStrings(string1, string2))
 
 
 
 def _addchars(char1, char2, stringdomain):
     """Add two characters, treating them as a elements of a cyclic group 
     defined by the stringdomain list"""
-    try:
-        index1 = stringdomain.index(char1)
-    except ValueError:
-        log = logging.getLogger()
-        log.error('%s not found in stringdomain' % char1)
-        raise
-    
-    try:
-        index2 = stringdomain.index(char2)
-    except ValueError:
-        log = logging.getLogger()
-        log.error('%s not found in stringdomain' % char2)
-        raise
-    
-    newchar = stringdomain[(index1 + index2) % len(stringdomain)]
-    return newchar
+    return Domain.compile(stringdomain).addChars(char1, char2)
     
 
 def _stringinverse(string1, stringdomain):
     """Return the inverse of the string"""
-    result = ''
-    for i in string1:
-        result += _characterinverse(i, stringdomain)
-
-    result = cleanstring(result, stringdomain)
-    
-    return result
+    domain = Domain.compile(stringdomain)
+    if isinstance(string1, GroupString.GroupString):
+        return GroupString.encode(string1, domain).invert().rstrip()
+    return domain.clean(domain.invertString(string1))
 
 
 def _characterinverse(char1, stringdomain):
     """Return the inverse of the character"""
-    
-    try:
-        index = stringdomain.index(char1)
-    except ValueError:
-        log = logging.getLogger()
-        log.error('character "%s" not found in string domain' % char1)
-        raise
-    return stringdomain[(len(stringdomain) - index) % len(stringdomain)]
+    return Domain.compile(stringdomain).invertChar(char1)
     
 
 
 
 def cleanstring(string1, stringdomain):
-    result = string1[:]
-    while result.endswith(stringdomain[0]) and len(result) > 0:
-        result = result[:-1]
-    return result
+    if isinstance(string1, GroupString.GroupString):
+        return GroupString.encode(string1, stringdomain).rstrip()
+    return string1.rstrip(stringdomain[0])
     
-    
\ No newline at end of file
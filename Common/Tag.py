@@ -1,4 +1,7 @@
 from . import String
+from . import Domain
+from . import GroupString
+from . import Cache
 
 
 #tags form a group by considering each character in the tags to be a
@@ -21,6 +24,13 @@ from . import String
 #everything, therefore we must exclude numbers from the domain. 
 tagdomain = ['_'] + [i for i in map(chr, range(97, 123))] + ['-'] + [i for i in map(chr, range(48, 58))] + [i for i in map(chr, range(65, 91))]
 
+#compiled once, see Domain.py
+_domain = Domain.Domain(tagdomain)
+
+#characters that cannot start a tag name, see _cleantag()
+_invalidstart = frozenset(['-'] + [i for i in map(chr, range(48, 58))])
+_invalidstartindices = frozenset([_domain.index(i) for i in _invalidstart])
+
 
 #2011-09-15: inconsistent arithmetic appeared, and I should have caught it before. 
 #lxml does not allow '-' as a tag name, '-' must be preceded by some other character to be 
@@ -49,6 +59,7 @@ def equal(tag1, tag2):
         return False
 
 
+@Cache.cached('Tag.addTags')
 def addTags(tag1, tag2):
     """Add two tags and return the result. The addition must be the operation 
     used by a cyclic group over the tagdomain"""
@@ -56,23 +67,25 @@ def addTags(tag1, tag2):
     
     log = logging.getLogger()
     
+    if isinstance(tag1, GroupString.GroupString) or isinstance(tag2, GroupString.GroupString):
+        tag1 = GroupString.encode(tag1, _domain)
+        tag2 = GroupString.encode(tag2, _domain)
+        if len(tag1) == 0 or len(tag2) == 0:
+            return False
+        return _cleantag(tag1.add(tag2, alignright=True))
+
     if tag1 == '' or tag2 == '':
         return False
     
-    #first make them the same length
-    if len(tag1) == len(tag2):
-        pass
-    elif len(tag1) > len(tag2):
-        for i in range(0, len(tag1) - len(tag2)): 
-            tag2 = ''.join((tagdomain[0], tag2))
-    elif len(tag1) < len(tag2):
-        for i in range(0, len(tag2) - len(tag1)): 
-            tag1 = ''.join((tagdomain[0], tag1))
+    #first make them the same length. Tags are added starting at the end, 
+    #so they are padded with leading units. 
+    if len(tag1) < len(tag2):
+        tag1 = tag1.rjust(len(tag2), _domain.unit)
+    elif len(tag2) < len(tag1):
+        tag2 = tag2.rjust(len(tag1), _domain.unit)
                 
-    #then iterate over the characters in tag1
-    result = ''
-    for index, char in enumerate(tag1):
-        result += String._addchars(tag1[index], tag2[index], tagdomain)
+    #then add the characters
+    result = _domain.addStrings(tag1, tag2)
         
     result = _cleantag(result)
 #    log.debug('result: %s' % result)
@@ -83,12 +96,13 @@ def addTags(tag1, tag2):
 
 
  
+@Cache.cached('Tag.tagInverse')
 def tagInverse(tag1):
     """Return the inverse of the tag"""
      
-    result = String._stringinverse(tag1, tagdomain)
+    result = String._stringinverse(tag1, _domain)
     #no empty tags allowed as explained above, lxml does not allow it. 
-    if result == '': result = tagdomain[0]
+    if len(result) == 0: result = result.prepend(0) if isinstance(result, GroupString.GroupString) else tagdomain[0]
     
     return _cleantag(result)
     
@@ -96,13 +110,21 @@ def tagInverse(tag1):
 
 
 def _cleantag(tag1):
-    result = tag1[:]
-    while result.startswith(tagdomain[0]) and len(result) > 1:
-        result = result[1:]
+    #remove leading units, but leave at least one character in the tag
+    if isinstance(tag1, GroupString.GroupString):
+        result = tag1.lstrip()
+        if len(result) == 0:
+            result = tag1[-1:]
+        if result[0] in _invalidstartindices:
+            result = result.prepend(0)
+        return result
+
+    result = tag1.lstrip(_domain.unit)
+    if result == '':
+        result = tag1[-1:]
     
-    if (result.startswith('-')) or (result[0] in [i for i in map(chr, range(48, 58))]):
+    if result[0] in _invalidstart:
         result = ''.join(('_', result))
         
     return result
     
-    
\ No newline at end of file
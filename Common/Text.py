@@ -1,6 +1,8 @@
 import logging
 
 from . import String
+from . import Domain
+from . import GroupString
 
 
 #text strings form a group by considering each character in the string to be a
@@ -22,20 +24,38 @@ from . import String
 
 textdomain = [' '] + ['\t', '‘', '’', '“', '”'] + [i for i in map(chr, range(33, 127))] #[i for i in map(chr, range(97, 123))] + ['-', '_'] + [i for i in map(chr, range(65, 91))]
 
+#compiled once, see Domain.py
+_domain = Domain.Domain(textdomain)
+
+#every character allowed in XML text, for documents with characters that are not in
+#textdomain, see Domain.ArithmeticDomain and setDomain(). Newlines are units, as above, 
+#and XML parsers turn carriage returns into newlines, so both are left out.
+xmltextdomain = Domain.ArithmeticDomain(' ', exclude='\n\r')
+
+
+def setDomain(domain):
+    """Use domain, a list or a Domain object, for all text operations. The unit of the
+    domain must be ' '."""
+    global _domain
+    domain = Domain.compile(domain)
+    if domain.unit != ' ':
+        raise ValueError('the unit of the text domain must be " ", not "%s"' % domain.unit)
+    _domain = domain
+
 
 def isUnitText(text):
-    if text == textdomain[0]:
+    if text == _domain.unit:
         return True
     else:
         return False
     
     
 def getTextDomain():
-    return textdomain
+    return _domain
 
 
 def equal(text1, text2):
-    return String.equal(text1.replace('\n', ''), text2.replace('/n', ''), textdomain)
+    return String.equal(text1.replace('\n', ''), text2.replace('/n', ''), _domain)
 
 
 def addText(text1, text2):
@@ -47,30 +67,19 @@ def addText(text1, text2):
         text1 = ''
     if text2 is None: 
         text2 = ''
+
+    if isinstance(text1, GroupString.GroupString) or isinstance(text2, GroupString.GroupString):
+        result = _encode(text1).add(_encode(text2)).rstrip()
+        return result.rstrip(GroupString.whitespace(_domain))
     
     #whitespace is sometimes significantWe don't want to remove whitespace, 
     #it is significant in some contexts in some documentation
 #    text1 = text1.rstrip()
 #    text2 = text2.rstrip()
     
-    #first make them the same length
-    if len(text1) == len(text2):
-        pass
-    elif len(text1) > len(text2):
-        for i in range(0, len(text1) - len(text2)): text2 += textdomain[0]
-    elif len(text1) < len(text2):
-        for i in range(0, len(text2) - len(text1)): text1 += textdomain[0]
-                
-    #then iterate over the characters in text1
-    result = ''
-    for index, char1 in enumerate(text1):
-        if char1 == '\n':
-            char1 = textdomain[0]
-        char2 = text2[index]
-        if char2 == '\n':
-            char2 = textdomain[0]
-            
-        result += String._addchars(char1, char2, textdomain)
+    #newlines are treated as units, see above. The domain pads the shorter 
+    #string with units and adds the strings character by character
+    result = _domain.addStrings(text1.replace('\n', _domain.unit), text2.replace('\n', _domain.unit))
         
     result = _cleantext(result)
         
@@ -88,8 +97,12 @@ def textInverse(text1):
     if text1 is None: 
         return None
     
+    #an empty GroupString inverts to an empty one, as '' does below
+    if isinstance(text1, GroupString.GroupString):
+        return _encode(text1).invert().rstrip()
+
     if text1 == '':
-        text1 = textdomain[0]
+        text1 = _domain.unit
 
 #    log.debug('inverting: "%s"' % text1)
 
@@ -98,14 +111,7 @@ def textInverse(text1):
 #    text1 = text1.rstrip()
 #    log.debug('rstrip: "%s"' % text1)
     
-    result = ''
-    for i in text1:
-        if i == '\n':
-            result += textdomain[0]
-        else:
-            result += String._characterinverse(i, textdomain)
-#        log.debug('"%s"' % result)
-#        log.debug('"%s"' % text1)
+    result = _domain.invertString(text1.replace('\n', _domain.unit))
         
     result = _cleantext(result)
 #    log.debug('result: "%s"' % result)
@@ -114,5 +120,11 @@ def textInverse(text1):
 
 
 def _cleantext(text1):
-    return String.cleanstring(text1, textdomain)
-    
\ No newline at end of file
+    return String.cleanstring(text1, _domain)
+
+
+def _encode(text1):
+    """Return the text as a GroupString, newlines are units, see above"""
+    if isinstance(text1, str):
+        text1 = text1.replace('\n', _domain.unit)
+    return GroupString.encode(text1, _domain)
@@ -0,0 +1,99 @@
+import unittest, os.path, sys, logging
+
+from . import Cache
+from . import GroupString
+from . import Tag
+from . import Attrib
+
+
+
+
+class testLRUCache(unittest.TestCase):
+    """Test the LRUCache object"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.cache = Cache.LRUCache(2)
+
+    def test_GetPut(self):
+        self.assertEqual(self.cache.get('a'), None)
+        self.cache.put('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hitrate']), (1, 1, 0.5))
+
+    def test_EvictsLeastRecentlyUsed(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertTrue('a' in self.cache)
+        self.assertFalse('b' in self.cache, "least recently used key was not evicted")
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_Resize(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.resize(1)
+        self.assertEqual(len(self.cache), 1)
+        self.assertTrue('b' in self.cache)
+        self.cache.resize(0)
+        self.cache.put('c', 3)
+        self.assertEqual(len(self.cache), 0, "a cache of size 0 stored a result")
+
+    def test_Clear(self):
+        self.cache.put('a', 1)
+        self.cache.get('a')
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.hits, 0)
+
+
+
+class testCached(unittest.TestCase):
+    """Test the caches in front of the tag and attribute functions"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        Cache.clear()
+
+    def tearDown(self):
+        """called after each test function execution"""
+        Cache.resize(Cache.MAXSIZE)
+        Cache.clear()
+
+    def test_AddTags(self):
+        expected = Tag.addTags('abc', 'x-y')
+        result = Tag.addTags('abc', 'x-y')
+        self.assertEqual(result, expected, "addTags returned %s, expected %s" % (result, expected))
+        stats = Cache.stats()['Tag.addTags']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_UnitResultsAreCached(self):
+        self.assertIs(Tag.addTags('', 'a'), False)
+        self.assertIs(Tag.addTags('', 'a'), False)
+        self.assertEqual(Tag.addTags.cache.hits, 1)
+
+    def test_GroupStringsAreNotCached(self):
+        Tag.tagInverse('abc')
+        result = Tag.tagInverse(GroupString.encode('abc', Tag._domain))
+        self.assertTrue(isinstance(result, GroupString.GroupString), "tagInverse returned a cached str for a GroupString")
+        self.assertEqual(Tag.tagInverse.cache.hits, 0)
+
+    def test_AddAttribs(self):
+        expected = {'a': 'bd', 'b': 'x'}
+        for i in range(3):
+            result = Attrib.addAttribs({'a': 'ab', 'b': 'x'}, {'a': 'ab'})
+            self.assertEqual(result, expected, "addAttribs returned %s, expected %s" % (result, expected))
+        self.assertEqual(Cache.stats()['Attrib.addValues']['hits'], 2)
+
+    def test_Disabled(self):
+        Cache.resize(0)
+        Tag.addTags('abc', 'x-y')
+        Tag.addTags('abc', 'x-y')
+        self.assertEqual(Tag.addTags.cache.hits, 0)
+        self.assertEqual(len(Tag.addTags.cache), 0)
+
+    def test_NotInDomain_ShouldFail(self):
+        self.assertRaises(ValueError, Tag.addTags, 'abc', 'a.b')
+        self.assertRaises(ValueError, Tag.addTags, 'abc', 'a.b')
@@ -0,0 +1,119 @@
+import unittest, os.path, sys, logging
+
+from . import Domain
+from . import Tag
+from . import Text
+
+
+
+
+class testDomain(unittest.TestCase):
+    """Test the Domain object"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.chars = ['_', 'a', 'b', 'c']
+        self.domain = Domain.Domain(self.chars)
+
+    def test_BehavesLikeList(self):
+        self.assertEqual(self.domain[0], '_')
+        self.assertEqual(len(self.domain), 4)
+        for index, char in enumerate(self.chars):
+            self.assertEqual(self.domain.index(char), index, "index() returned %i, expected %i" % (self.domain.index(char), index))
+
+    def test_AddChars_ShouldCycle(self):
+        result = self.domain.addChars('c', 'b')
+        self.assertEqual(result, 'a', "addChars returned %s, expected %s" % (result, 'a'))
+
+    def test_AddStrings_Padded(self):
+        result = self.domain.addStrings('abc', 'a')
+        self.assertEqual(result, 'bbc', "addStrings returned %s, expected %s" % (result, 'bbc'))
+
+    def test_InvertString(self):
+        result = self.domain.invertString('abc_')
+        self.assertEqual(result, 'cba_', "invertString returned %s, expected %s" % (result, 'cba_'))
+
+    def test_InverseAddition(self):
+        string = 'cabbac'
+        result = self.domain.clean(self.domain.addStrings(string, self.domain.invertString(string)))
+        self.assertEqual(result, '', "string plus its inverse returned %s, expected ''" % result)
+
+    def test_NotInDomain_ShouldFail(self):
+        self.assertRaises(ValueError, self.domain.index, 'd')
+        self.assertRaises(ValueError, self.domain.addStrings, 'ab', 'ad')
+        self.assertRaises(ValueError, self.domain.invertString, 'abd')
+
+    def test_Compile(self):
+        self.assertIs(Domain.compile(self.chars), Domain.compile(list(self.chars)))
+        self.assertIs(Domain.compile(self.domain), self.domain)
+
+    def test_MatchesListArithmetic(self):
+        #the compiled domains must give the same results as indexing the domain lists
+        for domainlist in (Tag.tagdomain, Text.textdomain):
+            domain = Domain.compile(domainlist)
+            for char1 in domainlist:
+                for char2 in domainlist[::7]:
+                    expected = domainlist[(domainlist.index(char1) + domainlist.index(char2)) % len(domainlist)]
+                    self.assertEqual(domain.addChars(char1, char2), expected)
+                expected = domainlist[(len(domainlist) - domainlist.index(char1)) % len(domainlist)]
+                self.assertEqual(domain.invertChar(char1), expected)
+
+    def test_EncodeArray(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        codes = numpy.array([ord(char) for char in 'cab_'])
+        indices = self.domain.encodeArray(codes)
+        self.assertEqual(indices.tolist(), [3, 1, 2, 0])
+        self.assertEqual(self.domain.decodeArray(indices).tolist(), codes.tolist())
+        self.assertRaises(ValueError, self.domain.encodeArray, numpy.array([ord('d'), 0x4e2d]))
+
+
+
+class testArithmeticDomain(unittest.TestCase):
+    """Test the ArithmeticDomain object"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.domain = Domain.ArithmeticDomain(' ', exclude='\n\r')
+        self.strings = ['café', 'été — 漢字', '😀 \t', 'ascii', '']
+
+    def test_UnitIsIndexZero(self):
+        self.assertEqual(self.domain.index(' '), 0)
+        self.assertEqual(self.domain[0], ' ')
+        self.assertEqual(self.domain.char(self.domain.size), ' ', "char() does not cycle")
+
+    def test_IndexChar(self):
+        for index in list(range(100)) + [0xD7FF, 0xE000, 0x10000, self.domain.size - 1]:
+            char = self.domain.char(index)
+            self.assertEqual(self.domain.index(char), index, "index(char(%i)) returned %i" % (index, self.domain.index(char)))
+
+    def test_InverseAddition(self):
+        for string in self.strings:
+            result = self.domain.clean(self.domain.addStrings(string, self.domain.invertString(string)))
+            self.assertEqual(result, '', "string plus its inverse returned %s, expected ''" % result)
+
+    def test_AddStrings(self):
+        for string1 in self.strings:
+            for string2 in self.strings:
+                result = self.domain.addStrings(string1, string2)
+                expected = ''.join([self.domain.addChars(char1, char2) for char1, char2 in zip(string1.ljust(len(result)), string2.ljust(len(result)))])
+                self.assertEqual(result, expected, "addStrings returned %s, expected %s" % (result, expected))
+
+    def test_NotInDomain_ShouldFail(self):
+        for char in ('\n', '\r', '\x00', '\ud800', '￿'):
+            self.assertRaises(ValueError, self.domain.index, char)
+            self.assertRaises(ValueError, self.domain.addStrings, 'ab', 'a' + char)
+
+    def test_EncodeArray(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        string = ''.join(self.strings)
+        codes = numpy.array([ord(char) for char in string])
+        indices = self.domain.encodeArray(codes)
+        self.assertEqual(indices.tolist(), [self.domain.index(char) for char in string])
+        self.assertEqual(self.domain.decodeArray(indices).tolist(), codes.tolist())
+        self.assertRaises(ValueError, self.domain.encodeArray, numpy.array([ord('a'), ord('\n')]))
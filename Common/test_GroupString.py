@@ -0,0 +1,93 @@
+import unittest, os.path, sys, logging
+
+from . import GroupString
+from . import Domain
+from . import String
+from . import Tag
+from . import Text
+from . import Attrib
+
+
+
+
+class testGroupString(unittest.TestCase):
+    """Test GroupStrings against the str operations"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.tags = ['a', 'abc', '_b', 'a-b', 'Zz9', '-a', '9', '__', 'xyz-']
+        self.texts = ['', ' ', 'text', 'two words ', '\ta\n', '~!', 'q\n ', '“quoted”']
+        self.values = ['', '_', 'a', 'value', 'a_', '\\', 'Ab9 ', '_x_']
+
+    def test_EncodeDecode(self):
+        for string in self.values:
+            result = str(GroupString.encode(string, Attrib._domain))
+            self.assertEqual(result, string, "str(encode()) returned %s, expected %s" % (result, string))
+
+    def test_EqualAndHash(self):
+        string1 = GroupString.encode('abc', Tag._domain)
+        string2 = GroupString.encode('abc', Tag._domain)
+        self.assertEqual(string1, string2)
+        self.assertEqual(string1, 'abc')
+        self.assertNotEqual(string1, GroupString.encode('abd', Tag._domain))
+        self.assertEqual(hash(string1), hash('abc'))
+        self.assertEqual(len(set([string1, string2, 'abc'])), 1)
+
+    def test_AddTags(self):
+        for tag1 in self.tags:
+            for tag2 in self.tags:
+                expected = Tag.addTags(tag1, tag2)
+                result = Tag.addTags(GroupString.encode(tag1, Tag._domain), tag2)
+                self.assertEqual(str(result), expected, "addTags returned %s, expected %s" % (result, expected))
+
+    def test_TagInverse(self):
+        for tag in self.tags:
+            expected = Tag.tagInverse(tag)
+            result = Tag.tagInverse(GroupString.encode(tag, Tag._domain))
+            self.assertEqual(str(result), expected, "tagInverse returned %s, expected %s" % (result, expected))
+
+    def test_ChainedTags(self):
+        expected = Tag.addTags('xyz', Tag.tagInverse(Tag.addTags('a-b', 'Zz9')))
+        result = Tag.addTags(GroupString.encode('xyz', Tag._domain), Tag.tagInverse(Tag.addTags(GroupString.encode('a-b', Tag._domain), 'Zz9')))
+        self.assertTrue(isinstance(result, GroupString.GroupString))
+        self.assertEqual(str(result), expected, "chained tag operations returned %s, expected %s" % (result, expected))
+
+    def test_AddText(self):
+        for text1 in self.texts + [None]:
+            for text2 in self.texts:
+                expected = Text.addText(text1, text2)
+                result = Text.addText(text1, GroupString.encode(text2.replace('\n', ' '), Text._domain))
+                self.assertEqual(str(result), expected, "addText returned %s, expected %s" % (result, expected))
+
+    def test_TextInverse(self):
+        for text in self.texts:
+            expected = Text.textInverse(text)
+            result = Text.textInverse(GroupString.encode(text.replace('\n', ' '), Text._domain))
+            self.assertEqual(str(result), expected, "textInverse returned %s, expected %s" % (result, expected))
+
+    def test_AddAttribs(self):
+        attrib1 = {'a': 'value', 'b': 'a_', 'c': '_x_'}
+        attrib2 = {'a': GroupString.encode('Ab9 ', Attrib._domain), 'c': GroupString.encode('_', Attrib._domain), 'd': 'a'}
+        expected = Attrib.addAttribs(attrib1, dict([(key, str(value)) for key, value in attrib2.items()]))
+        result = dict([(key, str(value)) for key, value in Attrib.addAttribs(attrib1, attrib2).items()])
+        self.assertEqual(result, expected, "addAttribs returned %s, expected %s" % (result, expected))
+
+    def test_AttribInverse(self):
+        for value in self.values:
+            expected = String._stringinverse(value, Attrib._domain)
+            result = String._stringinverse(GroupString.encode(value, Attrib._domain), Attrib._domain)
+            self.assertEqual(str(result), expected, "_stringinverse returned %s, expected %s" % (result, expected))
+
+    def test_LargeDomain(self):
+        domain = Domain.Domain([chr(code) for code in range(32, 1032)])
+        string1 = GroupString.encode('abcЀ', domain)
+        self.assertEqual(string1.indices.typecode, 'H')
+        expected = String._addstrings('abcЀ', 'ϧ x', domain)
+        result = String._addstrings(string1, 'ϧ x', domain)
+        self.assertEqual(str(result), expected, "_addstrings returned %s, expected %s" % (result, expected))
+        result = String._addstrings(result, String._stringinverse(GroupString.encode('ϧ x', domain), domain), domain)
+        self.assertEqual(result, 'abcЀ', "_addstrings returned %s, expected %s" % (result, 'abcЀ'))
+
+    def test_NotInDomain_ShouldFail(self):
+        self.assertRaises(ValueError, GroupString.encode, 'café', Text._domain)
+        self.assertRaises(ValueError, Tag.addTags, GroupString.encode('abc', Tag._domain), 'a.b')
@@ -0,0 +1,65 @@
+import unittest, os.path, sys, logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from . import Segments
+from . import String
+from . import Text
+from . import Attrib
+
+
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class testSegments(unittest.TestCase):
+    """Test the Segments functions against the string functions"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.texts1 = [None, '', ' ', 'Audience', 'two\nlines ', '\t', 'a “quote”', None, 'x']
+        self.texts2 = [None, None, 'b', 'Audience', 'lines', ' ~', 'other', 'z  ', '']
+        self.values1 = ['a', '_', '', 'abc', 'x_y', '9', '__']
+        self.values2 = ['a', 'b', 'c', 'abc_', 'y', 'A B', 'z']
+
+    def segments(self, strings):
+        heap, starts, lengths = Segments.encode(strings)
+        return Segments.gather(heap, starts, lengths), lengths
+
+    def test_EncodeDecode(self):
+        heap, starts, lengths = Segments.encode(self.texts1 + ['café', '中\U0001f600'])
+        result = Segments.split(Segments.gather(heap, starts, lengths), lengths)
+        self.assertEqual(Segments.split(heap, lengths), result)
+        self.assertEqual(result, self.texts1 + ['café', '中\U0001f600'])
+        self.assertEqual(Segments.compact(heap).dtype, numpy.dtype('uint32'))
+
+    def test_AddText(self):
+        result = Segments.split(*Segments.addText(*(self.segments(self.texts1) + self.segments(self.texts2))))
+        expected = [Text.addText(text1, text2) for text1, text2 in zip(self.texts1, self.texts2)]
+        self.assertEqual(result, expected, "addText returned %s, expected %s" % (result, expected))
+
+    def test_TextInverse(self):
+        result = Segments.split(*Segments.textInverse(*self.segments(self.texts1)))
+        expected = [Text.textInverse(text) for text in self.texts1]
+        self.assertEqual(result, expected, "textInverse returned %s, expected %s" % (result, expected))
+
+    def test_AddValues(self):
+        result = Segments.split(*Segments.addValues(*(self.segments(self.values1) + self.segments(self.values2))))
+        expected = [String._addstrings(value1, value2, Attrib._domain) for value1, value2 in zip(self.values1, self.values2)]
+        self.assertEqual(result, expected, "addValues returned %s, expected %s" % (result, expected))
+
+    def test_ValueInverse(self):
+        result = Segments.split(*Segments.valueInverse(*self.segments(self.values1)))
+        expected = [String._stringinverse(value, Attrib._domain) for value in self.values1]
+        self.assertEqual(result, expected, "valueInverse returned %s, expected %s" % (result, expected))
+
+    def test_IsBlank(self):
+        result = Segments.isBlank(*self.segments(self.texts1)).tolist()
+        expected = [text is None or text.strip() == '' for text in self.texts1]
+        self.assertEqual(result, expected, "isBlank returned %s, expected %s" % (result, expected))
+
+    def test_NotInDomain_ShouldFail(self):
+        self.assertRaises(ValueError, Segments.textInverse, *self.segments(['café']))
@@ -60,4 +60,27 @@ class testtextInverse(unittest.TestCase):
         expected = ' ' #equivalent to ''
         
         result = Text.textInverse(c)
-        self.assertTrue(Text.equal(c, result), 'textInverse returned "%s", expected "%s"' % (result, expected))
\ No newline at end of file
+        self.assertTrue(Text.equal(c, result), 'textInverse returned "%s", expected "%s"' % (result, expected))
+
+
+
+class testsetDomain(unittest.TestCase):
+    """test the text operations in the XML character domain"""
+
+    def setUp(self):
+        self.domain = Text.getTextDomain()
+        Text.setDomain(Text.xmltextdomain)
+
+    def tearDown(self):
+        Text.setDomain(self.domain)
+
+    def test_WordInverted(self):
+        for word in ("Café crème", "漢字 — 😀", "naïve\nline"):
+            inverted = Text.textInverse(word)
+            expected = ''
+
+            result = Text.addText(word, inverted)
+            self.assertEqual(expected, result, 'addText returned "%s", expected "%s"' % (result, expected))
+
+    def test_WrongUnit_ShouldFail(self):
+        self.assertRaises(ValueError, Text.setDomain, ['_', 'a', ' '])
@@ -0,0 +1,314 @@
+"""This file defines SparseDelta, a tree stored as its non-unit nodes only."""
+
+import lxml.etree
+import logging
+
+from . import Tree
+from . import Element
+from . import Journal
+from . import PositionIndex
+
+import TreeGroup.Common.Tag as Tag
+import TreeGroup.Common.Attrib as Attrib
+import TreeGroup.Common.Text as Text
+
+
+#In the group, a tree can be seen as a node at every position, most of them unit nodes.
+#The difference between two revisions of a document, tree1 - tree2, is mostly unit
+#nodes, yet as an lxml tree it has as many nodes as the documents. A SparseDelta stores
+#only the nodes that are not units, by position, and the unit nodes are implied. Adding
+#trees is done position by position (see Tree.add()), so deltas are added and inverted
+#node by node, and applied to a tree by going straight to the positions they change.
+#All three take time proportional to the number of nodes in the deltas, not to the size
+#of the documents.
+#
+#Positions are tuples in the form used by Element.position() and Tree.getNode(): the
+#first number is 1 for the root, the others are the index of each child + 1. Sorting
+#positions puts them in document order.
+#
+#A node is stored as its (tag, attributes, text, tail), as they would be after adding
+#the node to a unit node, ie with the tag and attributes cleaned and trailing whitespace
+#removed from the text. It is a unit node if its tag is the unit, it has no attributes
+#and its text and tail are missing or only units.
+
+
+
+class SparseDelta:
+    def __init__(self, nodes=None):
+        """nodes is a dictionary of (tag, attributes, text, tail) by position, use
+        fromTree() or difference() to build a delta from trees"""
+        if nodes is None:
+            nodes = {}
+        self.nodes = nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __eq__(self, other):
+        if not isinstance(other, SparseDelta):
+            return NotImplemented
+        return self.nodes == other.nodes
+
+    def __repr__(self):
+        return '%s(%i nodes)' % (type(self).__name__, len(self.nodes))
+
+
+
+#the tag, attributes, text and tail of a unit node
+_unit = ('_', {}, None, None)
+
+
+def _isUnitText(text):
+    return text is None or text.replace('\n', ' ').strip(' ') == ''
+
+
+def _isUnitNode(tag, attrib, text, tail):
+    """Return True if adding a node with this tag, attributes, text and tail to a node
+    does not change it"""
+    if Tag._cleantag(tag) != '_':
+        return False
+    for value in attrib.values():
+        if not (value == '_' or value == ''):
+            return False
+    return _isUnitText(text) and _isUnitText(tail)
+
+
+def _addNodes(node1, node2):
+    """Return the sum of two nodes, see Element.add()"""
+    tag1, attrib1, text1, tail1 = node1
+    tag2, attrib2, text2, tail2 = node2
+    return (Tag.addTags(tag1, tag2),
+            Attrib.addAttribs(attrib1, attrib2),
+            Text.addText(text1, text2),
+            Text.addText(tail1, tail2))
+
+
+def _invertNode(node):
+    """Return the inverse of a node, see Element.invert()"""
+    tag, attrib, text, tail = node
+    return (Tag.tagInverse(tag),
+            Attrib.attribInverse(dict(attrib)),
+            Text.textInverse(text),
+            Text.textInverse(tail))
+
+
+
+def fromTree(tree):
+    """Return the delta with the non-unit nodes of the tree. The tree is walked once."""
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+    Tree.validate(root)
+
+    nodes = {}
+    stack = [(root, (1,))]
+    while stack:
+        element, position = stack.pop()
+        node = _addNodes(_unit, (element.tag, dict(element.attrib), element.text, element.tail))
+        if not _isUnitNode(*node):
+            nodes[position] = node
+        index = 1
+        for child in element:
+            stack.append((child, position + (index,)))
+            index += 1
+    return SparseDelta(nodes)
+
+
+def toTree(delta):
+    """Return the delta as an lxml tree. Unit nodes are added where they are needed to
+    give the nodes of the delta their positions."""
+    root = lxml.etree.Element('_')
+    for position, node in sorted(delta.nodes.items()):
+        _setNode(_reach(root, position, None), node, None)
+    return root
+
+
+def difference(tree1, tree2):
+    """Return tree1 - tree2 as a delta, so that apply(difference(tree1, tree2), tree2)
+    is tree1"""
+    return compose(fromTree(tree1), invert(fromTree(tree2)))
+
+
+def dump_binary(delta, filename):
+    """Write the delta to a file, see Tree.dump_binary(). Only the nodes of the delta
+    are written, so the file is proportional to the size of the delta and not to the
+    size of the documents. This needs numpy."""
+    import numpy
+    import TreeGroup.Packed.PackedTree as PackedTree
+    import TreeGroup.Packed.Binary as Binary
+
+    #the nodes are packed as the children of a unit root, in document order, and their
+    #positions are written after them as one array, with the length of each position
+    root = lxml.etree.Element('_')
+    positions = []
+    lengths = []
+    for position, (tag, attrib, text, tail) in sorted(delta.nodes.items()):
+        element = lxml.etree.SubElement(root, tag, attrib)
+        element.text = text
+        element.tail = tail
+        positions.extend(position)
+        lengths.append(len(position))
+
+    Binary.dump(PackedTree.pack(root), filename, Binary.KIND_DELTA,
+                [('positions', numpy.array(positions, dtype=numpy.int64)),
+                 ('positionlengths', numpy.array(lengths, dtype=numpy.int64))])
+
+
+def load_binary(filename):
+    """Read a delta written by dump_binary(). This needs numpy."""
+    import TreeGroup.Packed.PackedTree as PackedTree
+    import TreeGroup.Packed.Binary as Binary
+
+    packed, kind, extra = Binary.load(filename, ('positions', 'positionlengths'))
+    if kind != Binary.KIND_DELTA:
+        raise ValueError('%s: not a delta' % filename)
+
+    positions = extra['positions'].tolist()
+    nodes = {}
+    start = 0
+    for element, length in zip(PackedTree.unpack(packed), extra['positionlengths'].tolist()):
+        nodes[tuple(positions[start:start + length])] = (element.tag, dict(element.attrib), element.text, element.tail)
+        start += length
+    return SparseDelta(nodes)
+
+
+def compose(delta1, delta2):
+    """Return the sum of two deltas, the delta that applies delta1 then delta2"""
+    #the group is abelian, start from the larger delta
+    if len(delta1.nodes) < len(delta2.nodes):
+        delta1, delta2 = delta2, delta1
+    nodes = dict(delta1.nodes)
+    for position, node2 in delta2.nodes.items():
+        node1 = nodes.get(position)
+        if node1 is None:
+            nodes[position] = node2
+            continue
+        node = _addNodes(node1, node2)
+        if _isUnitNode(*node):
+            del nodes[position]
+        else:
+            nodes[position] = node
+    return SparseDelta(nodes)
+
+
+def invert(delta):
+    """Return the inverse of the delta"""
+    return SparseDelta(dict([(position, _invertNode(node)) for position, node in delta.nodes.items()]))
+
+
+def apply(delta, tree, index=None):
+    """Add the delta to the tree, modify the tree in place and return it.
+
+    Only the nodes at the positions of the delta are visited, and unit nodes are
+    appended where the tree has no node at those positions. Trailing unit nodes left
+    by the changes are pruned, see Tree.add(). fromTree() of the result is the same as
+    fromTree(Tree.add(tree, toTree(delta))), but the nodes the delta does not change
+    are left as they are, where Tree.add() would strip trailing whitespace from their
+    text.
+
+    The results are computed before the tree is modified, so if the delta has
+    characters that are not in their domains ValueError is raised and the tree is left
+    as it was. The changes are recorded in the journal of the current transaction, see
+    Tree.transaction().
+
+    index is an optional PositionIndex of the tree, used to find the nodes of the
+    delta instead of walking down from the root to each of them. It is kept up to
+    date with the changes.
+    """
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+    if (index is not None) and (index.root is not root):
+        raise ValueError('the index is not an index of the tree')
+
+    tags = []
+    texts = []
+    values = []
+    for tag, attrib, text, tail in delta.nodes.values():
+        tags.append(tag)
+        texts.extend([text or '', tail or ''])
+        values.extend(attrib.values())
+    Tree._validateStrings(tags, texts, values)
+
+    #the sums are computed first, positions that are missing from the tree are added
+    #to unit nodes
+    positions = sorted(delta.nodes)
+    if index is None:
+        elements = [_find(root, position) for position in positions]
+    else:
+        elements = index.elements(positions)
+    changes = []
+    for position, element in zip(positions, elements):
+        node = delta.nodes[position]
+        if element is None:
+            changes.append((position, element, _addNodes(_unit, node)))
+        else:
+            changes.append((position, element, _addNodes((element.tag, dict(element.attrib), element.text, element.tail), node)))
+
+    journal = Journal.current()
+    changed = []
+    for position, element, node in changes:
+        #appending nodes does not move the nodes found above
+        if element is None:
+            element = _reach(root, position, journal)
+        _setNode(element, node, journal)
+        changed.append(element)
+
+    #prune the nodes that became trailing units, and then their parents if that leaves
+    #them as trailing units too
+    for element in reversed(changed):
+        parent = element.getparent()
+        while (parent is not None) and (element is not root):
+            Tree._pruneTrailingUnits(parent)
+            if element.getparent() is not None:
+                break
+            element, parent = parent, parent.getparent()
+
+    return tree
+
+
+
+def _find(root, position):
+    """Return the node at the position, or None if the tree has no node there"""
+    element = root
+    for index in position[1:]:
+        element = _child(element, index)
+        if element is None:
+            return None
+    return element
+
+
+def _child(element, index):
+    """Return the child numbered index, counting from 1, or None"""
+    try:
+        return element[index - 1]
+    except IndexError:
+        return None
+
+
+def _reach(root, position, journal):
+    """Return the node at the position, appending unit nodes where the tree has no
+    node at the position or before it among its siblings"""
+    element = root
+    for index in position[1:]:
+        child = _child(element, index)
+        while child is None:
+            child = lxml.etree.SubElement(element, '_')
+            if journal is not None:
+                journal.appended(element, child)
+            PositionIndex.appended(element, child)
+            child = _child(element, index)
+        element = child
+    return element
+
+
+def _setNode(element, node, journal):
+    tag, attrib, text, tail = node
+    if journal is not None:
+        journal.save(element)
+    element.tag = tag
+    element.text = text
+    element.tail = tail
+    Element._setAttribs(element, attrib)
@@ -0,0 +1,102 @@
+"""This file defines the digests of subtrees, used to skip identical subtrees when
+comparing trees."""
+
+import lxml.etree
+import hashlib, logging
+
+import TreeGroup.Common.Tag as Tag
+import TreeGroup.Common.Attrib as Attrib
+
+
+#Revisions of a document usually differ in a few sections, yet Tree.equal() and
+#Tree.metric() compare every node. The digest of a subtree is a hash of its root and
+#the digests of its children, in order, so two subtrees have the same digest when they
+#are equal node for node, under the rules of Element.equal():
+#   the tags, with leading units removed, see Tag._cleantag()
+#   the attributes, without those whose value is the unit or empty, see Attrib.cleanKeys()
+#   the text and tail, with trailing whitespace removed
+#Comparing the digests of two subtrees takes constant time, whatever their size.
+#
+#Subtrees that are equal under these rules can still have a difference that is not all
+#unit nodes, eg when their text differs by a trailing tab, see Text.py. Tree.metric()
+#uses exact digests instead, which hash the tag, attributes, text and tail as they are.
+#
+#The digests of all the subtrees of a tree are computed in one pass, children before
+#their parents. The hash is blake2b with 16 byte digests. The node is encoded in utf-8,
+#which never has a 0xff byte, so the 0xff that follows it marks where the digests of
+#the children start.
+#
+#Computing digests walks the whole tree, so it only pays when a tree is compared more
+#than once. Nothing is kept here: the caller keeps the digests returned by digests() and
+#passes them to Tree.equal() and Tree.metric(), eg when comparing one document with
+#many. The digests of a tree also hold those of its subtrees, so they can be passed
+#along with any of them. They describe the tree as it was when they were computed, so
+#they must be computed again after the tree is modified.
+
+
+
+def digests(tree, ignoreattrs=False, exact=False):
+    """Return the digest of every subtree of the tree, as a dictionary of bytes by
+    element. With ignoreattrs the attributes are left out, see Element.equal(). With
+    exact the nodes are hashed as they are, for Tree.metric().
+
+    TypeError is raised if the tree has nodes that are not elements, such as
+    comments."""
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+
+    result = {}
+    stack = [(root, iter(root))]
+    while stack:
+        element, children = stack[-1]
+        for child in children:
+            stack.append((child, iter(child)))
+            break
+        else:
+            stack.pop()
+            parts = [_encode(element, ignoreattrs, exact), b'\xff']
+            for child in element:
+                parts.append(result[child])
+            result[element] = hashlib.blake2b(b''.join(parts), digest_size=16).digest()
+    return result
+
+
+def digest(tree, ignoreattrs=False, exact=False):
+    """Return the digest of the tree"""
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+    return digests(root, ignoreattrs, exact)[root]
+
+
+def _encode(element, ignoreattrs, exact):
+    """Return the node as bytes, with the tag, attributes, text and tail as they are
+    compared by Element.equal(), or as they are if exact"""
+    tag = element.tag
+    if not isinstance(tag, str):
+        log = logging.getLogger()
+        log.error('%s is not an element, cannot process' % str(element))
+        raise TypeError('%s is not an element, cannot process' % str(element))
+    text = element.text
+    tail = element.tail
+    if exact:
+        #\x01 is not allowed in xml, it stands for None
+        parts = [tag, '\x01' if text is None else text, '\x01' if tail is None else tail]
+        for key, value in sorted(element.attrib.items()):
+            parts.append(key)
+            parts.append(value)
+        return '\0'.join(parts).encode('utf-8')
+
+    parts = [Tag._cleantag(tag), text.rstrip() if text else '', tail.rstrip() if tail else '']
+    if not ignoreattrs:
+        unit = Attrib._domain.unit
+        for key, value in sorted(element.attrib.items()):
+            if (value == unit) or (value == ''):
+                continue
+            parts.append(key)
+            parts.append(value)
+    return '\0'.join(parts).encode('utf-8')
+
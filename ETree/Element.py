@@ -6,6 +6,9 @@ import TreeGroup.Common.Tag as Tag
 import TreeGroup.Common.Attrib as Attrib
 import TreeGroup.Common.Text as Text
 
+from . import Journal
+from . import Equality
+
 def invert(element1):
     """Invert the element, modify in place and return it.
     
@@ -20,6 +23,9 @@ def invert(element1):
     """
     
 #    inverted = lxml.etree.Element(Tag.tagInverse(element1.tag), )
+    journal = Journal.current()
+    if journal is not None:
+        journal.save(element1)
     element1.tag = Tag.tagInverse(element1.tag) 
     element1.text = Text.textInverse(element1.text)
     element1.tail = Text.textInverse(element1.tail)
@@ -32,56 +38,24 @@ def invert(element1):
     return element1
         
     
-def equal(element1, element2, ignoreattrs=False):
+def equal(element1, element2, ignoreattrs=False, policy=None):
     """Return True if two elements are equal, false if they are not. 
     
     The ignoreattrs option, when True, causes this function to ignore
     element attributes when checking equality. Added as a requirement for 
     another project (Similar Content), should find a cleaner way of 
-    achieving the same result. """
-    
-    log = logging.getLogger()
-    
-    #tags
-    tag1 = Tag._cleantag(element1.tag)
-    tag2 = Tag._cleantag(element2.tag)
-    if tag1 != tag2:
-        return False
-    
-    #attrs
-    attrib1 = element1.attrib
-    Attrib.cleanKeys(attrib1)
-    attrib2 = element2.attrib
-    Attrib.cleanKeys(attrib2) 
-    if (attrib1 != attrib2) and (not ignoreattrs):
-        return False
-    
-    #text
-    try:
-        text1 = element1.text.rstrip()
-    except AttributeError: 
-        text1 = ''
-    try:
-        text2 = element2.text.rstrip()
-    except AttributeError:
-        text2 = ''
-    
-    if text1 != text2:
-        return False
-    
-    #tail
-    try:
-        tail1 = element1.tail.rstrip()
-    except AttributeError:
-        tail1 = ''
-    try:
-        tail2 = element2.tail.rstrip()
-    except:
-        tail2 = ''
-    if tail1 != tail2:
-        return False
+    achieving the same result. 
     
-    return True
+    policy is an EqualityPolicy that sets how the elements are compared, see 
+    Equality.py. The default compares the cleaned tags, the attributes without those
+    whose value is the unit and the text and tail without trailing whitespace. The 
+    elements are not modified. """
+    if policy is None:
+        if ignoreattrs:
+            policy = Equality.IGNOREATTRS
+        else:
+            policy = Equality.DEFAULT
+    return policy.equal(element1, element2)
 
 
 
@@ -103,6 +77,9 @@ def add(element1, element2):
     #have to wrap the attributes in dict() to avoid a bus error
     newattribs = Attrib.addAttribs(dict(element1.attrib), dict(element2.attrib))
     
+    journal = Journal.current()
+    if journal is not None:
+        journal.save(element1)
     element1.tag = newtag
     element1.text = Text.addText(element1.text, element2.text)
     element1.tail = Text.addText(element1.tail, element2.tail)
@@ -122,6 +99,149 @@ def add(element1, element2):
 
 
 
+#invertAll() and addAll() do the character arithmetic of many elements at once with
+#numpy, see Common/Segments.py. The strings of all the elements are gathered into one
+#array per domain, added or inverted in a few numpy operations, and the results are
+#set back on the elements. Below this number of elements, or without numpy, the
+#elements are processed one at a time, which is faster for small trees.
+BATCHSIZE = 64
+
+
+def _segments():
+    """Return the Segments module, or None if numpy is not installed"""
+    try:
+        import TreeGroup.Common.Segments as Segments
+    except ImportError:
+        return None
+    return Segments
+
+
+def _setAttribs(element1, attribs):
+    """Replace the attributes of the element"""
+    for i in element1.attrib:
+        del element1.attrib[i]
+    for key in attribs.keys():
+        try:
+            element1.set(key, attribs[key])
+        except TypeError:
+            log = logging.getLogger()
+            log.error('TypeError: %s' % str(sys.exc_info()[1]))
+            log.error('key = %s\tattribs[key] = %s' % (str(key), str(attribs[key])))
+            raise
+
+
+def invertAll(elements):
+    """Invert every element of a list in place, see invert(). The elements are
+    only modified once all the results have been computed."""
+    Segments = _segments()
+    if Segments is None or len(elements) < BATCHSIZE:
+        for element in elements:
+            invert(element)
+        return elements
+
+    #reading the elements is the slow part, every field is read once
+    tags = [element.tag for element in elements]
+    texts = [element.text for element in elements]
+    tails = [element.tail for element in elements]
+    attribs = [dict(element.attrib) for element in elements]
+
+    #tags are inverted once for every distinct tag
+    inverses = {}
+    for tag in tags:
+        if tag not in inverses:
+            inverses[tag] = Tag.tagInverse(tag)
+
+    heap, starts, lengths = Segments.encode(texts)
+    texts = Segments.split(*Segments.textInverse(heap, lengths))
+    heap, starts, lengths = Segments.encode(tails)
+    tails = Segments.split(*Segments.textInverse(heap, lengths))
+
+    #attributes with unit values are removed, see Attrib.attribInverse(). Elements
+    #without attributes are left alone.
+    attribs = [(attrib or None) for attrib in attribs]
+    values = []
+    for attrib in attribs:
+        if attrib is not None:
+            Attrib.cleanKeys(attrib)
+            values.extend(attrib.values())
+    heap, starts, lengths = Segments.encode(values)
+    values = iter(Segments.split(*Segments.valueInverse(heap, lengths)))
+
+    journal = Journal.current()
+    if journal is not None:
+        for element in elements:
+            journal.save(element)
+    for element, tag, text, tail, attrib in zip(elements, tags, texts, tails, attribs):
+        element.tag = inverses[tag]
+        element.text = text
+        element.tail = tail
+        if attrib is not None:
+            _setAttribs(element, dict([(key, next(values)) for key in attrib]))
+    return elements
+
+
+def addAll(pairs):
+    """Add the second element of every pair to the first, see add(). Only the first
+    elements are modified, once all the results have been computed."""
+    Segments = _segments()
+    if Segments is None or len(pairs) < BATCHSIZE:
+        for element1, element2 in pairs:
+            add(element1, element2)
+        return pairs
+
+    #reading the elements is the slow part, every field is read once
+    fields = [(element1.tag, element2.tag, element1.text, element2.text, element1.tail, element2.tail,
+               dict(element1.attrib), dict(element2.attrib)) for element1, element2 in pairs]
+
+    #tags are added once for every distinct pair of tags
+    sums = {}
+    for field in fields:
+        if field[:2] not in sums:
+            sums[field[:2]] = Tag.addTags(field[0], field[1])
+
+    heap1, starts1, lengths1 = Segments.encode([field[2] for field in fields])
+    heap2, starts2, lengths2 = Segments.encode([field[3] for field in fields])
+    texts = Segments.split(*Segments.addText(heap1, lengths1, heap2, lengths2))
+    heap1, starts1, lengths1 = Segments.encode([field[4] for field in fields])
+    heap2, starts2, lengths2 = Segments.encode([field[5] for field in fields])
+    tails = Segments.split(*Segments.addText(heap1, lengths1, heap2, lengths2))
+
+    #values of keys in both elements are added, the others are copied, see Attrib.addAttribs()
+    values1 = []
+    values2 = []
+    for field in fields:
+        attrib1 = field[6]
+        if attrib1:
+            for key, value in field[7].items():
+                if key in attrib1:
+                    values1.append(attrib1[key])
+                    values2.append(value)
+    heap1, starts1, lengths1 = Segments.encode(values1)
+    heap2, starts2, lengths2 = Segments.encode(values2)
+    values = iter(Segments.split(*Segments.addValues(heap1, lengths1, heap2, lengths2)))
+
+    journal = Journal.current()
+    if journal is not None:
+        for element1, element2 in pairs:
+            journal.save(element1)
+    for (element1, element2), field, text, tail in zip(pairs, fields, texts, tails):
+        element1.tag = sums[field[:2]]
+        element1.text = text
+        element1.tail = tail
+
+        attrib1, attrib2 = field[6:]
+        if attrib1 or attrib2:
+            for key in attrib2:
+                if key in attrib1:
+                    attrib1[key] = next(values)
+                else:
+                    attrib1[key] = attrib2[key]
+            Attrib.cleanKeys(attrib1)
+            _setAttribs(element1, attrib1)
+    return pairs
+
+
+
 
     
 def position(element1, root=None):
@@ -0,0 +1,163 @@
+"""This file defines EqualityPolicy, the rules used to compare trees, and the comparison
+of trees under a policy."""
+
+import lxml.etree
+
+import TreeGroup.Common.Tag as Tag
+import TreeGroup.Common.Attrib as Attrib
+
+
+#Two trees are equal when they have the same shape and the nodes at every position are
+#equal. What makes two nodes equal is set by an EqualityPolicy:
+#   attributes          compare the attributes, or ignore all of them
+#   ignoredattributes   names of attributes that are never compared
+#   whitespace          how text and tails are compared:
+#                           'rstrip'    trailing whitespace is ignored, the default
+#                           'strip'     leading and trailing whitespace is ignored
+#                           'normalize' runs of whitespace are one space, and leading
+#                                       and trailing whitespace is ignored
+#                           'exact'     text is compared as it is
+#   content             what is compared at every position:
+#                           'all'       tags, attributes, text and tails
+#                           'text'      text and tails only
+#                           'structure' tags only
+#Under every policy, tags have their leading units removed (see Tag._cleantag()), a
+#missing text is the same as an empty one, and attributes whose value is the unit or
+#empty are the same as missing attributes (see Attrib.cleanKeys()). Nothing is removed
+#from the trees themselves.
+#
+#A policy is compiled once, when it is made, into key(), which returns the part of a
+#node that is compared, so two nodes are equal when their keys are. The branches on the
+#settings are taken while compiling, not for every node.
+#
+#equal() walks both trees together with lxml.etree.iterwalk(), which reports the start
+#and the end of every element. The trees have the same shape if the events come in the
+#same order, and the nodes are compared at their start events. This takes time linear
+#in the size of the trees and memory proportional to their depth. Comments and
+#processing instructions are not elements, iterwalk() skips them, but their tails are
+#part of the text around them: the tails of those that follow the text or tail of an
+#element are added to it, as the lxml backend of SAX/Operations.py does.
+
+
+
+class EqualityPolicy:
+    def __init__(self, attributes=True, ignoredattributes=(), whitespace='rstrip', content='all'):
+        if whitespace not in _whitespace:
+            raise ValueError('unknown whitespace handling %s' % str(whitespace))
+        if content not in ('all', 'text', 'structure'):
+            raise ValueError('unknown content %s' % str(content))
+        self.attributes = attributes
+        self.ignoredattributes = frozenset(ignoredattributes)
+        self.whitespace = whitespace
+        self.content = content
+        self.key = self._compile()
+
+    def __repr__(self):
+        return '%s(attributes=%s, ignoredattributes=%s, whitespace=%r, content=%r)' % (
+            type(self).__name__, self.attributes, sorted(self.ignoredattributes), self.whitespace, self.content)
+
+    def _compile(self):
+        """Return the function that gives the key of a node under this policy"""
+        cleantag = Tag._cleantag
+        stripped = _whitespace[self.whitespace]
+        ignored = self.ignoredattributes
+
+        def attributes(element):
+            unit = Attrib._domain.unit
+            return frozenset([(key, value) for key, value in element.items()
+                              if not ((value == unit) or (value == '') or (key in ignored))])
+
+        if self.content == 'structure':
+            def key(element):
+                return cleantag(element.tag)
+        elif self.content == 'text':
+            def key(element):
+                return (stripped(_text(element)), stripped(_tail(element)))
+        elif not self.attributes:
+            def key(element):
+                return (cleantag(element.tag), stripped(_text(element)), stripped(_tail(element)))
+        else:
+            def key(element):
+                return (cleantag(element.tag), attributes(element), stripped(_text(element)), stripped(_tail(element)))
+        return key
+
+    def equal(self, element1, element2):
+        """Return True if the nodes are equal under this policy, their children are
+        not compared"""
+        key = self.key
+        return key(element1) == key(element2)
+
+
+
+def _text(element):
+    """Return the text of the element and the tails of the comments and processing
+    instructions that follow it"""
+    for child in element:
+        return _withTails(element.text, child)
+    return element.text
+
+def _tail(element):
+    """Return the tail of the element and the tails of the comments and processing
+    instructions that follow it"""
+    return _withTails(element.tail, element.getnext())
+
+def _withTails(text, node):
+    if (node is None) or isinstance(node.tag, str):
+        return text
+    texts = [text or '']
+    while (node is not None) and (not isinstance(node.tag, str)):
+        texts.append(node.tail or '')
+        node = node.getnext()
+    return ''.join(texts)
+
+
+def _rstrip(text):
+    if not text:
+        return ''
+    return text.rstrip()
+
+def _strip(text):
+    if not text:
+        return ''
+    return text.strip()
+
+def _normalize(text):
+    if not text:
+        return ''
+    return ' '.join(text.split())
+
+def _exact(text):
+    if not text:
+        return ''
+    return text
+
+_whitespace = {'rstrip': _rstrip, 'strip': _strip, 'normalize': _normalize, 'exact': _exact}
+
+
+#the rules of Element.equal() and Tree.equal()
+DEFAULT = EqualityPolicy()
+#the rules of the ignoreattrs option of Element.equal() and Tree.equal()
+IGNOREATTRS = EqualityPolicy(attributes=False)
+
+
+
+def equal(tree1, tree2, policy=DEFAULT):
+    """Return True if the trees are equal under the policy, False otherwise"""
+    if isinstance(tree1, lxml.etree._Element):
+        root1 = tree1
+    else:
+        root1 = tree1.getroot()
+    if isinstance(tree2, lxml.etree._Element):
+        root2 = tree2
+    else:
+        root2 = tree2.getroot()
+
+    key = policy.key
+    events2 = lxml.etree.iterwalk(root2, events=('start', 'end'))
+    for event1, element1 in lxml.etree.iterwalk(root1, events=('start', 'end')):
+        event2, element2 = next(events2, (None, None))
+        if event1 != event2:
+            return False
+        if event1 == 'start' and key(element1) != key(element2):
+            return False
+    return next(events2, None) is None
@@ -0,0 +1,146 @@
+"""This file defines the journal used to undo the changes made to trees, see
+Tree.transaction()."""
+
+import contextlib, contextvars
+
+from . import PositionIndex
+
+
+#add() and invert() modify their first tree in place. Inside a transaction, every change
+#made by the functions in Element.py and Tree.py is recorded in the current journal
+#before it is made:
+#   the tag, text, tail and attributes of an element, before they are replaced
+#   a node appended to a parent, eg a node grafted by Tree.add()
+#   a node removed from the end of its parent, eg a trailing unit node being pruned
+#Rolling back undoes the entries in reverse order, which takes time proportional to the
+#number of changes rather than to the size of the trees.
+#
+#Outside a transaction nothing is recorded, and the only cost is checking current().
+#
+#A transaction can be limited to one tree, in which case only changes to nodes of that
+#tree are recorded in its journal, and rolling back leaves other trees alone. Changes
+#to other trees go to the innermost enclosing transaction that records them, if any.
+#Nodes belong to the tree of their document root, even after they are removed from it.
+#
+#The transactions in progress are kept in a context variable, so transactions in
+#different threads or asyncio tasks do not see each other's journals.
+
+
+#journals of the transactions in progress, innermost last
+_journals = contextvars.ContextVar('Journal._journals', default=())
+
+
+def current():
+    """Return the journal of the innermost transaction, or None"""
+    journals = _journals.get()
+    if journals:
+        return journals[-1]
+    return None
+
+
+def _root(node):
+    """Return the root of the document of the node"""
+    return node.getroottree().getroot()
+
+
+
+class Journal:
+    def __init__(self, root=None):
+        #the root of the document whose changes are recorded, None for all of them
+        self.root = root
+        #each entry is the root of the document changed, the function that undoes the 
+        #change and its arguments
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def records(self, root):
+        """Return True if changes to the document with this root are recorded"""
+        return (self.root is None) or (self.root is root)
+
+    def save(self, element):
+        """Record the tag, text, tail and attributes of the element"""
+        self._record(element, _restore, element.tag, element.text, element.tail, tuple(element.attrib.items()))
+
+    def appended(self, parent, child):
+        """Record that child was appended to parent"""
+        self._record(parent, _unappend, child)
+
+    def removed(self, parent, child):
+        """Record that child, the last child of parent, was removed"""
+        self._record(parent, _unremove, child)
+
+    def _record(self, node, undo, *arguments):
+        root = _root(node)
+        entry = (root, undo, node) + arguments
+        if self.records(root):
+            self.entries.append(entry)
+            return
+        for journal in reversed(_journals.get()):
+            if journal.records(root):
+                journal.entries.append(entry)
+                return
+
+    def rollback(self):
+        """Undo every change recorded, latest first, and empty the journal"""
+        entries = self.entries
+        self.entries = []
+        for entry in reversed(entries):
+            entry[1](*entry[2:])
+
+    def commit(self):
+        """Keep the changes recorded. In a nested transaction they are passed on to the
+        enclosing journals that record them, so they can still undo them."""
+        entries = self.entries
+        self.entries = []
+        journals = _journals.get()
+        if (not journals) or (journals[-1] is self):
+            return
+        if journals[-1].records(self.root):
+            journals[-1].entries.extend(entries)
+            return
+        for entry in entries:
+            for journal in reversed(journals):
+                if journal.records(entry[0]):
+                    journal.entries.append(entry)
+                    break
+
+
+
+def _restore(element, tag, text, tail, attrib):
+    element.tag = tag
+    element.text = text
+    element.tail = tail
+    element.attrib.clear()
+    for key, value in attrib:
+        element.set(key, value)
+
+
+def _unappend(parent, child):
+    parent.remove(child)
+    PositionIndex.removed(parent, child)
+
+
+def _unremove(parent, child):
+    parent.append(child)
+    PositionIndex.appended(parent, child)
+
+
+
+@contextlib.contextmanager
+def transaction(root=None):
+    """Record changes in a new journal, which is returned. If the block raises an
+    exception the changes are rolled back, otherwise they are kept. journal.rollback()
+    can also be called inside the block, eg to try out operations on a tree. If root
+    is given only changes to its document are recorded."""
+    journal = Journal(root)
+    token = _journals.set(_journals.get() + (journal,))
+    try:
+        yield journal
+    except BaseException:
+        _journals.reset(token)
+        journal.rollback()
+        raise
+    _journals.reset(token)
+    journal.commit()
@@ -0,0 +1,113 @@
+"""This file defines Ordering, the positions of the nodes of a tree in document order."""
+
+import lxml.etree
+import array
+
+
+#The ordering of a tree is the list of the positions of its nodes in document order
+#(preorder), see Tree.ordering(). Stored as lists, the positions of an n node tree of
+#depth d take O(n.d) memory, in many small lists, often more than the tree itself. An
+#Ordering stores two integers per node instead, in arrays:
+#   parent      index of the parent node in the ordering, -1 for the root
+#   index       index of the node among the children of its parent + 1, 1 for the root
+#Positions are made from these when they are asked for, by climbing the parents.
+#
+#In preorder, the parent of every node determines the shape of the tree, so two
+#orderings are equal when their parent arrays are, which is compared in one step
+#without building any position.
+
+
+
+class Ordering:
+    def __init__(self, parent=None, index=None):
+        if parent is None:
+            parent = array.array('q')
+        if index is None:
+            index = array.array('q')
+        self.parent = parent
+        self.index = index
+
+    def __len__(self):
+        return len(self.parent)
+
+    def position(self, node):
+        """Return the position of the node numbered node in the ordering, as a list"""
+        parent = self.parent
+        index = self.index
+        result = []
+        while node >= 0:
+            result.append(index[node])
+            node = parent[node]
+        result.reverse()
+        return result
+
+    def __getitem__(self, node):
+        if isinstance(node, slice):
+            return [self.position(i) for i in range(*node.indices(len(self)))]
+        if node < 0:
+            node += len(self)
+        if not 0 <= node < len(self):
+            raise IndexError('ordering index out of range')
+        return self.position(node)
+
+    def __iter__(self):
+        #the position of a node extends the position of its parent, which comes just
+        #before its first child or is on the path of the previous node
+        parent = self.parent
+        index = self.index
+        path = []
+        nodes = []
+        for node in range(len(parent)):
+            while nodes and nodes[-1] != parent[node]:
+                nodes.pop()
+                path.pop()
+            nodes.append(node)
+            path.append(index[node])
+            yield list(path)
+
+    def __eq__(self, other):
+        if isinstance(other, Ordering):
+            return self.parent == other.parent
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def nbytes(self):
+        """Return the number of bytes used by the arrays"""
+        return (len(self.parent) * self.parent.itemsize) + (len(self.index) * self.index.itemsize)
+
+    def __repr__(self):
+        return '%s(%i nodes)' % (type(self).__name__, len(self))
+
+
+
+def fromTree(tree):
+    """Return the ordering of an lxml element or tree. The tree is walked once."""
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+
+    #the path from the root to the current element, and for each element on it its
+    #number in the ordering and the number of its children seen so far
+    parent = array.array('q')
+    index = array.array('q')
+    elements = [None]
+    nodes = [-1]
+    counts = [0]
+    for element in root.iter():
+        if len(parent) == 0:
+            up = None
+        else:
+            up = element.getparent()
+        while elements[-1] is not up:
+            elements.pop()
+            nodes.pop()
+            counts.pop()
+        counts[-1] += 1
+        parent.append(nodes[-1])
+        index.append(counts[-1])
+        elements.append(element)
+        nodes.append(len(parent) - 1)
+        counts.append(0)
+    return Ordering(parent, index)
@@ -0,0 +1,157 @@
+"""This file defines PositionIndex, which maps the elements of a tree to their positions
+and back."""
+
+import lxml.etree
+import weakref
+
+
+#Element.position() climbs to the root and scans the siblings at every level, and
+#Tree.getNode() walks down from the root, so both take time proportional to the depth
+#and the number of siblings on the way. A PositionIndex walks the tree once and keeps
+#the position of every element in a dictionary, and every element by position in
+#another, so lookups take constant time.
+#
+#Positions are tuples in the form used by Delta.py: the first number is 1 for the root,
+#the others are the index of each child + 1. Positions are relative to the root the
+#index was built from, which may be an element inside a larger tree.
+#
+#The functions in Tree.py and Delta.py only change the structure of a tree by appending
+#a node to a parent or removing the last child of a parent, and rolling back a
+#transaction undoes exactly those changes, see Journal.py. Neither moves the other
+#children of the parent, so only the positions of the subtree appended or removed
+#change. Those functions call appended() and removed() below, which update the indexes
+#of the tree, and only those. Changes made to the tree by other means, eg with lxml
+#directly, are not seen; call rebuild() after them.
+
+
+#weak references to the indexes in use, by id of the root of the document they index.
+#lxml elements cannot be referred to weakly, so every index holds the root of its
+#document, which keeps the id from being reused while the index is alive. Indexes are
+#removed when they are no longer referenced, and their entry with them once it is empty.
+_indexes = {}
+
+
+def _document(element):
+    """Return the root of the document of the element"""
+    return element.getroottree().getroot()
+
+
+def _register(index, key):
+    def forget(reference):
+        references = _indexes.get(key)
+        if references is not None:
+            references.discard(reference)
+            if not references:
+                del _indexes[key]
+    _indexes.setdefault(key, set()).add(weakref.ref(index, forget))
+
+
+def _indexesOf(element):
+    """Return the indexes of the tree of the element"""
+    references = _indexes.get(id(_document(element)), ())
+    return [index for index in [reference() for reference in list(references)] if index is not None]
+
+
+
+class PositionIndex:
+    def __init__(self, tree):
+        """Build the index of the tree, an lxml element or element tree"""
+        if isinstance(tree, lxml.etree._Element):
+            self.root = tree
+        else:
+            self.root = tree.getroot()
+        self.rebuild()
+        self._document = _document(self.root)
+        _register(self, id(self._document))
+
+    def rebuild(self):
+        """Index the tree again, eg after changing it without using the functions in
+        Tree.py and Delta.py"""
+        self._positions = {}
+        self._elements = {}
+        self._add(self.root, (1,))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, element):
+        return element in self._positions
+
+    def position(self, element):
+        """Return the position of the element. KeyError is raised if the element is not
+        in the tree."""
+        return self._positions[element]
+
+    def element(self, position):
+        """Return the element at the position, a tuple or list. KeyError is raised if the
+        tree has no node there."""
+        return self._elements[tuple(position)]
+
+    def positions(self, elements):
+        """Return the positions of the elements, a list with None for the elements that
+        are not in the tree"""
+        get = self._positions.get
+        return [get(element) for element in elements]
+
+    def elements(self, positions):
+        """Return the elements at the positions, a list with None for the positions where
+        the tree has no node"""
+        get = self._elements.get
+        return [get(tuple(position)) for position in positions]
+
+    def appended(self, parent, child):
+        """Index child, which was appended to parent"""
+        position = self._positions.get(parent)
+        if position is None:
+            return
+        previous = child.getprevious()
+        if previous is None:
+            index = 1
+        elif previous in self._positions:
+            index = self._positions[previous][-1] + 1
+        else:
+            #the previous sibling was added without telling the index
+            index = parent.index(child) + 1
+        self._add(child, position + (index,))
+
+    def removed(self, parent, child):
+        """Remove child, which was the last child of parent, and its descendants from
+        the index"""
+        if parent not in self._positions:
+            return
+        for element in child.iter():
+            position = self._positions.pop(element, None)
+            if position is not None:
+                del self._elements[position]
+
+    def _add(self, element, position):
+        """Index the element at the position, and its descendants"""
+        positions = self._positions
+        elements = self._elements
+        stack = [(element, position)]
+        while stack:
+            element, position = stack.pop()
+            positions[element] = position
+            elements[position] = element
+            index = 1
+            for child in element:
+                stack.append((child, position + (index,)))
+                index += 1
+
+
+
+def appended(parent, child):
+    """Update the indexes of the tree after child was appended to parent"""
+    if not _indexes:
+        return
+    for index in _indexesOf(parent):
+        index.appended(parent, child)
+
+
+def removed(parent, child):
+    """Update the indexes of the tree after child, the last child of parent, was
+    removed"""
+    if not _indexes:
+        return
+    for index in _indexesOf(parent):
+        index.removed(parent, child)
@@ -1,15 +1,26 @@
 import lxml.etree
-import copy, logging, re, sys, os.path
+import copy, logging, sys, os.path
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 #import TreeGroup.Etree.Element as Element
 from . import Element
+from . import Journal
+from . import PositionIndex
+from . import Ordering
+from . import Equality
 
+import TreeGroup.Common.Tag as Tag
+import TreeGroup.Common.Attrib as Attrib
+import TreeGroup.Common.Text as Text
 
 
-def invert(tree):
+
+def invert(tree, validated=False):
     """Invert the tree. 
     
+    The tree is validated first, see validate(). Pass validated=True to skip this 
+    when the tree is known to be valid, eg it was just returned by add(). 
+    
     Note that this function modifies the tree in place _and_ returns it. 
     
     Modifying the tree in place is important since it avoids multiple copies
@@ -26,16 +37,24 @@ def invert(tree):
         iterateover = tree
     else:
         iterateover = tree.getroot()
-    for element in iterateover.iter():
-        Element.invert(element)
+    #checked before anything is modified, see validate()
+    if not validated:
+        validate(iterateover)
+    #the elements are inverted together, see Element.invertAll()
+    Element.invertAll(list(iterateover.iter()))
 
     return tree
 
 
 
-def add(tree1, tree2):
+def add(tree1, tree2, validated=False):
     """Add tree2 to tree1, modify tree1 in place.
     
+    The nodes that are added together are validated first, see validate(); nodes that 
+    are only copied from tree2 or kept from tree1 are not. Pass validated=True to skip 
+    this when both trees are known to be valid, eg they were just returned by add() or 
+    invert(). 
+    
     Note that this function modifies tree1 in place _and_ returns it. 
     
     Modifying the tree in place is important since it avoids multiple copies
@@ -69,182 +88,313 @@ def add(tree1, tree2):
         self.log.error('%s is Comment, cannot process' % str(tree2))
         raise TypeError
     
-              
-    #get orderings
-    ordering1 = ordering(tree1)
-    ordering2 = ordering(tree2)
-    
-#    log.debug('ordering1: %s' % str(ordering1))
-#    log.debug('ordering2: %s' % str(ordering2))
     
-    #iterate over ordering2, apply to ordering1
-#    for index, position2 in enumerate(ordering2):
-    index = 0
-    while index < len(ordering2):
-        position2 = ordering2[index]
-                                    
-        #log.debug('index: %s\tposition2: %s' % (str(index), str(position2)))
-        
-        node2 = getNode(tree2, position2)
-        
-        #if index greater then len(ordering1), append to appropriate node. 
-        #if positions not equal, append to appropriate node 
-        if index == 1 and len(ordering1) == 1 and len(ordering2) == 1:
-            pass
-        
-        elif index == len(ordering1):
-            #log.debug('\tindex == len(ordering1)')
-            
-            try:
-                node3 = lxml.etree.Element(node2.tag, node2.attrib) #copy.copy(node2)
-            except TypeError:
-                log.error('TypeError: %s' % str(sys.exc_info()[1]))
-                log.error('%s\t%s' % (node2.tag, str(node2.attrib)))
-                raise
-            
-            node3.text = node2.text
-            node3.tail = node2.tail
-            #log.debug('\tnode3: %s' % str(node3))
-                      
-            parent1 = getNode(tree1, position2[:-1])
-            #log.debug('\tparent1: %s' % str(parent1))
-                
-            parent1.append(node3)
-            
-            position3 = Element.position(node3, root=tree1)
-            #log.debug('\tposition3: %s' % str(position3))
-            
-            if position3 != position2:
-                log.error('\t\tposition2 != position3, fail')
-                #raise exception?
-                return None
-            else:
-                ordering1.insert(index, position3)
-                #log.debug('\tordering1: %s' % str(ordering1))
-                
-     
- 
-        elif position2 != ordering1[index]:
-            #log.debug('\tposition2 != ordering1[index]')
-            
-            #search for corresponding position later on in ordering1
-            #if found, add nodes 
-            newindex = None
-            for e, p in enumerate(ordering1[index:]):
-                if p == position2:
-                    newindex = e + index
-                    break
-            if newindex:
-                #log.debug('\tfound position2 in ordering1 at index %s, adding nodes' % str(newindex))
-                position1 = ordering1[newindex]
-                node1 = getNode(tree1, position1)
-                #log.debug('\tnode1: %s\tnode2: %s' % (str(node1), str(node2)))
-                Element.add(node1, node2) 
-            else:
-                node3 = lxml.etree.Element(node2.tag, node2.attrib)
-                node3.text = node2.text
-                node3.tail = node2.tail
-                #log.debug('\tnode3: %s' % str(node3))
-                
-                parent1 = getNode(tree1, position2[:-1])
-                #log.debug('\tparent1: %s' % str(parent1))
-                    
-                parent1.append(node3)
-                
-                position3 = Element.position(node3, root=tree1)
-                #log.debug('\tposition3: %s' % str(position3))
-                
-                if position3 != position2:
-                    log.error('\t\tposition2 != position3, fail')
-                    #raise exception?
-                    return None
-                else:
-                    ordering1.insert(index, position3)
-                    #log.debug('\tordering1: %s' % str(ordering1))
-                
-
-        
-        elif position2 == ordering1[index]:
-            #if positions equal, add
-            #log.debug('\tposition2 == ordering1[index], add elements')
-            #get positions
-            position1 = ordering1[index]
-            node1 = getNode(tree1, position1)
-            #log.debug('\tnode1: %s\tnode2: %s' % (str(node1), str(node2)))
-            Element.add(node1, node2) 
-        
-        
-        else:
-            #this should never happen
-            log.error('inconsistency in tree orderings, position2 does not correspond to any possibilities in ordering1')
-            return None
-                
-        index += 1
-        continue
-               
-               
-               
-    #done. Now remove trailing units
-    #easiest way to do this is to iterate over the tree in reverse. 
-    reversed = []
-    ##log.debug('removing trailing unit nodes')
-    if isinstance(tree1, lxml.etree._ElementTree): 
-        for i in tree1.getroot().iter(): reversed.insert(0, i)
-    elif isinstance(tree1, lxml.etree._Element):
-        for i in tree1.iter(): reversed.insert(0, i)
+    if isinstance(tree1, lxml.etree._Element):
+        root1 = tree1
     else:
-        log.warning('tree1 is %s, expected lxml.etree._Element or lxml.etree._ElementTree' % str(tree1))
-        
-    for i in reversed:
-        #log.debug('testing: %s' % str(i))
-        if not (i.tag == '_'):
-            #log.debug('\ttag is not _, skip')
-            continue
-        
-        if not (i.attrib == {}):
-            #log.debug('\tattributes not blank, skip')
-            continue
+        root1 = tree1.getroot()
+    if isinstance(tree2, lxml.etree._Element):
+        root2 = tree2
+    else:
+        root2 = tree2.getroot()
+    #walk both trees together, depth first. Nodes are added when they have the same 
+    #position in both trees, which is the case when their parents have the same position
+    #and they have the same index under their parents. Children of node2 that have no
+    #corresponding node in tree1 are grafted onto tree1. 
+    #Each entry on the stack is a pair of nodes at the same position and the next child 
+    #of each to visit. Siblings are reached with getnext(), since len() and indexing are 
+    #linear in the number of children in lxml. Trailing unit nodes are pruned when a pair 
+    #is left, at which point all the descendants of the pair have been visited. 
+    #The pairs are only collected during the walk, and added together afterwards with
+    #Element.addAll(). Grafts are copied during the walk but only appended once the 
+    #pairs have been validated, so tree1 is left as it was when they are not valid. 
+    #Pruning depends on the sums, so it is done last, in the order the pairs were left. 
+    journal = Journal.current()
+    pairs = [(root1, root2)]
+    grafts = []
+    unpaired = []
+    left = []
+    stack = [[root1, root2, _firstChild(root1), _firstChild(root2)]]
+    while stack:
+        frame = stack[-1]
+        node1, node2, child1, child2 = frame
         
-        if not (len(i) == 0):
-            #log.debug('\tlength is not 0, skip')
-            continue
-         
-        if not (i.text is None or re.match(r'^\s*$', i.text)):
-            #log.debug('\ttext is %s, skip' % str(i.text))
+        if child2 is not None:
+            frame[3] = child2.getnext()
+            if child1 is not None:
+                frame[2] = child1.getnext()
+                pairs.append((child1, child2))
+                stack.append([child1, child2, _firstChild(child1), _firstChild(child2)])
+            else:
+                #no corresponding node in tree1. Since siblings are visited in order, 
+                #the graft lands at the same position as child2. 
+                grafts.append((node1, prune_units(_graft(child2))))
             continue
         
-        if not (i.tail is None or re.match(r'^\s*$', i.tail)):
-            #log.debug('\ttail is %s, skip' % str(i.tail))
-            continue
+        stack.pop()
+        #children of node1 that have no corresponding node in tree2 were not visited
+        while child1 is not None:
+            unpaired.append(child1)
+            child1 = child1.getnext()
+        left.append(node1)
+    
+    #checked before anything is modified, see validate()
+    if not validated:
+        _validatePairs(pairs)
+    
+    for node1, graft in grafts:
+        node1.append(graft)
+        if journal is not None:
+            journal.appended(node1, graft)
+        PositionIndex.appended(node1, graft)
+    for child1 in unpaired:
+        prune_units(child1)
+    Element.addAll(pairs)
+    for node1 in left:
+        _pruneTrailingUnits(node1)
+    
+    #the top of tree1 is pruned like any other node, see _pruneTrailingUnits()
+    parent = root1.getparent()
+    if (parent is not None) and (root1 is parent[-1]) and _isUnitNode(root1):
+        parent.remove(root1)
+        if journal is not None:
+            journal.removed(parent, root1)
+        PositionIndex.removed(parent, root1)
+    
+#    log.debug('result: %s' % lxml.etree.tostring(tree1))
+    return tree1
+
+
+
+def transaction(tree=None):
+    """Return a context manager that records the changes made to trees by add(), 
+    invert() and prune_units(), and undoes them if the block raises an exception. 
+    The journal of the changes is returned, so they can also be undone inside the 
+    block, eg
+        with transaction(tree) as journal:
+            add(tree, tree2)
+            distance = metric(tree, target)
+            journal.rollback()
+    
+    leaves tree as it was without copying it first. Rolling back takes time 
+    proportional to the number of changes, see Journal.py. Only changes to the 
+    document of tree are recorded, so other trees modified in the block are left as 
+    they are. If tree is None changes to all trees are recorded. 
+    """
+    if tree is None:
+        return Journal.transaction()
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+    return Journal.transaction(Journal._root(root))
+
+
+
+def validate(tree):
+    """Raise ValueError if any tag, text, tail or attribute value of the tree has a 
+    character that is not part of its domain, and TypeError if the tree has nodes 
+    that are not elements, such as comments. 
+    
+    add() and invert() validate their arguments before modifying anything, so when 
+    they fail the trees are left as they were and there is no need to copy the trees
+    before calling them. Trees are only modified by add() and invert() once they have
+    been validated, and their results are valid, so chained calls can pass 
+    validated=True to skip checking them again. 
+    
+    All the strings of each domain are joined and checked in one pass. Nothing is 
+    remembered between calls, so trees modified by other means are always checked. 
+    """
+    
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+    log = logging.getLogger()
+    tags = []
+    texts = []
+    values = []
+    for element in root.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            log.error('%s is not an element, cannot process' % str(element))
+            raise TypeError('%s is not an element, cannot process' % str(element))
+        tags.append(tag)
+        if element.text is not None:
+            texts.append(element.text)
+        if element.tail is not None:
+            texts.append(element.tail)
+        values.extend(element.attrib.values())
+    
+    _validateStrings(tags, texts, values)
+
+
+def _validatePairs(pairs):
+    """Raise ValueError if any string that add() combines has a character that is not 
+    part of its domain, and TypeError if any of the nodes is not an element. These are
+    the tags, texts and tails of both nodes of every pair and the attribute values of 
+    the keys they share, see validate()."""
+    log = logging.getLogger()
+    tags = []
+    texts = []
+    values = []
+    for pair in pairs:
+        for element in pair:
+            tag = element.tag
+            if not isinstance(tag, str):
+                log.error('%s is not an element, cannot process' % str(element))
+                raise TypeError('%s is not an element, cannot process' % str(element))
+            tags.append(tag)
+            if element.text is not None:
+                texts.append(element.text)
+            if element.tail is not None:
+                texts.append(element.tail)
+        attrib1, attrib2 = pair[0].attrib, pair[1].attrib
+        if len(attrib1) and len(attrib2):
+            for key, value in attrib2.items():
+                if key in attrib1:
+                    values.append(attrib1[key])
+                    values.append(value)
+    
+    _validateStrings(tags, texts, values)
+
+
+def _validateStrings(tags, texts, values):
+    """Raise ValueError if any of the tags, texts and attribute values has a character 
+    that is not part of its domain, see validate()"""
+    #newlines are units in text, see Text.py
+    Tag._domain.validate(''.join(tags))
+    Text._domain.validate(''.join(texts).replace('\n', ''))
+    Attrib._domain.validate(''.join(values))
+
+
+def _graft(element):
+    """Return a copy of element and its descendants. Only the tags, attributes, 
+    text and tails are copied."""
+    log = logging.getLogger()
+    
+    result = None
+    stack = [(element, None)]
+    while stack:
+        source, parent = stack.pop()
+        try:
+            target = lxml.etree.Element(source.tag, source.attrib)
+        except TypeError:
+            log.error('TypeError: %s' % str(sys.exc_info()[1]))
+            log.error('%s\t%s' % (source.tag, str(source.attrib)))
+            raise
+        target.text = source.text
+        target.tail = source.tail
         
-        #log.debug('removing unit node: %s' % str(i))
-        parent = i.getparent()
         if parent is None:
-            #happens if i is the root
-            pass
-        elif not i is parent[-1]:
-            #only remove trailing units. 
-            pass
+            result = target
         else:
-            parent.remove(i)
+            parent.append(target)
+        
+        #reversed so that the children are appended in document order
+        for child in reversed(source):
+            stack.append((child, target))
     
-#    log.debug('result: %s' % lxml.etree.tostring(tree1))
-    return tree1
+    return result
+
 
 
+def prune_units(tree):
+    """Remove trailing unit nodes from the tree, modify the tree in place and return it. 
+    
+    A unit node is a node with the unit tag, no attributes, no children and blank text 
+    and tail. Trailing unit nodes do not change the tree in the group, so they can
+    always be removed. The result of add() is pruned, this function can be used to
+    compact trees produced by other means. 
+    
+    The nodes are visited in post-order, so the children of a node have been pruned 
+    before the node itself is tested. This takes time linear in the size of the tree 
+    and memory proportional to its depth. 
+    """
+    
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+    
+    stack = [(root, iter(root))]
+    while stack:
+        element, children = stack[-1]
+        for child in children:
+            stack.append((child, iter(child)))
+            break
+        else:
+            stack.pop()
+            _pruneTrailingUnits(element)
+            
+    return tree
 
-def equal(tree1, tree2, ignoreattrs=False):
+
+
+def _isUnitNode(element):
+    """Return True if the element is a unit node without children, ie a node
+    that can be removed from the end of its parent without changing the tree."""
+    if not (element.tag == '_'):
+        return False
+    if len(element.attrib) != 0:
+        return False
+    text = element.text
+    if text and not text.isspace():
+        return False
+    tail = element.tail
+    if tail and not tail.isspace():
+        return False
+    if _firstChild(element) is not None:
+        return False
+    return True
+
+
+
+def _pruneTrailingUnits(element):
+    """Remove trailing unit nodes from the children of element. The children must 
+    already be pruned themselves."""
+    #only remove trailing units. Removing one makes the previous sibling the 
+    #trailing node, so keep going until a node that is not a unit is found.
+    journal = Journal.current()
+    while True:
+        try:
+            last = element[-1]
+        except IndexError:
+            return
+        if not _isUnitNode(last):
+            return
+        element.remove(last)
+        if journal is not None:
+            journal.removed(element, last)
+        PositionIndex.removed(element, last)
+
+
+
+def _firstChild(element):
+    """Return the first child of the element, or None"""
+    for child in element:
+        return child
+    return None
+
+
+
+def equal(tree1, tree2, ignoreattrs=False, policy=None, digests=None):
     """Return True if the trees are equal, False otherwise.
     
     
     The ignoreattrs option, when True, causes this function to ignore
     element attributes when checking equality. Added as a requirement for 
     another project (Similar Content), should find a cleaner way of 
-    achieving the same result. """
+    achieving the same result. 
     
-    #determine if trees are equal, without using the orderings. This function should be faster 
-    #that the old ones.     
-    log = logging.getLogger()
+    policy is an EqualityPolicy that sets how the nodes are compared, see Equality.py. 
+    ignoreattrs=True is the same as policy=Equality.IGNOREATTRS. Both trees are walked 
+    once, together, and neither is modified. 
+    
+    digests is an optional pair of the digests of the trees, or of trees that have them
+    as subtrees, computed by Digest.digests() with the same ignoreattrs. The trees are 
+    then compared by the digests of their roots instead of being walked. The digests 
+    must be computed again after a tree is modified. They are not used with a policy. """
     
     #check that correct object is passed. 
     #In lxml, ElementTrees are distinct from Elements in that ElementTrees have doc information
@@ -256,79 +406,19 @@ def equal(tree1, tree2, ignoreattrs=False):
     elif not (isinstance(tree2, lxml.etree._ElementTree) or isinstance(tree2, lxml.etree._Element)):
         return False
     
-    tree1iterator = tree1.iter()
-    tree2iterator = tree2.iter()
-    p1 = []
-    p2 = []
-    stack1 = []
-    stack2 = []
-    index = 0
-    for e1 in tree1iterator:
-        #log.debug('e1: %s' % str(e1))
-        
-        try:
-            e2 = tree2iterator.__next__()
-        except StopIteration: 
-            #log.debug('no e2, return False')
-            return False
-        #log.debug('e2: %s' % str(e2))
-        
-        if not Element.equal(e1, e2, ignoreattrs=ignoreattrs): 
-            #log.debug('e1 != e2, return False')
-            return False
-        
-#        p1 = Element.position(e1, root=tree1)
-#        p2 = Element.position(e2, root=tree2)
-        
-        #get position 1 and position 2, compare. 
-        if (p1 == []) and (index != 0):
-            log.warning('p1 == [], e1 is not root')
-            raise TypeError
-        elif index == 0:
-            stack1 = [e1]
-            p1 = [1]
-        else:
-            parent1index = stack1.index(e1.getparent())
-            p1 = p1[:parent1index + 1]
-            p1.append(e1.getparent().index(e1) + 1)
-            stack1 = stack1[:parent1index + 1]
-            stack1.append(e1)
-                    
-        if (p2 == []) and (index != 0):
-            log.warning('p2 == [], e2 is not root')
-            raise TypeError
-        elif index == 0:
-            stack2 = [e2]
-            p2 = [1]
+    if policy is None:
+        #trees are equal when the digests of their roots are, see Digest.py
+        if digests is not None:
+            root1 = tree1 if isinstance(tree1, lxml.etree._Element) else tree1.getroot()
+            root2 = tree2 if isinstance(tree2, lxml.etree._Element) else tree2.getroot()
+            return digests[0][root1] == digests[1][root2]
+        if ignoreattrs:
+            policy = Equality.IGNOREATTRS
         else:
-            parent2index = stack2.index(e2.getparent())
-            p2 = p2[:parent2index + 1]
-            p2.append(e2.getparent().index(e2) + 1)
-            stack2 = stack2[:parent2index + 1]
-            stack2.append(e2)
-
-        #log.debug('p1: %s' % str(p1))
-        #log.debug('p2: %s' % str(p2))
-        #log.debug('stack1: %s' % str(stack1))
-        #log.debug('stack2: %s' % str(stack2))   
-        if p1 != p2: 
-            #log.debug('p1 != p2, return False')
-            return False
-        index += 1
-    #log.debug('tree1 iteration finished')
-    
-    try:
-        e2 = tree2iterator.__next__()
-    except StopIteration:
-        #log.debug('tree2 iteration finished, return True')
-        return True
-    
-    if e2 is not None: 
-        #log.debug('tree2 iteration not finished, return False')
-        return False
+            policy = Equality.DEFAULT
     
-    #log.debug('return True')
-    return True
+    return Equality.equal(tree1, tree2, policy)
+
 
 
 def equal_old(tree1, tree2):
@@ -353,14 +443,13 @@ def equal_old(tree1, tree2):
 #    #log.debug("ordering1: %s" % str(ordering1))
 #    log.debug("ordering2: %s" % str(ordering2))
     
-    if not len(ordering1) == len(ordering2):
+    if not ordering1 == ordering2:
         return False
     
-    for index, p1 in enumerate(ordering1):
-        p2 = ordering2[index]
-        if not p1 == p2:
-            return False        
-        if not Element.equal(getNode(tree1, p1), getNode(tree2, p2)):
+    #the orderings are equal, so the nodes at the same position come at the same 
+    #point in document order
+    for e1, e2 in zip(tree1.iter(), tree2.iter()):
+        if not Element.equal(e1, e2):
             return False
     
     return True
@@ -465,62 +554,10 @@ def ordering_sax(file, startingposition):
 
 
 def ordering_etree(tree):
-    """Build the ordering of the tree by iterating over the elements in the tree"""
-#    #this can be made much more effecient by using a stack and 
-#    #building each position while iterating, instead of calling 
-#    #Element.position each time, which iterates over the 
-#    #tree for each element. 
-#    result = [] 
-#    
-#    if isinstance(tree, lxml.etree._ElementTree):
-#        root = tree.getroot()
-#    else:
-#        root = tree
-#    
-#    for i in root.iter():
-#        result.append(Element.position(i, root=root))
-#    return result
-
-    log = logging.getLogger()
-    ordering = []
-    currentposition = []
-    stack = []
-    for element in tree.iter():
-        #log.debug('found element: %s' % element.tag)
-        if len(stack) == 0:
-            stack = [element]
-            currentposition = [1]
-            ordering = [copy.copy(currentposition)]
-            #log.debug('\tcurrentposition: %s' % str(currentposition))
-            #log.debug('\tstack: %s' % str(stack))
-            continue
-        
-        #search backward in stack until parent found. 
-        while len(stack) > 0:
-            if stack[-1] is element.getparent():
-                break
-            stack.pop(-1)
-        else:
-            #done
-            break
-        stack.append(element)
-        
-        if len(stack) > len(currentposition):
-            currentposition.append(1)
-        elif len(stack) < len(currentposition):
-            currentposition = currentposition[:len(stack)]
-            currentposition[-1] += 1
-        elif len(stack) == len(currentposition):
-            currentposition[-1] += 1
-        
-        ordering.append(copy.copy(currentposition))
-        #log.debug('\tcurrentposition: %s' % str(currentposition))
-        #log.debug('\tstack: %s' % str(stack))
-    
-    #log.debug('ordering:')
-#    for i in ordering: 
-        #log.debug('\t%s' % str(i))
-    return ordering
+    """Build the ordering of the tree by iterating over the elements in the tree. 
+    The ordering is returned as an Ordering, see Ordering.py, which builds the 
+    positions when they are used."""
+    return Ordering.fromTree(tree)
 
 
 
@@ -576,14 +613,266 @@ def getNode(tree, position):
         
         
 
-def metric(tree1, tree2):
+def metric(tree1, tree2, limit=None, digests=None):
     """Metric of tree1 and tree2 is defined as the number of non-unit nodes
     in tree1 - tree2. 
     
-    This function satisfies all the conditions of a metric. """
-    treecopy = copy.deepcopy(tree2)
-    add(invert(treecopy), tree1)
-    return countNonUnitNodes(treecopy)
+    This function satisfies all the conditions of a metric. 
+    
+    tree1 - tree2 is not built. Both trees are walked together and the difference
+    is computed one position at a time, so neither tree is copied or modified and
+    the memory used is proportional to the depth of the trees. Trailing units that
+    add() would prune are unit nodes, so they are not counted either way. 
+    
+    If limit is given, the walk stops as soon as more than limit non-unit nodes have
+    been counted and limit + 1 is returned. The result is then exact when it is less 
+    than or equal to limit, so metric(tree1, tree2, limit=k) <= k can be tested 
+    without computing the whole distance. 
+    
+    digests is an optional pair of the exact digests of the trees, or of trees that 
+    have them as subtrees, see Digest.digests(). Subtrees with the same digests are
+    then skipped. The digests must be computed again after a tree is modified. """
+    
+    if isinstance(tree1, lxml.etree._Element):
+        root1 = tree1
+    else:
+        root1 = tree1.getroot()
+    if isinstance(tree2, lxml.etree._Element):
+        root2 = tree2
+    else:
+        root2 = tree2.getroot()
+    
+    if limit is None:
+        exceeded = None
+    else:
+        exceeded = limit + 1
+    
+    #subtrees with the same exact digests are the same, so their difference is all 
+    #unit nodes, see Digest.py
+    if digests is None:
+        digests1 = digests2 = {}
+    else:
+        digests1, digests2 = digests
+        if digests1[root1] == digests2[root2]:
+            return 0
+    
+    count = 0
+    if not _isUnit(*_difference(root1, root2)):
+        count += 1
+    
+    #same walk as add(), each entry on the stack is the next child of each tree to visit
+    stack = [[_firstChild(root1), _firstChild(root2)]]
+    while stack:
+        if count == exceeded:
+            return exceeded
+        
+        frame = stack[-1]
+        child1, child2 = frame
+        
+        if child1 is not None and child2 is not None:
+            frame[0] = child1.getnext()
+            frame[1] = child2.getnext()
+            digest1 = digests1.get(child1)
+            if (digest1 is not None) and (digest1 == digests2.get(child2)):
+                continue
+            if not _isUnit(*_difference(child1, child2)):
+                count += 1
+            stack.append([_firstChild(child1), _firstChild(child2)])
+            
+        elif child1 is not None:
+            #only in tree1, the difference is the subtree itself
+            frame[0] = child1.getnext()
+            for i in child1.iter():
+                if not _isUnit(i.tag, i.attrib, i.text, i.tail):
+                    count += 1
+                    if count == exceeded:
+                        return exceeded
+            
+        elif child2 is not None:
+            #only in tree2, the difference is the inverse of the subtree
+            frame[1] = child2.getnext()
+            for i in child2.iter():
+                if not _isUnit(*_inverse(i)):
+                    count += 1
+                    if count == exceeded:
+                        return exceeded
+        
+        else:
+            stack.pop()
+            
+    return count
+
+
+
+def metric_within(tree1, tree2, k):
+    """Return metric(tree1, tree2) if it is less than or equal to k, or k + 1 if
+    it is greater than k. The trees are only walked until more than k non-unit
+    nodes have been found, see metric(). 
+    
+    Use this when only metric(tree1, tree2) <= k is needed, for example when 
+    screening a document against many candidates. """
+    return metric(tree1, tree2, limit=k)
+
+
+
+def distance_matrix(trees, workers=None, filename=None, dtype='int32'):
+    """Return the matrix of metric() between every pair of trees. 
+    
+    trees is a list of file names or lxml trees. The matrix is a numpy array 
+    memory-mapped to filename, in .npy format so it can be reopened with 
+    numpy.load(filename, mmap_mode='r'). Large matrices therefore do not need to fit 
+    in memory. If filename is None the matrix is written to a new temporary file, 
+    whose name is the filename attribute of the result. Either way the caller owns 
+    the file and removes it when it is no longer needed. 
+    
+    metric() is symmetric, so only the pairs in the upper triangle are computed, 
+    and each distance is written to [i, j] and [j, i]. The diagonal is left at 0. 
+    These pairs are spread over a pool of worker processes, one row at a time. Each 
+    worker parses all the trees once when it starts and writes its results straight
+    into the memory-mapped file. workers defaults to the number of cpus, workers=1 
+    computes the matrix in this process. 
+    
+    This needs numpy. """
+    
+    import numpy.lib.format, multiprocessing, tempfile
+    
+    #trees are passed to the workers as file names or serialized xml, lxml trees
+    #cannot be pickled
+    sources = []
+    for tree in trees:
+        if isinstance(tree, (lxml.etree._ElementTree, lxml.etree._Element)):
+            sources.append(lxml.etree.tostring(tree, encoding='utf-8'))
+        else:
+            sources.append(tree)
+    
+    if filename is None:
+        f = tempfile.NamedTemporaryFile(suffix='.npy', delete=False)
+        f.close()
+        filename = f.name
+    
+    matrix = numpy.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=(len(sources), len(sources)))
+    matrix.flush()
+    
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    
+    #rows are handed out longest first so the workers finish together
+    rows = range(len(sources) - 1)
+    if workers == 1 or len(sources) < 3:
+        _distanceMatrixInit(sources, filename)
+        for row in rows:
+            _distanceMatrixRow(row)
+        _distanceMatrixInit(None, None)
+    else:
+        pool = multiprocessing.Pool(workers, _distanceMatrixInit, (sources, filename))
+        try:
+            for row in pool.imap_unordered(_distanceMatrixRow, rows):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+    
+    #reopen the file now that every worker has flushed its rows
+    del matrix
+    return numpy.lib.format.open_memmap(filename, mode='r+')
+
+
+
+#state of the distance_matrix() workers, set by _distanceMatrixInit()
+_matrixtrees = None
+_matrix = None
+
+def _distanceMatrixInit(sources, filename):
+    global _matrixtrees, _matrix
+    if sources is None:
+        _matrixtrees = None
+        _matrix = None
+        return
+    
+    import numpy.lib.format
+    
+    _matrixtrees = []
+    for source in sources:
+        if isinstance(source, bytes):
+            _matrixtrees.append(lxml.etree.fromstring(source))
+        else:
+            _matrixtrees.append(lxml.etree.parse(source))
+    _matrix = numpy.lib.format.open_memmap(filename, mode='r+')
+    
+    
+def _distanceMatrixRow(row):
+    """Compute the distances between tree row and the trees after it, and mirror
+    them below the diagonal, see distance_matrix()"""
+    tree1 = _matrixtrees[row]
+    for column in range(row + 1, len(_matrixtrees)):
+        d = metric(tree1, _matrixtrees[column])
+        _matrix[row, column] = d
+        _matrix[column, row] = d
+    _matrix.flush()
+    return row
+
+
+
+def dump_binary(tree, filename):
+    """Write the tree to a file in the binary format of Packed/Binary.py, which
+    load_binary() reads without parsing xml. This needs numpy. """
+    import TreeGroup.Packed.PackedTree as PackedTree
+    import TreeGroup.Packed.Binary as Binary
+    
+    Binary.dump(PackedTree.pack(tree), filename, Binary.KIND_TREE)
+    
+    
+def load_binary(filename, packed=False):
+    """Read a tree written by dump_binary() and return it as an lxml element. 
+    
+    The file is mapped in memory. If packed is True the PackedTree is returned 
+    instead, its strings are a view of the mapped file so they are not copied, and 
+    the operations of Packed/PackedTree.py can be used on it directly. Building the 
+    lxml element takes about as long as parsing the xml, loading the PackedTree 
+    takes a small fraction of that. This needs numpy. """
+    import TreeGroup.Packed.PackedTree as PackedTree
+    import TreeGroup.Packed.Binary as Binary
+    
+    result, kind, extras = Binary.load(filename)
+    if kind != Binary.KIND_TREE:
+        raise ValueError('%s: not a tree' % filename)
+    if packed:
+        return result
+    return PackedTree.unpack(result)
+
+
+
+def _inverse(element):
+    """Return the tag, attributes, text and tail of the inverse of the element, 
+    without modifying it. See Element.invert()"""
+    return (Tag.tagInverse(element.tag), 
+            Attrib.attribInverse(dict(element.attrib)), 
+            Text.textInverse(element.text), 
+            Text.textInverse(element.tail))
+    
+
+
+def _difference(element1, element2):
+    """Return the tag, attributes, text and tail of element1 - element2, without
+    modifying either element. This is the node metric() counts, computed the same 
+    way as Element.add(Element.invert(element2), element1)."""
+    tag2, attrib2, text2, tail2 = _inverse(element2)
+    return (Tag.addTags(tag2, element1.tag), 
+            Attrib.addAttribs(attrib2, dict(element1.attrib)), 
+            Text.addText(text2, element1.text), 
+            Text.addText(tail2, element1.tail))
+
+
+
+def _isUnit(tag, attrib, text, tail):
+    """Return True if a node with this tag, attributes, text and tail is counted 
+    as a unit node by countNonUnitNodes()"""
+    if not (tag == '_' and len(attrib) == 0):
+        return False
+    alltext = ''
+    if text: alltext = alltext.join(text)
+    if tail: alltext = alltext.join(tail)
+    return (alltext == '') or alltext.isspace()
 
 
 
@@ -600,13 +889,9 @@ def countNonUnitNodes(tree):
 #    #log.debug('%s' % lxml.etree.tostring(t))
     count = 0
     for i in t.iter():
-        alltext = ''
-        if i.text: alltext = alltext.join(i.text)
-        if i.tail: alltext = alltext.join(i.tail)
-        if i.tag == '_' and len(i.attrib) == 0 and re.search(r'^\s*$', alltext): continue
+        if _isUnit(i.tag, i.attrib, i.text, i.tail): continue
         else: count += 1
     return count
 
 
 
-
@@ -0,0 +1,95 @@
+import unittest, os.path, sys, logging, glob
+
+import lxml.etree, copy
+
+from . import Delta
+from . import Tree
+
+
+
+def _parse(filenames):
+    return [lxml.etree.parse(f).getroot() for f in filenames if 'donotuse' not in f]
+
+
+
+class test_SparseDelta(unittest.TestCase):
+    """Test the sparse deltas against the operations in Tree"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        #trees in the form stored by the deltas, see Delta.py
+        self.trees = [Delta.toTree(Delta.fromTree(tree)) for tree in _parse(sorted(glob.glob(os.path.join(self.testfilesdir, '*.xml'))))]
+        self.log = logging.getLogger()
+
+    def test_FromTreeToTree(self):
+        for tree in self.trees:
+            expected = lxml.etree.tostring(tree)
+            result = lxml.etree.tostring(Delta.toTree(Delta.fromTree(tree)))
+            self.assertEqual(result, expected, "toTree(fromTree()) returned %s, expected %s" % (result, expected))
+
+    def test_OnlyNonUnitNodes(self):
+        tree = lxml.etree.fromstring('<_><_/><_>  <_ id="_"/></_><a/></_>')
+        delta = Delta.fromTree(tree)
+        self.assertEqual(list(delta.nodes.keys()), [(1, 3)])
+
+    def test_Compose(self):
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                expected = Delta.fromTree(Tree.add(copy.deepcopy(tree1), tree2))
+                result = Delta.compose(Delta.fromTree(tree1), Delta.fromTree(tree2))
+                self.assertEqual(result, expected, "compose() returned %s, expected %s" % (result.nodes, expected.nodes))
+
+    def test_Invert(self):
+        for tree in self.trees:
+            expected = Delta.fromTree(Tree.invert(copy.deepcopy(tree)))
+            result = Delta.fromTree(Delta.toTree(Delta.invert(Delta.fromTree(tree))))
+            self.assertEqual(result, expected, "invert() returned %s, expected %s" % (result.nodes, expected.nodes))
+            self.assertEqual(len(Delta.compose(Delta.fromTree(tree), Delta.invert(Delta.fromTree(tree)))), 0)
+
+    def test_Apply(self):
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                delta = Delta.difference(tree1, tree2)
+                expected = Delta.fromTree(Tree.add(copy.deepcopy(tree2), Delta.toTree(delta)))
+                result = Delta.fromTree(Delta.apply(delta, copy.deepcopy(tree2)))
+                self.assertEqual(result, expected, "apply() returned %s, expected %s" % (result.nodes, expected.nodes))
+
+    def test_ApplyOnlyChangesDelta(self):
+        tree = lxml.etree.fromstring('<a><b>text  </b><c><d>one</d><d>two</d></c></a>')
+        edited = copy.deepcopy(tree)
+        edited[1][1].text = 'three'
+        delta = Delta.difference(edited, tree)
+        self.assertEqual(list(delta.nodes.keys()), [(1, 2, 2)])
+        Delta.apply(delta, tree)
+        self.assertEqual(tree[1][1].text, 'three')
+        self.assertEqual(tree[0].text, 'text  ', "apply() changed a node that is not in the delta")
+
+    def test_ApplyPrunes(self):
+        tree = lxml.etree.fromstring('<a><b/><c><d>one</d></c></a>')
+        delta = Delta.difference(lxml.etree.fromstring('<a><b/></a>'), tree)
+        Delta.apply(delta, tree)
+        result = lxml.etree.tostring(tree)
+        self.assertEqual(result, b'<a><b/></a>', "apply() returned %s, expected %s" % (result, b'<a><b/></a>'))
+
+    def test_ApplyAppends(self):
+        tree = lxml.etree.fromstring('<a><b/></a>')
+        delta = Delta.fromTree(lxml.etree.fromstring('<_><_/><_><_/><e/></_></_>'))
+        Delta.apply(delta, tree)
+        result = lxml.etree.tostring(tree)
+        self.assertEqual(result, b'<a><b/><_><_/><e/></_></a>', "apply() returned %s, expected %s" % (result, b'<a><b/><_><_/><e/></_></a>'))
+
+    def test_ApplyRollback(self):
+        tree = copy.deepcopy(self.trees[0])
+        expected = lxml.etree.tostring(tree)
+        with Tree.transaction(tree) as journal:
+            Delta.apply(Delta.fromTree(self.trees[-1]), tree)
+            journal.rollback()
+        result = lxml.etree.tostring(tree)
+        self.assertEqual(result, expected, "rollback() left %s, expected %s" % (result, expected))
+
+    def test_NotInDomain_ShouldFail(self):
+        tree = lxml.etree.fromstring('<a><b>text</b></a>')
+        delta = Delta.SparseDelta({(1,): ('a', {}, None, None), (1, 2): ('c', {}, 'café', None)})
+        self.assertRaises(ValueError, Delta.apply, delta, tree)
+        self.assertEqual(lxml.etree.tostring(tree), b'<a><b>text</b></a>')
@@ -0,0 +1,77 @@
+import unittest, os.path, sys, logging, glob
+
+import lxml.etree, copy
+
+from . import Digest
+from . import Tree
+
+
+
+class test_Digest(unittest.TestCase):
+    """Test the digests against Tree.equal() and Tree.metric()"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        self.trees = [lxml.etree.parse(f).getroot() for f in sorted(glob.glob(os.path.join(self.testfilesdir, '*.xml'))) if 'donotuse' not in f]
+        self.log = logging.getLogger()
+
+    def test_EqualRules(self):
+        tree1 = lxml.etree.fromstring('<a x="1" y="_"><__b>text  </__b><c/></a>')
+        tree2 = lxml.etree.fromstring('<a x="1"><b>text</b><c></c></a>')
+        self.assertEqual(Digest.digest(tree1), Digest.digest(tree2))
+        self.assertNotEqual(Digest.digest(tree1, exact=True), Digest.digest(tree2, exact=True))
+        tree3 = lxml.etree.fromstring('<a x="2"><b>text</b><c/></a>')
+        self.assertNotEqual(Digest.digest(tree1), Digest.digest(tree3))
+        self.assertEqual(Digest.digest(tree1, ignoreattrs=True), Digest.digest(tree3, ignoreattrs=True))
+
+    def test_Shape(self):
+        tree1 = lxml.etree.fromstring('<a><b/><b><b/></b></a>')
+        tree2 = lxml.etree.fromstring('<a><b><b/></b><b/></a>')
+        self.assertNotEqual(Digest.digest(tree1), Digest.digest(tree2))
+
+    def test_Equal(self):
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                expected = Tree.equal(tree1, tree2)
+                result = Tree.equal(tree1, tree2, digests=(Digest.digests(tree1), Digest.digests(tree2)))
+                self.assertEqual(result, expected, "equal() returned %s, expected %s" % (result, expected))
+
+    def test_Metric(self):
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                expected = Tree.metric(tree1, tree2)
+                result = Tree.metric(tree1, tree2, digests=(Digest.digests(tree1, exact=True), Digest.digests(tree2, exact=True)))
+                self.assertEqual(result, expected, "metric() returned %i, expected %i" % (result, expected))
+
+    def test_MetricSkipsEqualSubtrees(self):
+        tree1 = lxml.etree.fromstring('<a><b><c>one</c></b><b><c>two</c></b></a>')
+        tree2 = copy.deepcopy(tree1)
+        tree2[1][0].text = 'three'
+        digests1 = Digest.digests(tree1, exact=True)
+        digests2 = Digest.digests(tree2, exact=True)
+        self.assertEqual(digests1[tree1[0]], digests2[tree2[0]])
+        self.assertNotEqual(digests1[tree1[1]], digests2[tree2[1]])
+        self.assertEqual(Tree.metric(tree1, tree2, digests=(digests1, digests2)), 1)
+
+    def test_Subtree(self):
+        #the digests of a tree can be used with its subtrees
+        tree = self.trees[0]
+        digests = Digest.digests(tree)
+        self.assertEqual(digests[tree[0]], Digest.digest(tree[0]))
+        other = copy.deepcopy(tree)
+        self.assertTrue(Tree.equal(tree[0], other[0], digests=(digests, Digest.digests(other))))
+
+    def test_NothingKept(self):
+        #modified trees are compared as they are, unless stale digests are passed
+        tree1 = lxml.etree.fromstring('<a><b>one</b></a>')
+        tree2 = copy.deepcopy(tree1)
+        digests = (Digest.digests(tree1), Digest.digests(tree2))
+        self.assertTrue(Tree.equal(tree1, tree2, digests=digests))
+        tree2[0].text = 'two'
+        self.assertFalse(Tree.equal(tree1, tree2))
+        self.assertEqual(Tree.metric(tree1, tree2), 1)
+
+    def test_Comment_ShouldFail(self):
+        tree = lxml.etree.fromstring('<a><!-- comment --></a>')
+        self.assertRaises(TypeError, Digest.digests, tree)
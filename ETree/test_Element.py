@@ -1,6 +1,12 @@
 import unittest, os.path, sys, logging
 
-import lxml.etree
+import lxml.etree, copy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from . import Element
 
     
@@ -296,6 +302,53 @@ class test_invert(unittest.TestCase):
     
     
 
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class test_batches(unittest.TestCase):
+    """Test the invertAll() and addAll() functions against invert() and add()"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Node')
+        self.elements = []
+        for name in ('NodeTestFile_equal.xml', 'NodeTestFile_inverse.xml'):
+            root = lxml.etree.parse(os.path.join(testfilesdir, name)).getroot()
+            self.elements.extend([element for element in root.iter() if isinstance(element.tag, str)])
+        element = lxml.etree.Element('p', {'id': 'abc', 'x': '_'})
+        element.text = 'some\ntext  '
+        element.tail = '\t'
+        self.elements.append(element)
+        #all the elements are processed together, whatever their number
+        self.batchsize = Element.BATCHSIZE
+        Element.BATCHSIZE = 0
+
+    def tearDown(self):
+        Element.BATCHSIZE = self.batchsize
+
+    def copies(self):
+        return [copy.deepcopy(element) for element in self.elements]
+
+    def test_InvertAll(self):
+        expected = [lxml.etree.tostring(Element.invert(element)) for element in self.copies()]
+        result = [lxml.etree.tostring(element) for element in Element.invertAll(self.copies())]
+        self.assertEqual(result, expected, "invertAll() returned %s, expected %s" % (result, expected))
+
+    def test_AddAll(self):
+        pairs = list(zip(self.copies(), reversed(self.copies())))
+        expected = [lxml.etree.tostring(Element.add(element1, element2)) for element1, element2 in pairs]
+        pairs = list(zip(self.copies(), reversed(self.copies())))
+        result = [lxml.etree.tostring(element1) for element1, element2 in Element.addAll(pairs)]
+        self.assertEqual(result, expected, "addAll() returned %s, expected %s" % (result, expected))
+
+    def test_NotInDomain_ShouldFail(self):
+        elements = self.copies()
+        elements[0].text = 'café'
+        before = [lxml.etree.tostring(element) for element in elements]
+        self.assertRaises(ValueError, Element.invertAll, elements)
+        #nothing is modified before all the results are computed
+        self.assertEqual([lxml.etree.tostring(element) for element in elements], before)
+
+
+
 class test_position(unittest.TestCase):
     """Test the Node.position() function"""
         
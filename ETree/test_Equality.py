@@ -0,0 +1,70 @@
+import unittest, os.path, sys, logging
+
+import lxml.etree, copy
+
+from . import Equality
+from . import Tree
+from . import Element
+
+
+
+class test_EqualityPolicy(unittest.TestCase):
+    """Test the comparison of trees under the policies"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.log = logging.getLogger()
+
+    def assertEqualTrees(self, string1, string2, expected, policy=Equality.DEFAULT):
+        tree1 = lxml.etree.fromstring(string1)
+        tree2 = lxml.etree.fromstring(string2)
+        result = Tree.equal(tree1, tree2, policy=policy)
+        self.assertEqual(result, expected, "equal(%s, %s) returned %s, expected %s" % (string1, string2, result, expected))
+
+    def test_Default(self):
+        self.assertEqualTrees('<a x="1" y="_"><__b>text  </__b></a>', '<a x="1"><b>text</b></a>', True)
+        self.assertEqualTrees('<a><b> text</b></a>', '<a><b>text</b></a>', False)
+        self.assertEqualTrees('<a><b/><b/></a>', '<a><b><b/></b></a>', False)
+        self.assertEqualTrees('<a><b/></a>', '<a><b/><b/></a>', False)
+
+    def test_Attributes(self):
+        policy = Equality.EqualityPolicy(ignoredattributes=['id'])
+        self.assertEqualTrees('<a id="1" x="1"/>', '<a id="2" x="1"/>', True, policy)
+        self.assertEqualTrees('<a id="1" x="1"/>', '<a id="1" x="2"/>', False, policy)
+        self.assertEqualTrees('<a x="1"/>', '<a x="2"/>', True, Equality.IGNOREATTRS)
+
+    def test_Whitespace(self):
+        self.assertEqualTrees('<a>  some\n text </a>', '<a>some text</a>', True, Equality.EqualityPolicy(whitespace='normalize'))
+        self.assertEqualTrees('<a>  text </a>', '<a>text</a>', True, Equality.EqualityPolicy(whitespace='strip'))
+        self.assertEqualTrees('<a>text </a>', '<a>text</a>', False, Equality.EqualityPolicy(whitespace='exact'))
+        self.assertEqualTrees('<a></a>', '<a/>', True, Equality.EqualityPolicy(whitespace='exact'))
+
+    def test_Content(self):
+        self.assertEqualTrees('<a x="1"><b>one</b></a>', '<c><d>one</d></c>', True, Equality.EqualityPolicy(content='text'))
+        self.assertEqualTrees('<a x="1"><b>one</b></a>', '<a><b>two</b></a>', True, Equality.EqualityPolicy(content='structure'))
+        self.assertEqualTrees('<a><b>one</b></a>', '<a><c>one</c></a>', False, Equality.EqualityPolicy(content='structure'))
+
+    def test_Comments(self):
+        #the tails of comments and processing instructions are part of the text
+        self.assertEqualTrees('<a><!--c-->x<b/></a>', '<a><b/></a>', False)
+        self.assertEqualTrees('<a><!--c-->x<b/></a>', '<a>x<b/></a>', True)
+        self.assertEqualTrees('<a><b/>y<?p i?>z</a>', '<a><b/>yz</a>', True)
+        self.assertEqualTrees('<a><b/><?p i?>z</a>', '<a><b/></a>', False)
+        self.assertEqualTrees('<a>x<!--c-->y</a>', '<a>xy</a>', True, Equality.EqualityPolicy(content='text'))
+
+    def test_DoesNotModify(self):
+        tree1 = lxml.etree.fromstring('<a x="_" y=""><b z="_"/></a>')
+        tree2 = lxml.etree.fromstring('<a><b/></a>')
+        self.assertTrue(Tree.equal(tree1, tree2))
+        self.assertTrue(Element.equal(tree1[0], tree2[0]))
+        self.assertEqual(lxml.etree.tostring(tree1), b'<a x="_" y=""><b z="_"/></a>', "equal() modified the attributes")
+
+    def test_Subtree(self):
+        tree1 = lxml.etree.fromstring('<a><b><c/></b><d/></a>')
+        tree2 = lxml.etree.fromstring('<b><c/></b>')
+        self.assertTrue(Tree.equal(tree1[0], tree2))
+        self.assertTrue(Tree.equal(lxml.etree.ElementTree(tree2), tree1[0]))
+
+    def test_Unknown_ShouldFail(self):
+        self.assertRaises(ValueError, Equality.EqualityPolicy, whitespace='collapse')
+        self.assertRaises(ValueError, Equality.EqualityPolicy, content='tags')
@@ -0,0 +1,111 @@
+import unittest, os.path, sys, logging, glob
+
+import lxml.etree, copy
+
+from . import PositionIndex
+from . import Tree
+from . import Element
+from . import Delta
+
+
+
+class test_PositionIndex(unittest.TestCase):
+    """Test the index against Element.position() and Tree.getNode()"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        self.trees = [lxml.etree.parse(f).getroot() for f in sorted(glob.glob(os.path.join(self.testfilesdir, '*.xml'))) if 'donotuse' not in f]
+        self.log = logging.getLogger()
+
+    def assertIndexed(self, index, root):
+        """Check every element of the tree against the index"""
+        count = 0
+        for element in root.iter():
+            expected = tuple(Element.position(element, root=root))
+            result = index.position(element)
+            self.assertEqual(result, expected, "position() returned %s, expected %s" % (result, expected))
+            self.assertTrue(index.element(expected) is Tree.getNode(root, list(expected)))
+            count += 1
+        self.assertEqual(len(index), count, "index has %i elements, expected %i" % (len(index), count))
+
+    def test_Build(self):
+        for tree in self.trees:
+            self.assertIndexed(PositionIndex.PositionIndex(tree), tree)
+
+    def test_Batch(self):
+        tree = lxml.etree.fromstring('<a><b/><c><d/></c></a>')
+        index = PositionIndex.PositionIndex(lxml.etree.ElementTree(tree))
+        result = index.elements([(1, 2, 1), [1, 1], (1, 3)])
+        expected = [tree[1][0], tree[0], None]
+        self.assertEqual(result, expected, "elements() returned %s, expected %s" % (result, expected))
+        result = index.positions([tree[1], lxml.etree.Element('e')])
+        self.assertEqual(result, [(1, 2), None], "positions() returned %s, expected %s" % (result, [(1, 2), None]))
+
+    def test_Subtree(self):
+        tree = lxml.etree.fromstring('<a><b/><c><d/><e/></c></a>')
+        index = PositionIndex.PositionIndex(tree[1])
+        self.assertEqual(index.position(tree[1][1]), (1, 2))
+        self.assertFalse(tree[0] in index)
+
+    def test_UpdatedByAdd(self):
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                result = copy.deepcopy(tree1)
+                index = PositionIndex.PositionIndex(result)
+                Tree.add(result, tree2)
+                self.assertIndexed(index, result)
+
+    def test_UpdatedByApply(self):
+        tree1, tree2 = self.trees[0], self.trees[-1]
+        delta = Delta.difference(tree1, tree2)
+        result = copy.deepcopy(tree2)
+        index = PositionIndex.PositionIndex(result)
+        Delta.apply(delta, result, index=index)
+        self.assertIndexed(index, result)
+        expected = Delta.apply(delta, copy.deepcopy(tree2))
+        self.assertEqual(lxml.etree.tostring(result), lxml.etree.tostring(expected))
+
+    def test_UpdatedByRollback(self):
+        result = copy.deepcopy(self.trees[0])
+        index = PositionIndex.PositionIndex(result)
+        with Tree.transaction(result) as journal:
+            Tree.add(result, self.trees[-1])
+            journal.rollback()
+        self.assertIndexed(index, result)
+
+    def test_Rebuild(self):
+        tree = lxml.etree.fromstring('<a><b/></a>')
+        index = PositionIndex.PositionIndex(tree)
+        tree.insert(0, lxml.etree.Element('c'))
+        index.rebuild()
+        self.assertIndexed(index, tree)
+
+    def test_OtherTrees(self):
+        #only the indexes of the tree that changes are updated
+        calls = []
+        class CountingIndex(PositionIndex.PositionIndex):
+            def appended(self, parent, child):
+                calls.append(self)
+                PositionIndex.PositionIndex.appended(self, parent, child)
+        tree1 = lxml.etree.fromstring('<a><b/></a>')
+        tree2 = lxml.etree.fromstring('<a><b/></a>')
+        index1 = CountingIndex(tree1)
+        index2 = CountingIndex(tree2[0])
+        Tree.add(tree2, lxml.etree.fromstring('<a><b/><c/></a>'))
+        self.assertEqual(calls, [index2])
+        self.assertIndexed(index1, tree1)
+
+    def test_Released(self):
+        tree = lxml.etree.fromstring('<a><b/></a>')
+        index = PositionIndex.PositionIndex(tree)
+        key = id(tree)
+        self.assertTrue(key in PositionIndex._indexes)
+        del index
+        self.assertFalse(key in PositionIndex._indexes)
+
+    def test_NotInTree_ShouldFail(self):
+        tree = lxml.etree.fromstring('<a><b/></a>')
+        index = PositionIndex.PositionIndex(tree)
+        self.assertRaises(KeyError, index.position, lxml.etree.Element('b'))
+        self.assertRaises(KeyError, index.element, (1, 2))
@@ -1,7 +1,12 @@
-import unittest, os.path, sys, logging
+import unittest, os.path, sys, logging, tempfile
 
 import lxml.etree, copy
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from . import Tree    
 
 from . import Element
@@ -37,6 +42,102 @@ class test_metric(unittest.TestCase):
 
     
 
+    def test_InputsUnchanged(self):
+        tree1 = lxml.etree.parse(os.path.join(self.testfilesdir, 'TreeTestFile_metric3-1.xml'))
+        tree2 = lxml.etree.parse(os.path.join(self.testfilesdir, 'TreeTestFile_metric3-2.xml'))
+        before1 = lxml.etree.tostring(tree1)
+        before2 = lxml.etree.tostring(tree2)
+        Tree.metric(tree1, tree2)
+        self.assertEqual(before1, lxml.etree.tostring(tree1), 'metric() modified tree1')
+        self.assertEqual(before2, lxml.etree.tostring(tree2), 'metric() modified tree2')
+        
+    def test_SameAsDifferenceTree(self):
+        #the metric is the number of non-unit nodes in tree1 - tree2
+        addfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        filenames = ['TreeTestFile_add%i.xml' % i for i in range(1, 17)]
+        for filename1 in filenames:
+            for filename2 in filenames:
+                tree1 = lxml.etree.parse(os.path.join(addfilesdir, filename1))
+                tree2 = lxml.etree.parse(os.path.join(addfilesdir, filename2))
+                difference = Tree.add(Tree.invert(copy.deepcopy(tree2)), tree1)
+                expecteddiff = Tree.countNonUnitNodes(difference)
+                diff = Tree.metric(tree1, tree2)
+                self.assertEqual(diff, expecteddiff, 'metric(%s, %s) returned %i, expected %i' % (filename1, filename2, diff, expecteddiff))
+
+    
+
+    def test_Limit(self):
+        tree1 = lxml.etree.parse(os.path.join(self.testfilesdir, 'TreeTestFile_metric3-1.xml'))
+        tree2 = lxml.etree.parse(os.path.join(self.testfilesdir, 'TreeTestFile_metric3-2.xml'))
+        for limit in range(0, 7):
+            expecteddiff = min(4, limit + 1)
+            diff = Tree.metric(tree1, tree2, limit=limit)
+            self.assertEqual(diff, expecteddiff, 'metric(limit=%i) returned %i, expected %i' % (limit, diff, expecteddiff))
+            diff = Tree.metric_within(tree1, tree2, limit)
+            self.assertEqual(diff, expecteddiff, 'metric_within(%i) returned %i, expected %i' % (limit, diff, expecteddiff))
+            
+    def test_LimitExceededEarly(self):
+        #the walk should stop long before the end of the trees
+        tree1 = lxml.etree.Element('a')
+        tree2 = lxml.etree.Element('a')
+        for i in range(1000):
+            lxml.etree.SubElement(tree2, 'b')
+        #not in the domain, inverting it would fail if it was reached
+        lxml.etree.SubElement(tree2, 'c', {'id': '\u00e9'}) 
+        self.assertRaises(ValueError, Tree.metric, tree1, tree2)
+        diff = Tree.metric_within(tree1, tree2, 10)
+        self.assertEqual(diff, 11, 'metric_within() returned %i, expected %i' % (diff, 11))
+
+    
+
+class test_distance_matrix(unittest.TestCase):
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        
+        testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        self.filenames = [os.path.join(testfilesdir, 'TreeTestFile_add%i.xml' % i) for i in range(1, 11)]
+        self.tempdir = tempfile.TemporaryDirectory()
+        
+    def tearDown(self):
+        self.tempdir.cleanup()
+        
+    def assertMatrix(self, matrix, trees):
+        self.assertEqual(matrix.shape, (len(trees), len(trees)))
+        for i, tree1 in enumerate(trees):
+            for j, tree2 in enumerate(trees):
+                self.assertEqual(matrix[i, j], Tree.metric(tree1, tree2), 'distance_matrix()[%i, %i] is %i, expected %i' % (i, j, matrix[i, j], Tree.metric(tree1, tree2)))
+    
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_Files(self):
+        filename = os.path.join(self.tempdir.name, 'matrix.npy')
+        matrix = Tree.distance_matrix(self.filenames, workers=2, filename=filename)
+        self.assertMatrix(matrix, [lxml.etree.parse(f) for f in self.filenames])
+        #the file can be reopened
+        self.assertTrue((numpy.load(filename, mmap_mode='r') == matrix).all())
+        
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_Trees(self):
+        trees = [lxml.etree.parse(f) for f in self.filenames[:5]] + [lxml.etree.fromstring('<c><b id="1"/></c>')]
+        filename = os.path.join(self.tempdir.name, 'matrix.npy')
+        matrix = Tree.distance_matrix(trees, workers=1, filename=filename)
+        self.assertMatrix(matrix, trees)
+        
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_NoFilename(self):
+        trees = [lxml.etree.parse(f) for f in self.filenames[:4]]
+        tempdir = tempfile.tempdir
+        tempfile.tempdir = self.tempdir.name
+        try:
+            matrix = Tree.distance_matrix(trees, workers=1)
+        finally:
+            tempfile.tempdir = tempdir
+        self.assertMatrix(matrix, trees)
+        #the temporary file belongs to the caller
+        self.assertEqual(os.path.dirname(matrix.filename), os.path.realpath(self.tempdir.name))
+        self.assertTrue((numpy.load(matrix.filename, mmap_mode='r') == matrix).all())
+
+
+
 class test_countNonUnitNodes(unittest.TestCase):
     def setUp(self):
         """set up data used in the tests, called before each test function execution"""
@@ -269,6 +370,20 @@ class test_ordering(unittest.TestCase):
             self.assertTrue(Element.equal(result, expectednodes[index]), 'ordering returned a list with incorrect node position at index %i: expected %s %s, got %s %s,' \
                             % (index, expectednodes[index].tag, str(expectednodes[index].attrib), result.tag, str(result.attrib)))
 
+    def test_Iter(self):
+        result = list(self.treeOrdering)
+        self.assertEqual(result, self.expectedTreeOrdering, "list(ordering()) returned %s, expected %s" % (result, self.expectedTreeOrdering))
+        self.assertEqual(self.subtreeOrdering, self.expectedSubtreeOrdering)
+        self.assertEqual(self.treeOrdering[-1], [1, 2, 3, 1, 1])
+        self.assertEqual(self.treeOrdering[1:3], [[1, 1], [1, 1, 1]])
+
+    def test_Compare(self):
+        self.assertTrue(self.treeOrdering == Tree.ordering(copy.deepcopy(self.testtree)))
+        self.assertFalse(self.treeOrdering == self.subtreeOrdering)
+        tree = copy.deepcopy(self.testtree)
+        tree.getroot()[0].append(lxml.etree.Element('extra'))
+        self.assertFalse(self.treeOrdering == Tree.ordering(tree))
+
 
 
 
@@ -856,6 +971,55 @@ class test_add(unittest.TestCase):
         
         
         
+    def test_LargeTrees(self):
+        #wide and deep trees, the inverse of the tree should add to the unit 
+        tree1 = lxml.etree.Element('dita')
+        for i in range(2000):
+            child = lxml.etree.SubElement(tree1, 'p', {'id': 'p%i' % i})
+            child.text = 'Paragraph %i' % i
+        current = tree1
+        for i in range(200):
+            current = lxml.etree.SubElement(current, 'section')
+        tree2 = Tree.invert(copy.deepcopy(tree1))
+        
+        Tree.add(tree1, tree2)
+        self.assertTrue(Tree.equal(tree1, lxml.etree.fromstring('<_/>')), "Add failed, created incorrect tree: \n%s" % lxml.etree.tostring(tree1)[:200])
+        
+        
+        
+        
+        
+        
+        
+class test_prune_units(unittest.TestCase):
+    """Test the prune_units() function"""
+    
+    def test_TrailingUnits(self):
+        tree = lxml.etree.fromstring("""<a><b/><_> </_><_><_/><_/></_></a>""")
+        expectedtree = lxml.etree.fromstring("""<a><b/></a>""")
+        Tree.prune_units(tree)
+        self.assertTrue(Tree.equal(tree, expectedtree), "prune_units() failed, expected %s, got %s" \
+                        % (lxml.etree.tostring(expectedtree), lxml.etree.tostring(tree)))
+    
+    def test_UnitsBeforeNonUnits(self):
+        #units that are followed by a non-unit sibling hold the position of that sibling
+        tree = lxml.etree.fromstring("""<a><_/><b><_/><c/><_/></b><_ id="1"/><_>text</_></a>""")
+        expectedtree = lxml.etree.fromstring("""<a><_/><b><_/><c/></b><_ id="1"/><_>text</_></a>""")
+        Tree.prune_units(tree)
+        self.assertTrue(Tree.equal(tree, expectedtree), "prune_units() failed, expected %s, got %s" \
+                        % (lxml.etree.tostring(expectedtree), lxml.etree.tostring(tree)))
+    
+    def test_UnitRoot(self):
+        tree = lxml.etree.ElementTree(lxml.etree.fromstring("""<_><_/></_>"""))
+        result = Tree.prune_units(tree)
+        self.assertIs(result, tree)
+        self.assertTrue(Tree.equal(tree, lxml.etree.fromstring('<_/>')), "prune_units() failed, got %s" % lxml.etree.tostring(tree))
+        
+        
+        
+        
+        
+        
 class test_invert(unittest.TestCase):
     """Test the invert() function"""
     
@@ -948,4 +1112,145 @@ class test_invert(unittest.TestCase):
                         % (lxml.etree.tostring(expectedtree, pretty_print=False), lxml.etree.tostring(tree.getroot()[2], pretty_print=False)))
     
     
-    
\ No newline at end of file
+    
+
+
+class test_validate(unittest.TestCase):
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.tree1 = lxml.etree.fromstring('<a x="b"><b>text<c y="z">more</c>tail</b><d/></a>')
+        self.tree2 = lxml.etree.fromstring('<a><b>text<c y="z">café</c></b></a>')
+        self.log = logging.getLogger()
+
+    def test_Valid(self):
+        Tree.validate(self.tree1)
+        Tree.validate(lxml.etree.ElementTree(self.tree1))
+
+    def test_NotInDomain_ShouldFail(self):
+        self.assertRaises(ValueError, Tree.validate, self.tree2)
+        self.assertRaises(ValueError, Tree.validate, lxml.etree.fromstring('<a><b x="é"/></a>'))
+        self.assertRaises(ValueError, Tree.validate, lxml.etree.fromstring('<a><b>x</b>ü</a>'))
+
+    def test_Comments_ShouldFail(self):
+        self.assertRaises(TypeError, Tree.validate, lxml.etree.fromstring('<a><b/><!-- comment --></a>'))
+
+    def test_AddUnchangedOnFailure(self):
+        expected = lxml.etree.tostring(self.tree1)
+        self.assertRaises(ValueError, Tree.add, self.tree1, self.tree2)
+        result = lxml.etree.tostring(self.tree1)
+        self.assertEqual(result, expected, "add() modified tree1 before failing: %s, expected %s" % (result, expected))
+
+    def test_InvertUnchangedOnFailure(self):
+        expected = lxml.etree.tostring(self.tree2)
+        self.assertRaises(ValueError, Tree.invert, self.tree2)
+        result = lxml.etree.tostring(self.tree2)
+        self.assertEqual(result, expected, "invert() modified the tree before failing: %s, expected %s" % (result, expected))
+
+    def test_ModifiedAfterValidate(self):
+        Tree.validate(self.tree1)
+        self.tree1[0].text = 'café'
+        self.assertRaises(ValueError, Tree.validate, self.tree1)
+        self.assertRaises(ValueError, Tree.add, self.tree1, lxml.etree.fromstring('<a><b/></a>'))
+
+    def test_AddOnlyValidatesPairs(self):
+        #strings that are kept from tree1 or copied from tree2 are not added, so they 
+        #are not checked
+        tree = Tree.add(lxml.etree.fromstring('<a><p>x</p><q>café</q></a>'), lxml.etree.fromstring('<a><p>y</p></a>'))
+        self.assertEqual(tree[1].text, 'café', "add() returned %s, expected café" % tree[1].text)
+        tree = Tree.add(lxml.etree.fromstring('<a><p>x</p></a>'), lxml.etree.fromstring('<a><p>y</p><p>café</p></a>'))
+        self.assertEqual(tree[1].text, 'café', "add() returned %s, expected café" % tree[1].text)
+
+    def test_Validated(self):
+        #validated=True skips the check, so the caller must know the trees are valid
+        tree = Tree.add(copy.deepcopy(self.tree1), self.tree1)
+        Tree.invert(tree, validated=True)
+        Tree.add(tree, self.tree1, validated=True)
+        expected = Tree.invert(copy.deepcopy(self.tree1))
+        self.assertTrue(Tree.equal(tree, expected), "Expected %s, got %s" % (lxml.etree.tostring(expected), lxml.etree.tostring(tree)))
+
+
+
+class test_transaction(unittest.TestCase):
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        self.tree1 = lxml.etree.parse(os.path.join(self.testfilesdir, 'TreeTestFile_add3.xml'))
+        self.tree2 = lxml.etree.parse(os.path.join(self.testfilesdir, 'TreeTestFile_add4.xml'))
+        self.log = logging.getLogger()
+
+    def test_Rollback(self):
+        expected = lxml.etree.tostring(self.tree1)
+        with Tree.transaction(self.tree1) as journal:
+            Tree.add(self.tree1, self.tree2)
+            Tree.invert(self.tree1)
+            self.assertTrue(len(journal) > 0)
+            journal.rollback()
+        result = lxml.etree.tostring(self.tree1)
+        self.assertEqual(result, expected, "rollback() left %s, expected %s" % (result, expected))
+
+    def test_RollbackOnException(self):
+        expected = lxml.etree.tostring(self.tree1)
+        try:
+            with Tree.transaction(self.tree1):
+                Tree.add(self.tree1, self.tree2)
+                with Tree.transaction(self.tree1):
+                    Tree.invert(self.tree1)
+                raise KeyError
+        except KeyError:
+            pass
+        result = lxml.etree.tostring(self.tree1)
+        self.assertEqual(result, expected, "transaction left %s, expected %s" % (result, expected))
+
+    def test_Commit(self):
+        expected = lxml.etree.tostring(Tree.add(copy.deepcopy(self.tree1), self.tree2))
+        with Tree.transaction(self.tree1):
+            Tree.add(self.tree1, self.tree2)
+        result = lxml.etree.tostring(self.tree1)
+        self.assertEqual(result, expected, "transaction left %s, expected %s" % (result, expected))
+
+    def test_OtherTrees(self):
+        #only changes to the tree of the transaction are undone
+        other = copy.deepcopy(self.tree2)
+        expected1 = lxml.etree.tostring(self.tree1)
+        expected2 = lxml.etree.tostring(Tree.invert(copy.deepcopy(other)))
+        with Tree.transaction(self.tree1) as journal:
+            Tree.add(self.tree1, self.tree2)
+            with Tree.transaction(self.tree1.getroot()[0]):
+                Tree.invert(other)
+            journal.rollback()
+        self.assertEqual(lxml.etree.tostring(self.tree1), expected1)
+        self.assertEqual(lxml.etree.tostring(other), expected2)
+
+    def test_NestedOtherTree(self):
+        #changes to the tree of an enclosing transaction are recorded in its journal
+        other = copy.deepcopy(self.tree2)
+        expected = lxml.etree.tostring(self.tree1)
+        with Tree.transaction(self.tree1) as journal:
+            with Tree.transaction(other) as inner:
+                Tree.add(self.tree1, self.tree2)
+                Tree.invert(other)
+                inner.rollback()
+            journal.rollback()
+        self.assertEqual(lxml.etree.tostring(self.tree1), expected)
+        self.assertEqual(lxml.etree.tostring(other), lxml.etree.tostring(self.tree2))
+
+    def test_Threads(self):
+        #a transaction in one thread does not record the changes made in another
+        import threading
+        other = copy.deepcopy(self.tree2)
+        expected = lxml.etree.tostring(Tree.invert(copy.deepcopy(other)))
+        started = threading.Event()
+        done = threading.Event()
+        def modify():
+            started.wait()
+            Tree.invert(other)
+            done.set()
+        thread = threading.Thread(target=modify)
+        thread.start()
+        with Tree.transaction() as journal:
+            started.set()
+            done.wait()
+            self.assertEqual(len(journal), 0)
+            journal.rollback()
+        thread.join()
+        self.assertEqual(lxml.etree.tostring(other), expected)
@@ -0,0 +1,258 @@
+"""This file defines a vantage point tree over a corpus of documents, used to
+find the documents closest to a given document under ETree.Tree.metric()."""
+
+import lxml.etree
+import heapq, logging, json
+
+import TreeGroup.ETree.Tree as Tree
+
+
+#Tree.metric() satisfies the metric axioms, in particular the triangle inequality:
+#   metric(q, x) >= |metric(q, v) - metric(v, x)|
+#A vantage point tree uses this to avoid comparing a query with most of the corpus.
+#Every node of the vantage point tree holds one document, the vantage point v, and a
+#radius. The documents x with metric(v, x) < radius are stored under the node's inside
+#child, the others under its outside child. Once metric(q, v) is known, the inequality
+#above gives a lower bound on the distance from q to everything inside and everything
+#outside, and whole subtrees can be skipped when the bound is larger than the distances
+#we are looking for.
+#
+#Nodes without children have no radius. When a document is inserted under such a node,
+#the node's radius is set to the distance between the two documents, so the new
+#document becomes its outside child. Building an index from a whole corpus at once
+#uses the median distance as the radius instead, which gives a balanced tree.
+
+
+#version of the format written by VPTree.save()
+FORMATVERSION = 1
+
+#Index files are json, so loading one only ever creates data: the keys, radii and child
+#indices of the nodes, and the documents as xml strings. Keys must therefore be strings
+#or numbers. The documents are parsed without resolving entities or reading from the
+#network.
+_parser = lxml.etree.XMLParser(resolve_entities=False, no_network=True)
+
+
+
+class VPTreeNode:
+    def __init__(self, key, tree):
+        self.key = key
+        self.tree = tree
+        self.radius = None
+        self.inside = None
+        self.outside = None
+
+
+
+class VPTree:
+    """A vantage point tree over a corpus of documents. Documents are lxml trees
+    or elements, and each is stored with a key, for example its file name, which
+    is what the queries return."""
+
+    def __init__(self, items=None):
+        """Build the index from items, an iterable of (key, tree) pairs"""
+        self.log = logging.getLogger()
+        self._root = None
+        self._size = 0
+        #number of metric() calls made by the last query
+        self.comparisons = 0
+        if items is not None:
+            self._root = self._build([VPTreeNode(key, tree) for key, tree in items])
+
+    def __len__(self):
+        return self._size
+
+    def _build(self, nodes):
+        """Build a balanced tree from a list of nodes and return its root"""
+        self._size += len(nodes)
+        if len(nodes) == 0:
+            return None
+        root = nodes[0]
+
+        #each entry is a node and the list of nodes to store under it
+        stack = [(root, nodes[1:])]
+        while stack:
+            node, rest = stack.pop()
+            if len(rest) == 0:
+                continue
+            distances = sorted([(Tree.metric(node.tree, other.tree), index) for index, other in enumerate(rest)])
+            node.radius = distances[len(distances) // 2][0]
+            inside = [rest[index] for d, index in distances if d < node.radius]
+            outside = [rest[index] for d, index in distances if d >= node.radius]
+            if len(inside) > 0:
+                node.inside = inside[0]
+                stack.append((inside[0], inside[1:]))
+            node.outside = outside[0]
+            stack.append((outside[0], outside[1:]))
+
+        return root
+
+    def insert(self, key, tree):
+        """Add a document to the index"""
+        new = VPTreeNode(key, tree)
+        self._size += 1
+        if self._root is None:
+            self._root = new
+            return
+
+        node = self._root
+        while True:
+            d = Tree.metric(tree, node.tree)
+            if node.radius is None:
+                node.radius = d
+                node.outside = new
+                return
+            elif d < node.radius:
+                if node.inside is None:
+                    node.inside = new
+                    return
+                node = node.inside
+            else:
+                if node.outside is None:
+                    node.outside = new
+                    return
+                node = node.outside
+
+    def nearest(self, tree, k=1):
+        """Return the k documents closest to tree, as a list of (distance, key)
+        pairs sorted by distance."""
+        self.comparisons = 0
+        if k < 1 or self._root is None:
+            return []
+
+        #heap of the best results so far, (-distance, order, key) so the
+        #farthest is heap[0]. order keeps keys from ever being compared.
+        best = []
+        order = 0
+        #each entry is a node and a lower bound on the distance from tree to
+        #anything stored under it
+        stack = [(self._root, 0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(best) == k and bound > -best[0][0]:
+                continue
+
+            d = Tree.metric(tree, node.tree)
+            self.comparisons += 1
+            if len(best) < k:
+                heapq.heappush(best, (-d, order, node.key))
+            elif d < -best[0][0]:
+                heapq.heapreplace(best, (-d, order, node.key))
+            order += 1
+
+            if node.radius is None:
+                continue
+            insidebound = max(bound, d - node.radius + 1)
+            outsidebound = max(bound, node.radius - d)
+            #the child on the same side as tree is pushed last, so it is searched
+            #first and the other one is more likely to be skipped
+            if d < node.radius:
+                children = [(node.outside, outsidebound), (node.inside, insidebound)]
+            else:
+                children = [(node.inside, insidebound), (node.outside, outsidebound)]
+            for child, childbound in children:
+                if child is not None:
+                    stack.append((child, childbound))
+
+        return sorted([(-d, key) for d, o, key in best], key=lambda result: result[0])
+
+    def range(self, tree, radius):
+        """Return all the documents within radius of tree, as a list of (distance, key)
+        pairs sorted by distance."""
+        self.comparisons = 0
+        result = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            #distances beyond node.radius + radius rule out the inside child
+            #and the node itself, so they do not need to be computed exactly
+            if node.radius is None:
+                limit = radius
+            else:
+                limit = node.radius + radius
+            d = Tree.metric(tree, node.tree, limit=limit)
+            self.comparisons += 1
+            if d <= radius:
+                result.append((d, node.key))
+
+            if node.radius is None:
+                continue
+            if d - radius < node.radius:
+                stack.append(node.inside)
+            if d + radius >= node.radius:
+                stack.append(node.outside)
+
+        return sorted(result, key=lambda result: result[0])
+
+    def items(self):
+        """Iterate over the (key, tree) pairs in the index"""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            yield node.key, node.tree
+            stack.append(node.outside)
+            stack.append(node.inside)
+
+    def save(self, filename):
+        """Write the index to a file, see load()"""
+        #the nodes are written as a flat list, children are referred to by their
+        #index in the list. Documents are written as serialized xml.
+        nodes = []
+        indices = {}
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            indices[id(node)] = len(nodes)
+            nodes.append(node)
+            stack.append(node.outside)
+            stack.append(node.inside)
+
+        def index(node):
+            if node is None:
+                return None
+            return indices[id(node)]
+
+        records = []
+        for node in nodes:
+            records.append([node.key, lxml.etree.tostring(node.tree, encoding='unicode'), node.radius, index(node.inside), index(node.outside)])
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'version': FORMATVERSION, 'nodes': records}, f)
+
+
+
+def load(filename):
+    """Read an index written by VPTree.save() and return it. Documents are
+    returned as lxml elements."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError:
+            raise ValueError('%s: not an index file' % filename)
+    if not isinstance(data, dict):
+        raise ValueError('%s: not an index file' % filename)
+    if data.get('version') != FORMATVERSION:
+        raise ValueError('%s: unsupported index version %s' % (filename, str(data.get('version'))))
+
+    records = data['nodes']
+    nodes = [VPTreeNode(key, lxml.etree.fromstring(xml, _parser)) for key, xml, radius, inside, outside in records]
+    for node, record in zip(nodes, records):
+        key, xml, radius, inside, outside = record
+        node.radius = radius
+        if inside is not None:
+            node.inside = nodes[inside]
+        if outside is not None:
+            node.outside = nodes[outside]
+
+    index = VPTree()
+    if len(nodes) > 0:
+        index._root = nodes[0]
+    index._size = len(nodes)
+    return index
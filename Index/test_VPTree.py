@@ -0,0 +1,94 @@
+import unittest, os.path, sys, logging, glob, tempfile
+
+import lxml.etree
+
+import TreeGroup.ETree.Tree as Tree
+from . import VPTree
+
+
+
+class test_VPTree(unittest.TestCase):
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree', 'Add')
+        self.corpus = []
+        for filename in sorted(glob.glob(os.path.join(testfilesdir, 'TreeTestFile_add*.xml'))):
+            self.corpus.append((os.path.basename(filename), lxml.etree.parse(filename)))
+        self.queries = [tree for key, tree in self.corpus[::3]] + [lxml.etree.fromstring('<c><b id="1"/></c>')]
+        
+    def bruteForce(self, tree):
+        return sorted([(Tree.metric(tree, other), key) for key, other in self.corpus])
+        
+    def assertSameDistances(self, result, expected, everything=None):
+        #ties can be returned in any order, so compare the distances and check that 
+        #each key is returned with its own distance
+        self.assertEqual([d for d, key in result], [d for d, key in expected], "Expected: \n%s\nGot:\n%s\n" % (str(expected), str(result)))
+        if everything is None:
+            everything = expected
+        for d, key in result:
+            self.assertIn((d, key), everything)
+        
+    def test_Nearest(self):
+        index = VPTree.VPTree(self.corpus)
+        self.assertEqual(len(index), len(self.corpus))
+        for query in self.queries:
+            expected = self.bruteForce(query)
+            for k in (1, 3, len(self.corpus)):
+                self.assertSameDistances(index.nearest(query, k=k), expected[:k], expected)
+        
+    def test_Range(self):
+        index = VPTree.VPTree(self.corpus)
+        for query in self.queries:
+            expected = self.bruteForce(query)
+            for radius in (0, 2, 5, 100):
+                self.assertSameDistances(index.range(query, radius), [r for r in expected if r[0] <= radius])
+                
+    def test_Insert(self):
+        index = VPTree.VPTree(self.corpus[:3])
+        for key, tree in self.corpus[3:]:
+            index.insert(key, tree)
+        self.assertEqual(len(index), len(self.corpus))
+        for query in self.queries:
+            expected = self.bruteForce(query)
+            self.assertSameDistances(index.nearest(query, k=4), expected[:4], expected)
+            self.assertSameDistances(index.range(query, 3), [r for r in expected if r[0] <= 3])
+            
+    def test_EmptyIndex(self):
+        index = VPTree.VPTree()
+        self.assertEqual(index.nearest(self.queries[0]), [])
+        self.assertEqual(index.range(self.queries[0], 10), [])
+        index.insert('a', self.queries[0])
+        self.assertEqual(index.nearest(self.queries[0]), [(0, 'a')])
+                
+    def test_SaveAndLoad(self):
+        index = VPTree.VPTree(self.corpus)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'index.vpt')
+            index.save(filename)
+            loaded = VPTree.load(filename)
+        self.assertEqual(len(loaded), len(index))
+        self.assertEqual(sorted([key for key, tree in loaded.items()]), sorted([key for key, tree in self.corpus]))
+        for query in self.queries:
+            self.assertSameDistances(loaded.nearest(query, k=3), index.nearest(query, k=3), self.bruteForce(query))
+
+    def test_Load_NotAnIndex_ShouldFail(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'index.vpt')
+            with open(filename, 'wb') as f:
+                f.write(b'\x80\x04\x95\x00')
+            self.assertRaises(ValueError, VPTree.load, filename)
+            
+    def test_Pruning(self):
+        #documents that differ from each other in many nodes, the nearest neighbour
+        #should be found without comparing the query with most of the corpus
+        corpus = []
+        for i in range(200):
+            tree = lxml.etree.Element('a')
+            for j in range(i % 20):
+                lxml.etree.SubElement(tree, 'b', {'id': 'x%i' % (i // 20)})
+            corpus.append((i, tree))
+        index = VPTree.VPTree(corpus)
+        query = corpus[57][1]
+        result = index.nearest(query, k=1)
+        self.assertEqual(result, [(0, 57)])
+        self.assertLess(index.comparisons, len(corpus) // 2)
@@ -0,0 +1,144 @@
+"""This file defines the binary file format of packed trees."""
+
+import numpy
+import mmap, struct
+
+from . import PackedTree
+
+
+#A file holds the arrays of one PackedTree, see PackedTree.py, so reading it does not
+#involve parsing xml. The file starts with a header:
+#   magic       8 bytes, b'TREEGRP\0'
+#   version     uint32, FORMATVERSION
+#   kind        uint32, what the tree stands for, eg KIND_DELTA for an ETree.Delta
+#   sections    uint32, the number of sections
+#followed by one entry per section:
+#   name        16 bytes, padded with zeros
+#   dtype       8 bytes, the numpy type string, eg '<i8', padded with zeros
+#   offset      uint64, from the start of the file, a multiple of 8
+#   count       uint64, the number of items
+#and then the sections themselves. The sections are the arrays of the PackedTree in the
+#order of _arrays, and the tags and keys tables, stored as their strings encoded in
+#utf-8 and joined with zero bytes. All numbers are little endian.
+#
+#Other integer arrays can follow as extra sections, eg the positions of the nodes of an
+#ETree.Delta. load() ignores sections it is not asked for.
+#
+#The arrays of indices and lengths are written with the smallest integer type that
+#holds their values, which makes the files several times smaller than int64 arrays.
+#
+#load() maps the file in memory. The heap of the PackedTree it returns, which holds
+#most of the data, is a view of the mapped file, so it is not read or copied. The other
+#arrays are widened back to int64, which is one numpy copy per array. The heap is read
+#only, which is fine since packed trees are never modified.
+
+
+#version of the format written by dump()
+FORMATVERSION = 1
+
+MAGIC = b'TREEGRP\0'
+
+#values of kind
+KIND_TREE = 0
+KIND_DELTA = 1
+
+_header = struct.Struct('<8sIII')
+_entry = struct.Struct('<16s8sQQ')
+
+_arrays = ('parent', 'depth', 'tag', 'textstart', 'textlength', 'tailstart', 'taillength',
+           'attrnode', 'attrkey', 'valuestart', 'valuelength', 'heap')
+_tables = ('tags', 'keys')
+
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _smallest(array):
+    """Return the smallest signed integer type that holds the values of the array"""
+    if len(array) == 0:
+        return numpy.int8
+    low, high = int(array.min()), int(array.max())
+    for dtype in (numpy.int8, numpy.int16, numpy.int32):
+        if numpy.iinfo(dtype).min <= low and high <= numpy.iinfo(dtype).max:
+            return dtype
+    return numpy.int64
+
+
+def dump(packed, filename, kind=KIND_TREE, extra=()):
+    """Write the PackedTree to a file, see load(). extra is a sequence of (name, array)
+    pairs, integer arrays written as extra sections."""
+    sections = []
+    for name in _arrays:
+        array = numpy.asarray(getattr(packed, name))
+        if name != 'heap':
+            array = array.astype(_smallest(array), copy=False)
+        sections.append((name, array.astype(array.dtype.newbyteorder('<'), copy=False)))
+    for name in _tables:
+        table = '\0'.join(getattr(packed, name)).encode('utf-8')
+        sections.append((name, numpy.frombuffer(table, dtype=numpy.uint8)))
+    for name, array in extra:
+        array = numpy.asarray(array)
+        array = array.astype(_smallest(array), copy=False)
+        sections.append((name, array.astype(array.dtype.newbyteorder('<'), copy=False)))
+
+    offset = _align(_header.size + _entry.size * len(sections))
+    entries = []
+    for name, array in sections:
+        entries.append(_entry.pack(name.encode('ascii'), array.dtype.str.encode('ascii'), offset, len(array)))
+        offset = _align(offset + array.nbytes)
+
+    with open(filename, 'wb') as f:
+        f.write(_header.pack(MAGIC, FORMATVERSION, kind, len(sections)))
+        for entry in entries:
+            f.write(entry)
+        for name, array in sections:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(array.tobytes())
+
+
+def load(filename, extra=()):
+    """Read a PackedTree written by dump(), return it, the kind of the file and a
+    dictionary of the extra sections named in extra, as int64 arrays. ValueError is
+    raised if any of them is not in the file."""
+    with open(filename, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            #empty files cannot be mapped
+            data = b''
+
+    if len(data) < _header.size:
+        raise ValueError('%s: not a tree file' % filename)
+    magic, version, kind, count = _header.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError('%s: not a tree file' % filename)
+    if version != FORMATVERSION:
+        raise ValueError('%s: unsupported tree file version %i' % (filename, version))
+
+    if _header.size + _entry.size * count > len(data):
+        raise ValueError('%s: truncated tree file' % filename)
+    sections = {}
+    for i in range(count):
+        name, dtype, offset, length = _entry.unpack_from(data, _header.size + _entry.size * i)
+        dtype = numpy.dtype(dtype.rstrip(b'\0').decode('ascii'))
+        if offset + dtype.itemsize * length > len(data):
+            raise ValueError('%s: truncated tree file' % filename)
+        sections[name.rstrip(b'\0').decode('ascii')] = numpy.frombuffer(data, dtype=dtype, count=length, offset=offset)
+
+    for name in _arrays + _tables + tuple(extra):
+        if name not in sections:
+            raise ValueError('%s: no %s in tree file' % (filename, name))
+    arrays = {}
+    for name in _arrays:
+        if name == 'heap':
+            arrays[name] = sections[name]
+        else:
+            arrays[name] = sections[name].astype(numpy.int64)
+    for name in _tables:
+        #tags and keys are never empty, so only an empty table is written as no bytes
+        table = sections[name].tobytes().decode('utf-8')
+        arrays[name] = table.split('\0') if table else []
+    extras = dict([(name, sections[name].astype(numpy.int64)) for name in extra])
+    return PackedTree.PackedTree(**arrays), kind, extras
@@ -0,0 +1,473 @@
+"""This file defines the PackedTree, a tree stored as numpy arrays, and the group
+operations on packed trees."""
+
+import lxml.etree
+import numpy
+import logging
+
+import TreeGroup.Common.Tag as Tag
+import TreeGroup.Common.Segments as Segments
+
+
+#lxml elements are large: every node is a C struct with its own strings, and every
+#node that is visited from Python gets a proxy object on top of that. The group
+#operations only need the tag, attributes, text and tail of every node and the parent
+#of every node, so a PackedTree stores just that, as arrays with one entry per node in
+#document order (preorder):
+#   parent      index of the parent node, -1 for the root
+#   depth       0 for the root
+#   tag         index in the tags table. Tags are interned, documents use few of them.
+#   text, tail  start and length of the string in the heap, length -1 for None
+#and arrays with one entry per attribute, sorted by node and in document order
+#within each node:
+#   attrnode    index of the node
+#   attrkey     index in the keys table
+#   value       start and length of the value in the heap
+#
+#All the strings are stored in the heap, one array of code points, see Segments.py.
+#Packed trees are never modified, the operations below return new packed trees
+#which share arrays with their operands.
+#
+#The positions of two trees are matched by the index of every node among its siblings,
+#the same way ETree.Tree.add() walks both trees. The operations work on a whole level
+#of the trees at a time, so the number of numpy calls depends on the depth of the
+#trees and not on their size.
+
+
+
+class PackedTree:
+    def __init__(self, parent, depth, tag, tags, textstart, textlength, tailstart, taillength,
+                 attrnode, attrkey, keys, valuestart, valuelength, heap):
+        self.parent = parent
+        self.depth = depth
+        self.tag = tag
+        self.tags = tags
+        self.textstart = textstart
+        self.textlength = textlength
+        self.tailstart = tailstart
+        self.taillength = taillength
+        self.attrnode = attrnode
+        self.attrkey = attrkey
+        self.keys = keys
+        self.valuestart = valuestart
+        self.valuelength = valuelength
+        self.heap = heap
+
+    def __len__(self):
+        return len(self.parent)
+
+    def nbytes(self):
+        """Return the number of bytes used by the arrays and the tables"""
+        arrays = (self.parent, self.depth, self.tag, self.textstart, self.textlength,
+                  self.tailstart, self.taillength, self.attrnode, self.attrkey,
+                  self.valuestart, self.valuelength, self.heap)
+        return sum([array.nbytes for array in arrays]) + sum([len(string) for string in self.tags + self.keys])
+
+    def text(self, nodes):
+        """Return the code points and the lengths of the text of the nodes"""
+        return Segments.gather(self.heap, self.textstart[nodes], self.textlength[nodes]), self.textlength[nodes]
+
+    def tail(self, nodes):
+        """Return the code points and the lengths of the tail of the nodes"""
+        return Segments.gather(self.heap, self.tailstart[nodes], self.taillength[nodes]), self.taillength[nodes]
+
+    def values(self, attributes):
+        """Return the code points and the lengths of the values of the attributes"""
+        return Segments.gather(self.heap, self.valuestart[attributes], self.valuelength[attributes]), self.valuelength[attributes]
+
+    def __repr__(self):
+        return '%s(%i nodes, %i attributes)' % (type(self).__name__, len(self), len(self.attrnode))
+
+
+
+def pack(tree):
+    """Return the PackedTree of an lxml tree or element"""
+    log = logging.getLogger()
+
+    if isinstance(tree, lxml.etree._Element):
+        root = tree
+    else:
+        root = tree.getroot()
+
+    parent = []
+    depth = []
+    tags = []
+    texts = []
+    tails = []
+    attrnode = []
+    keys = []
+    values = []
+    stack = [(root, -1, 0)]
+    while stack:
+        element, parentindex, elementdepth = stack.pop()
+        if not isinstance(element.tag, str):
+            #comments and processing instructions are not part of the group
+            log.error('TypeError: cannot pack %s' % str(element))
+            raise TypeError('cannot pack %s' % str(element))
+        index = len(parent)
+        parent.append(parentindex)
+        depth.append(elementdepth)
+        tags.append(element.tag)
+        texts.append(element.text)
+        tails.append(element.tail)
+        for key, value in element.items():
+            attrnode.append(index)
+            keys.append(key)
+            values.append(value)
+        #reversed so that the children are visited in document order
+        for child in reversed(element):
+            stack.append((child, index, elementdepth + 1))
+
+    n = len(parent)
+    heap, starts, lengths = Segments.encode(texts + tails + values)
+    tag, tags = _intern(tags)
+    attrkey, keys = _intern(keys)
+    return PackedTree(numpy.array(parent, dtype=numpy.int64), numpy.array(depth, dtype=numpy.int64),
+                      tag, tags, starts[:n], lengths[:n], starts[n:2 * n], lengths[n:2 * n],
+                      numpy.array(attrnode, dtype=numpy.int64), attrkey, keys,
+                      starts[2 * n:], lengths[2 * n:], heap)
+
+
+
+def unpack(packed):
+    """Return the lxml element of a PackedTree"""
+    strings = Segments.decode(packed.heap)
+
+    def substrings(starts, lengths):
+        return [None if length < 0 else strings[start:start + length] for start, length in zip(starts.tolist(), lengths.tolist())]
+
+    texts = substrings(packed.textstart, packed.textlength)
+    tails = substrings(packed.tailstart, packed.taillength)
+    values = substrings(packed.valuestart, packed.valuelength)
+
+    attribs = [{} for i in range(len(packed))]
+    for node, key, value in zip(packed.attrnode.tolist(), packed.attrkey.tolist(), values):
+        attribs[node][packed.keys[key]] = value
+
+    elements = []
+    for parent, tag, attrib, text, tail in zip(packed.parent.tolist(), packed.tag.tolist(), attribs, texts, tails):
+        if parent < 0:
+            element = lxml.etree.Element(packed.tags[tag], attrib)
+        else:
+            element = lxml.etree.SubElement(elements[parent], packed.tags[tag], attrib)
+        element.text = text
+        element.tail = tail
+        elements.append(element)
+
+    return elements[0]
+
+
+
+def invert(packed):
+    """Return the inverse of the packed tree, see ETree.Tree.invert()"""
+    tagids, tags = _intern([Tag.tagInverse(tag) for tag in packed.tags])
+
+    nodes = numpy.arange(len(packed))
+    text = Segments.textInverse(*packed.text(nodes))
+    tail = Segments.textInverse(*packed.tail(nodes))
+
+    #attributes with unit values are removed, see Attrib.attribInverse()
+    values, lengths = packed.values(numpy.arange(len(packed.attrnode)))
+    kept = ~Segments.isUnitValue(values, lengths)
+    value = Segments.valueInverse(*Segments.select(values, lengths, kept))
+
+    heap, (textstart, tailstart, valuestart) = Segments.join([text, tail, value])
+    return PackedTree(packed.parent, packed.depth, tagids[packed.tag], tags,
+                      textstart, text[1], tailstart, tail[1],
+                      packed.attrnode[kept], packed.attrkey[kept], packed.keys,
+                      valuestart, value[1], heap)
+
+
+
+def add(packed1, packed2):
+    """Return packed1 + packed2, see ETree.Tree.add(). Trailing unit nodes are
+    removed from the result."""
+    return _prune(_add(packed1, packed2))
+
+
+
+def metric(packed1, packed2):
+    """Return the number of non-unit nodes in packed1 - packed2, see ETree.Tree.metric()"""
+    #trailing units are not counted, the difference does not need to be pruned
+    return countNonUnitNodes(_add(invert(packed2), packed1))
+
+
+
+def countNonUnitNodes(packed):
+    """Return the number of non-unit nodes, see ETree.Tree.countNonUnitNodes()"""
+    nodes = numpy.arange(len(packed))
+    unittag = numpy.array([tag == '_' for tag in packed.tags], dtype=bool)[packed.tag]
+    attributes = numpy.bincount(packed.attrnode, minlength=len(packed))
+
+    #countNonUnitNodes() tests text.join(tail), which is blank if the tail is blank
+    #and either the text is blank or the tail is a single character
+    textblank = Segments.isBlank(*packed.text(nodes))
+    tailblank = Segments.isBlank(*packed.tail(nodes))
+    unittext = tailblank & (textblank | (packed.taillength == 1))
+
+    unit = unittag & (attributes == 0) & unittext
+    return int(len(packed) - numpy.count_nonzero(unit))
+
+
+
+def equal(packed1, packed2, ignoreattrs=False):
+    """Return True if the packed trees are equal, False otherwise, see ETree.Tree.equal()"""
+    if len(packed1) != len(packed2) or not numpy.array_equal(packed1.parent, packed2.parent):
+        return False
+
+    #tags are compared after cleaning, through a table shared by both trees
+    tagids, tags = _intern([Tag._cleantag(tag) for tag in packed1.tags + packed2.tags])
+    if not numpy.array_equal(tagids[packed1.tag], tagids[len(packed1.tags) + packed2.tag]):
+        return False
+
+    nodes = numpy.arange(len(packed1))
+    for field in ('text', 'tail'):
+        if not _equalSegments(_rstrip(*getattr(packed1, field)(nodes)), _rstrip(*getattr(packed2, field)(nodes))):
+            return False
+
+    if ignoreattrs:
+        return True
+
+    #attributes with unit values are ignored, see Attrib.cleanKeys(). The others are
+    #sorted by node and key so that the order of the attributes does not matter
+    keyids, keys = _intern(packed1.keys + packed2.keys)
+    attributes = []
+    for packed, offset in ((packed1, 0), (packed2, len(packed1.keys))):
+        values, lengths = packed.values(numpy.arange(len(packed.attrnode)))
+        kept = ~Segments.isUnitValue(values, lengths)
+        node = packed.attrnode[kept]
+        key = keyids[offset + packed.attrkey[kept]]
+        values, lengths = Segments.select(values, lengths, kept)
+        order = numpy.lexsort((key, node))
+        attributes.append((node[order], key[order], Segments.gather(values, Segments.starts(lengths)[order], lengths[order]), lengths[order]))
+    (node1, key1, values1, lengths1), (node2, key2, values2, lengths2) = attributes
+    return (numpy.array_equal(node1, node2) and numpy.array_equal(key1, key2) and
+            _equalSegments((values1, lengths1), (values2, lengths2)))
+
+
+
+def _rstrip(codes, lengths):
+    """Return the segments with trailing whitespace removed, missing segments empty"""
+    codes, lengths = Segments.rstrip(codes, lengths, Segments.isWhitespace(codes))
+    return codes, numpy.maximum(lengths, 0)
+
+
+def _equalSegments(segments1, segments2):
+    (codes1, lengths1), (codes2, lengths2) = segments1, segments2
+    return numpy.array_equal(lengths1, lengths2) and numpy.array_equal(codes1, codes2)
+
+
+
+def _intern(strings):
+    """Return the index of every string in a table of the distinct strings, and the table"""
+    table = {}
+    indices = numpy.array([table.setdefault(string, len(table)) for string in strings], dtype=numpy.int64)
+    return indices, list(table)
+
+
+
+def _levels(depth):
+    """Return the nodes at every depth, each level in document order. The children of
+    a node are then next to each other in the next level."""
+    order = numpy.argsort(depth, kind='stable')
+    return numpy.split(order, numpy.cumsum(numpy.bincount(depth))[:-1])
+
+
+
+def _siblingIndex(parent):
+    """Return the index of every node among the children of its parent"""
+    order = numpy.argsort(parent, kind='stable')
+    grouped = parent[order]
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = grouped[1:] != grouped[:-1]
+    index = numpy.arange(len(order))
+    result = numpy.empty(len(order), dtype=numpy.int64)
+    result[order] = index - numpy.maximum.accumulate(numpy.where(first, index, 0))
+    return result
+
+
+
+def _subtreeEnds(packed):
+    """Return the index of the last descendant of every node, or the node itself"""
+    size = numpy.ones(len(packed), dtype=numpy.int64)
+    for level in reversed(_levels(packed.depth)[1:]):
+        numpy.add.at(size, packed.parent[level], size[level])
+    return numpy.arange(len(packed)) + size - 1
+
+
+
+def _align(packed1, packed2):
+    """Match the nodes of two packed trees by position. Return, for every node of
+    packed1 the node of packed2 at the same position, and for every node of packed2
+    the node of packed1, or -1."""
+    sibling1 = _siblingIndex(packed1.parent)
+    sibling2 = _siblingIndex(packed2.parent)
+
+    #a node of packed2 is found from its parent and its sibling index
+    width = max(len(packed1), len(packed2)) + 1
+    codes2 = packed2.parent * width + sibling2
+    order2 = numpy.argsort(codes2)
+    sorted2 = codes2[order2]
+
+    partner1 = numpy.full(len(packed1), -1, dtype=numpy.int64)
+    partner1[0] = 0
+    for level in _levels(packed1.depth)[1:]:
+        parents = partner1[packed1.parent[level]]
+        level = level[parents >= 0]
+        codes = parents[parents >= 0] * width + sibling1[level]
+        found = numpy.minimum(numpy.searchsorted(sorted2, codes), len(sorted2) - 1)
+        matched = sorted2[found] == codes
+        partner1[level[matched]] = order2[found[matched]]
+
+    partner2 = numpy.full(len(packed2), -1, dtype=numpy.int64)
+    paired = numpy.nonzero(partner1 >= 0)[0]
+    partner2[partner1[paired]] = paired
+    return partner1, partner2
+
+
+
+def _add(packed1, packed2):
+    """Return packed1 + packed2 without removing trailing units"""
+    n1 = len(packed1)
+    partner1, partner2 = _align(packed1, packed2)
+    paired = numpy.nonzero(partner1 >= 0)[0]
+    only1 = numpy.nonzero(partner1 < 0)[0]
+    only2 = numpy.nonzero(partner2 < 0)[0]
+
+    #nodes only in packed2 are copied after the last descendant of the node of packed1
+    #their subtree hangs from, in the order of packed2
+    anchor = numpy.full(len(packed2), -1, dtype=numpy.int64)
+    for level in _levels(packed2.depth)[1:]:
+        level = level[partner2[level] < 0]
+        parents = packed2.parent[level]
+        anchor[level] = numpy.where(partner2[parents] >= 0, partner2[parents], anchor[parents])
+    ends = _subtreeEnds(packed1)
+    order = numpy.lexsort((numpy.concatenate((numpy.zeros(n1, dtype=numpy.int64), only2)),
+                           numpy.concatenate((numpy.zeros(n1, dtype=numpy.int64), numpy.ones(len(only2), dtype=numpy.int64))),
+                           numpy.concatenate((numpy.arange(n1), ends[anchor[only2]]))))
+    n = len(order)
+    newindex = numpy.empty(n, dtype=numpy.int64)
+    newindex[order] = numpy.arange(n)
+    new1 = newindex[:n1]
+    new2 = numpy.full(len(packed2), -1, dtype=numpy.int64)
+    new2[only2] = newindex[n1:]
+    new2[partner1[paired]] = new1[paired]
+
+    parent = numpy.empty(n, dtype=numpy.int64)
+    parent[new1] = numpy.where(packed1.parent >= 0, new1[packed1.parent], -1)
+    parent[new2[only2]] = new2[packed2.parent[only2]]
+    depth = numpy.empty(n, dtype=numpy.int64)
+    depth[new1] = packed1.depth
+    depth[new2[only2]] = packed2.depth[only2]
+
+    #tags are added once for every distinct pair of tags
+    tagcount1 = len(packed1.tags)
+    tagcount2 = len(packed2.tags)
+    pairs, pairindex = numpy.unique(packed1.tag[paired] * tagcount2 + packed2.tag[partner1[paired]], return_inverse=True)
+    sums = [Tag.addTags(packed1.tags[pair // tagcount2], packed2.tags[pair % tagcount2]) for pair in pairs.tolist()]
+    tagids, tags = _intern(packed1.tags + packed2.tags + sums)
+    tag = numpy.empty(n, dtype=numpy.int64)
+    tag[new1[only1]] = tagids[packed1.tag[only1]]
+    tag[new2[only2]] = tagids[tagcount1 + packed2.tag[only2]]
+    tag[new1[paired]] = tagids[tagcount1 + tagcount2 + pairindex.reshape(-1)]
+
+    #text and tail of nodes in both trees are added, the others are copied
+    parts = []
+    for field in ('text', 'tail'):
+        strings1 = getattr(packed1, field)
+        strings2 = getattr(packed2, field)
+        parts.append(Segments.addText(*(strings1(paired) + strings2(partner1[paired]))))
+        parts.append(strings1(only1))
+        parts.append(strings2(only2))
+
+    #attributes of nodes in both trees are matched by key. Values of matched keys are
+    #added, the others are copied, and unit values are then removed from nodes in
+    #both trees, see Attrib.addAttribs().
+    #The attributes of packed1 keep their order, followed by the new ones of packed2.
+    keyids, keys = _intern(packed1.keys + packed2.keys)
+    attributes1 = numpy.arange(len(packed1.attrnode))
+    attributes2 = numpy.arange(len(packed2.attrnode))
+    node1 = new1[packed1.attrnode]
+    node2 = new2[packed2.attrnode]
+    key1 = keyids[packed1.attrkey]
+    key2 = keyids[len(packed1.keys) + packed2.attrkey]
+    both1 = numpy.nonzero(partner1[packed1.attrnode] >= 0)[0]
+    both2 = numpy.nonzero(partner2[packed2.attrnode] >= 0)[0]
+    common, matched1, matched2 = numpy.intersect1d(node1[both1] * len(keys) + key1[both1],
+                                                   node2[both2] * len(keys) + key2[both2],
+                                                   assume_unique=True, return_indices=True)
+    matched1 = both1[matched1]
+    matched2 = both2[matched2]
+    copied1 = numpy.setdiff1d(attributes1, matched1, assume_unique=True)
+    copied2 = numpy.setdiff1d(attributes2, matched2, assume_unique=True)
+
+    values = [Segments.addValues(*(packed1.values(matched1) + packed2.values(matched2))),
+              packed1.values(copied1),
+              packed2.values(copied2)]
+    attrnode = numpy.concatenate((node1[matched1], node1[copied1], node2[copied2]))
+    attrkey = numpy.concatenate((key1[matched1], key1[copied1], key2[copied2]))
+    group = numpy.concatenate((numpy.zeros(len(matched1) + len(copied1), dtype=numpy.int64), numpy.ones(len(copied2), dtype=numpy.int64)))
+    attrorder = numpy.concatenate((matched1, copied1, copied2))
+    inboth = numpy.concatenate((numpy.ones(len(matched1), dtype=bool), partner1[packed1.attrnode[copied1]] >= 0, partner2[packed2.attrnode[copied2]] >= 0))
+
+    unit = numpy.concatenate([Segments.isUnitValue(*part) for part in values])
+    kept = ~(unit & inboth)
+    heap, starts = Segments.join(parts + values)
+    valuestart = numpy.concatenate(starts[6:])[kept]
+    valuelength = numpy.concatenate([part[1] for part in values])[kept]
+    order = numpy.lexsort((attrorder[kept], group[kept], attrnode[kept]))
+
+    nodes = [new1[paired], new1[only1], new2[only2]] * 2
+    textstart = numpy.empty(n, dtype=numpy.int64)
+    textlength = numpy.empty(n, dtype=numpy.int64)
+    tailstart = numpy.empty(n, dtype=numpy.int64)
+    taillength = numpy.empty(n, dtype=numpy.int64)
+    for index in range(3):
+        textstart[nodes[index]] = starts[index]
+        textlength[nodes[index]] = parts[index][1]
+        tailstart[nodes[index + 3]] = starts[index + 3]
+        taillength[nodes[index + 3]] = parts[index + 3][1]
+
+    return PackedTree(parent, depth, tag, tags, textstart, textlength, tailstart, taillength,
+                      attrnode[kept][order], attrkey[kept][order], keys,
+                      valuestart[order], valuelength[order], heap)
+
+
+
+def _prune(packed):
+    """Return the packed tree without its trailing unit nodes, see ETree.Tree.prune_units()"""
+    n = len(packed)
+    nodes = numpy.arange(n)
+    unit = (numpy.array([tag == '_' for tag in packed.tags], dtype=bool)[packed.tag] &
+            (numpy.bincount(packed.attrnode, minlength=n) == 0) &
+            Segments.isBlank(*packed.text(nodes)) &
+            Segments.isBlank(*packed.tail(nodes)))
+    children = numpy.bincount(packed.parent[1:], minlength=n)
+
+    #deepest level first, so the children of a node are pruned before the node itself.
+    #A node is removed if it is a unit without children and all the siblings after
+    #it are removed too.
+    removed = numpy.zeros(n, dtype=bool)
+    for level in reversed(_levels(packed.depth)[1:]):
+        candidate = unit[level] & (children[level] == 0)
+        parents = packed.parent[level]
+        first = numpy.ones(len(level), dtype=bool)
+        first[1:] = parents[1:] != parents[:-1]
+        index = numpy.arange(len(level))
+        lastkept = numpy.maximum.reduceat(numpy.where(candidate, -1, index), numpy.nonzero(first)[0])
+        remove = candidate & (index > lastkept[numpy.cumsum(first) - 1])
+        removed[level[remove]] = True
+        children -= numpy.bincount(parents[remove], minlength=n)
+
+    if not removed.any():
+        return packed
+    kept = numpy.nonzero(~removed)[0]
+    newindex = numpy.full(n, -1, dtype=numpy.int64)
+    newindex[kept] = numpy.arange(len(kept))
+    parent = packed.parent[kept]
+    return PackedTree(numpy.where(parent >= 0, newindex[parent], -1), packed.depth[kept],
+                      packed.tag[kept], packed.tags,
+                      packed.textstart[kept], packed.textlength[kept],
+                      packed.tailstart[kept], packed.taillength[kept],
+                      newindex[packed.attrnode], packed.attrkey, packed.keys,
+                      packed.valuestart, packed.valuelength, packed.heap)
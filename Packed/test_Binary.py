@@ -0,0 +1,88 @@
+import unittest, os.path, sys, logging, glob, tempfile, shutil
+
+import lxml.etree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from . import PackedTree
+    from . import Binary
+
+import TreeGroup.ETree.Tree as Tree
+import TreeGroup.ETree.Delta as Delta
+
+
+
+def _parse(filenames):
+    return [lxml.etree.parse(f).getroot() for f in filenames if 'donotuse' not in f]
+
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class test_Binary(unittest.TestCase):
+    """Test the binary file format"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree')
+        self.trees = _parse(sorted(glob.glob(os.path.join(self.testfilesdir, 'Add', '*.xml'))))
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'tree.bin')
+        self.log = logging.getLogger()
+
+    def tearDown(self):
+        """called after each test function execution"""
+        shutil.rmtree(self.tempdir)
+
+    def test_DumpLoad(self):
+        for tree in self.trees + [lxml.etree.fromstring('<a>café<b x="日本"/></a>')]:
+            expected = lxml.etree.tostring(tree)
+            Tree.dump_binary(tree, self.filename)
+            result = lxml.etree.tostring(Tree.load_binary(self.filename))
+            self.assertEqual(result, expected, "load_binary() returned %s, expected %s" % (result, expected))
+
+    def test_LoadPacked(self):
+        tree = self.trees[0]
+        Tree.dump_binary(tree, self.filename)
+        packed = Tree.load_binary(self.filename, packed=True)
+        self.assertTrue(isinstance(packed, PackedTree.PackedTree))
+        self.assertFalse(packed.heap.flags.owndata, "the heap was copied")
+        self.assertEqual(PackedTree.metric(packed, PackedTree.pack(tree)), 0)
+        self.assertEqual(packed.parent.dtype, numpy.int64)
+
+    def test_Delta(self):
+        delta = Delta.difference(self.trees[0], self.trees[1])
+        Delta.dump_binary(delta, self.filename)
+        result = Delta.load_binary(self.filename)
+        self.assertEqual(result, delta, "load_binary() returned %s, expected %s" % (result.nodes, delta.nodes))
+        self.assertRaises(ValueError, Tree.load_binary, self.filename)
+
+    def test_SparseDelta(self):
+        #only the nodes of the delta are written, not the tree they are in
+        tree1 = lxml.etree.fromstring('<a>' + '<b>text</b>' * 10000 + '</a>')
+        tree2 = lxml.etree.fromstring('<a>' + '<b>text</b>' * 9999 + '<b>other</b></a>')
+        delta = Delta.difference(tree2, tree1)
+        Delta.dump_binary(delta, self.filename)
+        self.assertTrue(os.path.getsize(self.filename) < 1000, "dump_binary() wrote %i bytes" % os.path.getsize(self.filename))
+        self.assertEqual(Delta.load_binary(self.filename), delta)
+        Delta.dump_binary(Delta.SparseDelta(), self.filename)
+        self.assertEqual(len(Delta.load_binary(self.filename)), 0)
+        #a delta file without the positions of its nodes
+        Binary.dump(PackedTree.pack(tree1), self.filename, Binary.KIND_DELTA)
+        self.assertRaises(ValueError, Delta.load_binary, self.filename)
+
+    def test_Version_ShouldFail(self):
+        Tree.dump_binary(self.trees[0], self.filename)
+        with open(self.filename, 'r+b') as f:
+            f.seek(8)
+            f.write(bytes([Binary.FORMATVERSION + 1]))
+        self.assertRaises(ValueError, Tree.load_binary, self.filename)
+
+    def test_NotATreeFile_ShouldFail(self):
+        for data in (b'', b'<a/>', Binary.MAGIC + b'\1'):
+            with open(self.filename, 'wb') as f:
+                f.write(data)
+            self.assertRaises(ValueError, Binary.load, self.filename)
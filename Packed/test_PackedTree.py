@@ -0,0 +1,102 @@
+import unittest, os.path, sys, logging, glob
+
+import lxml.etree, copy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from . import PackedTree
+
+import TreeGroup.ETree.Tree as Tree
+
+
+
+def _parse(filenames):
+    return [lxml.etree.parse(f).getroot() for f in filenames if 'donotuse' not in f]
+
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class test_PackedTree(unittest.TestCase):
+    """Test the packed trees against the operations in ETree.Tree"""
+
+    def setUp(self):
+        """set up data used in the tests, called before each test function execution"""
+        self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'Tree')
+        self.trees = _parse(sorted(glob.glob(os.path.join(self.testfilesdir, 'Add', '*.xml'))))
+        self.log = logging.getLogger()
+
+    def test_PackUnpack(self):
+        for tree in self.trees + _parse(sorted(glob.glob(os.path.join(self.testfilesdir, 'Equal', '*.xml')))):
+            expected = lxml.etree.tostring(tree)
+            result = lxml.etree.tostring(PackedTree.unpack(PackedTree.pack(tree)))
+            self.assertEqual(result, expected, "unpack(pack()) returned %s, expected %s" % (result, expected))
+
+    def test_PackElementTree(self):
+        tree = lxml.etree.parse(os.path.join(self.testfilesdir, 'Add', 'TreeTestFile_add3.xml'))
+        packed = PackedTree.pack(tree)
+        self.assertEqual(len(packed), len(list(tree.iter())))
+
+    def test_Invert(self):
+        for tree in self.trees:
+            expected = lxml.etree.tostring(Tree.invert(copy.deepcopy(tree)))
+            result = lxml.etree.tostring(PackedTree.unpack(PackedTree.invert(PackedTree.pack(tree))))
+            self.assertEqual(result, expected, "invert() returned %s, expected %s" % (result, expected))
+
+    def test_Add(self):
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                expected = lxml.etree.tostring(Tree.add(copy.deepcopy(tree1), tree2))
+                result = lxml.etree.tostring(PackedTree.unpack(PackedTree.add(PackedTree.pack(tree1), PackedTree.pack(tree2))))
+                self.assertEqual(result, expected, "add() returned %s, expected %s" % (result, expected))
+
+    def test_AddInverse(self):
+        for tree in self.trees:
+            packed = PackedTree.pack(tree)
+            result = PackedTree.add(packed, PackedTree.invert(packed))
+            self.assertEqual(PackedTree.countNonUnitNodes(result), 0)
+            self.assertEqual(len(result), 1, "tree plus its inverse has %i nodes, expected 1" % len(result))
+
+    def test_Metric(self):
+        for number, expected in ((1, 0), (2, 1), (3, 4)):
+            tree1 = lxml.etree.parse(os.path.join(self.testfilesdir, 'Metric', 'TreeTestFile_metric%i-1.xml' % number))
+            tree2 = lxml.etree.parse(os.path.join(self.testfilesdir, 'Metric', 'TreeTestFile_metric%i-2.xml' % number))
+            result = PackedTree.metric(PackedTree.pack(tree1), PackedTree.pack(tree2))
+            self.assertEqual(result, expected, "metric() returned %i, expected %i" % (result, expected))
+        for tree1 in self.trees:
+            for tree2 in self.trees:
+                expected = Tree.metric(tree1, tree2)
+                result = PackedTree.metric(PackedTree.pack(tree1), PackedTree.pack(tree2))
+                self.assertEqual(result, expected, "metric() returned %i, expected %i" % (result, expected))
+
+    def test_CountNonUnitNodes(self):
+        for number, expected in ((1, 1), (2, 2), (3, 6)):
+            tree = lxml.etree.parse(os.path.join(self.testfilesdir, 'CountNonUnitNodes', 'TreeTestFile_countNonUnitNodes%i.xml' % number))
+            result = PackedTree.countNonUnitNodes(PackedTree.pack(tree))
+            self.assertEqual(result, expected, "countNonUnitNodes() returned %i, expected %i" % (result, expected))
+
+    def test_Equal(self):
+        reference = PackedTree.pack(lxml.etree.parse(os.path.join(self.testfilesdir, 'Equal', 'TreeTestFile_reference.xml')))
+        for name, expected in (('equal1', True), ('notequal1', False), ('notequal2', False), ('notequal3', False), ('notequal4', False)):
+            packed = PackedTree.pack(lxml.etree.parse(os.path.join(self.testfilesdir, 'Equal', 'TreeTestFile_%s.xml' % name)))
+            result = PackedTree.equal(reference, packed)
+            self.assertIs(result, expected, "equal() failed for %s: expected %s, got %s" % (name, str(expected), str(result)))
+
+    def test_EqualIgnoresAttributeOrder(self):
+        packed1 = PackedTree.pack(lxml.etree.fromstring('<a x="1" y="b"><b z="_"> text </b></a>'))
+        packed2 = PackedTree.pack(lxml.etree.fromstring('<a y="b" x="1"><b> text</b></a>'))
+        self.assertIs(PackedTree.equal(packed1, packed2), True)
+        packed3 = PackedTree.pack(lxml.etree.fromstring('<a y="c" x="1"><b> text</b></a>'))
+        self.assertIs(PackedTree.equal(packed1, packed3), False)
+        self.assertIs(PackedTree.equal(packed1, packed3, ignoreattrs=True), True)
+
+    def test_Comments_ShouldFail(self):
+        tree = lxml.etree.fromstring('<a><!-- comment --><b/></a>')
+        self.assertRaises(TypeError, PackedTree.pack, tree)
+
+    def test_NotInDomain_ShouldFail(self):
+        packed = PackedTree.pack(lxml.etree.fromstring('<a>café</a>'))
+        self.assertRaises(ValueError, PackedTree.invert, packed)
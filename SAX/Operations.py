@@ -1,4 +1,6 @@
-import xml.sax, xml.sax.handler, xml.sax.xmlreader, logging, copy
+import xml.sax, xml.sax.handler, xml.sax.xmlreader, xml.sax.saxutils, xml.parsers.expat, logging, copy, collections, io, itertools
+
+import lxml.etree
 
 import TreeGroup.SAX.Operations
 
@@ -18,8 +20,18 @@ import TreeGroup.Common.Attrib as Attrib
 #So below, we assume that trees are composed of nodes, which are composed of 
 #tags, attributes, text and tail, and nothing else.  
 
+#Documents have many more events than distinct tags, so the events are kept small: 
+#the classes have __slots__ instead of a __dict__, the parser interns the tags, and 
+#elements without attributes share one empty dictionary, which must not be modified. 
+
+
+#attributes of the events of elements that have none
+_noattributes = {}
+
 
 class SAXIteratorEvent:
+    __slots__ = ()
+    
     def __init__(self):
         pass
     
@@ -35,27 +47,43 @@ class SAXIteratorEvent:
     def toString(self):
         raise NotImplementedError
     
+    def toXML(self):
+        """Return the event as xml, with the text and attribute values escaped"""
+        raise NotImplementedError
+    
     
     
 class StartDocumentEvent(SAXIteratorEvent):
+    __slots__ = ()
+    
     def __init__(self):
         super(StartDocumentEvent, self).__init__()
     
         
 class EndDocumentEvent(SAXIteratorEvent):
+    __slots__ = ()
+    
     def __init__(self):
         super(EndDocumentEvent, self).__init__()
     
     
 class StartElementEvent(SAXIteratorEvent):
-    def __init__(self, tag, attr={}, text=''):
+    __slots__ = ('tag', 'attr', 'text')
+    
+    def __init__(self, tag, attr=None, text=''):
         super(StartElementEvent, self).__init__()
         self.tag = tag
-        self.attr = dict(attr)
+        if attr:
+            self.attr = dict(attr)
+        else:
+            self.attr = _noattributes
         self.text = text
         
     def toString(self):
         return "<%s%s>%s" % (self.tag, ''.join([" %s=\"%s\"" % (k, self.attr[k]) for k in self.attr.keys()]), self.text)
+    
+    def toXML(self):
+        return "<%s%s>%s" % (self.tag, ''.join([" %s=%s" % (k, _quote(v)) for k, v in self.attr.items()]), _escape(self.text))
             
     def __eq__(self, o):
         if type(self) == type(o) and Tag.equal(self.tag, o.tag) and Attrib.equal(self.attr, o.attr) and Text.equal(self.text, o.text):
@@ -65,6 +93,8 @@ class StartElementEvent(SAXIteratorEvent):
         
             
 class EndElementEvent(SAXIteratorEvent):
+    __slots__ = ('tag', 'text')
+    
     def __init__(self, tag, text=''):
         super(EndElementEvent, self).__init__()
         self.tag = tag
@@ -73,6 +103,9 @@ class EndElementEvent(SAXIteratorEvent):
     def toString(self):
         return "</%s>%s" % (self.tag, self.text)
     
+    def toXML(self):
+        return "</%s>%s" % (self.tag, _escape(self.text))
+    
     def __eq__(self, o):
         if type(self) == type(o) and Tag.equal(self.tag, o.tag) and Text.equal(self.text, o.text):
             return True
@@ -81,21 +114,74 @@ class EndElementEvent(SAXIteratorEvent):
         
 
 
+_escape = xml.sax.saxutils.escape
+
+def _quote(value):
+    return '"%s"' % xml.sax.saxutils.escape(value, {'"': '&quot;'})
+
+
+
+#number of characters collected by SAXWriter before they are written to its sink
+BUFFERSIZE = 65536
+
+
+
+class SAXWriter:
+    """Write events as xml to a sink, which is a file object opened in text or binary 
+    mode, a bytearray, or a function that is called with strings. The events are 
+    collected and written buffersize characters at a time. Call flush() after the 
+    last event."""
+    
+    def __init__(self, sink, buffersize=BUFFERSIZE):
+        if isinstance(sink, bytearray):
+            self._write = lambda string: sink.extend(string.encode('utf-8'))
+        elif isinstance(sink, (io.RawIOBase, io.BufferedIOBase)):
+            self._write = lambda string: sink.write(string.encode('utf-8'))
+        elif hasattr(sink, 'write'):
+            self._write = sink.write
+        elif callable(sink):
+            self._write = sink
+        else:
+            raise TypeError('cannot write to %s' % str(sink))
+        self.buffersize = buffersize
+        self._buffer = []
+        self._size = 0
+        
+    def write(self, event):
+        string = event.toXML()
+        self._buffer.append(string)
+        self._size += len(string)
+        if self._size >= self.buffersize:
+            self.flush()
+            
+    def flush(self):
+        if self._buffer:
+            self._write(''.join(self._buffer))
+        self._buffer = []
+        self._size = 0
+
+
+
 class SAXIterateContentHandler(xml.sax.handler.ContentHandler):
     def __init__(self, list):
         self._list = list
+        self._text = []
 
     def startDocument(self):
         pass
         
     def endDocument(self):
-        pass
+        self._flushText()
                 
     def startElement(self, tag, attr):
-        self._list.append(StartElementEvent(tag=tag, attr=attr))
+        if self._text:
+            self._flushText()
+        self._list.append(StartElementEvent(tag, attr))
             
     def endElement(self, tag): 
-        self._list.append(EndElementEvent(tag=tag))
+        if self._text:
+            self._flushText()
+        self._list.append(EndElementEvent(tag))
 
     def characters(self, content):
         #in the add() function below, if we include characters as a separate event then it makes the operation
@@ -104,8 +190,21 @@ class SAXIterateContentHandler(xml.sax.handler.ContentHandler):
         #not have a position or event associated with them, then it makes if much easier to operate on. 
         #So for all the character events, we move their text into the previous event, whether it be
         #an opening tag, closing tag, etc. 
-        #also ignore leading / trailing whitepsace and newlines
-        self._list[-1].text += content.strip()
+        #The parser can split the text anywhere, eg where the document was cut into chunks 
+        #for feeding, so the pieces are collected and the text is only cleaned once the next
+        #event starts, see _cleanText().
+        #This means the text of an event is all the character data up to the next event, 
+        #with leading and trailing whitespace removed from every line. References, comments, 
+        #processing instructions and CDATA sections do not split it, eg 'x &amp; y' is 
+        #'x & y'. Whitespace around them used to be stripped too, 'x&y', since each piece 
+        #was stripped on its own, but where the pieces are split depends on the parser 
+        #and on how the document is fed to it, and lxml does not report them at all.
+        self._text.append(content)
+    
+    def _flushText(self):
+        if self._text and self._list:
+            self._list[-1].text += _cleanText(''.join(self._text))
+        self._text = []
             
     
     #not sure if we should keep this one or not. 
@@ -164,64 +263,256 @@ class SAXIterateContentHandler(xml.sax.handler.ContentHandler):
     
     
     
+def _cleanText(text):
+    """Return the text with leading and trailing whitespace removed from every line, and 
+    the lines joined"""
+    #ignore leading / trailing whitepsace and newlines. The parsers turn every line end
+    #into \n, so other line separators are only whitespace.
+    if '\n' not in text:
+        return text.strip()
+    if text.isspace():
+        return ''
+    return ''.join([line.strip() for line in text.split('\n')])
+
+
+
+#number of characters or bytes fed to the parser at a time by SAXIterator
+CHUNKSIZE = 65536
+
+#the parser used by SAXIterator when no backend is given, see _backends below
+BACKEND = 'sax'
+
+
+
 class SAXIterator():
-    def __init__(self, string):
-        self.log = logging.getLogger()
-        
-        self._list = []
-        self.parser = xml.sax.make_parser()
-        self.parser.setContentHandler(SAXIterateContentHandler(self._list))
-        
-        #it would be good to have some sort of iterative parser using the parser.feed()
-        #method to avoid loading all events in memory (ie self._list) at once. However, 
-        #because of the way the content handler handles character events (it appends the
-        #character data to the text attribute of the last seen event), it requires that 
-        #there always be at least one event available to append character data to. So 
-        #using the feed() method gets complicated - we've got to make sure there's always at 
-        #least one element in the list. Would have to come up with something that always keeps
-        #an event in the list until the endDocument event is found. 
-        
-        #skip this problem for now and do it the easy way. The command below
-        #causes the parser to run, which causes the content handler to fill up self._list
-        #with all the events in the tree. This is an obvious
-        #place to implement a speed up / memory usage fix.
-        xml.sax.parseString(string.encode('utf-8'), SAXIterateContentHandler(self._list))
-        
-    def setUpFeed(self, string):
-        self.stringlist = string.split('\n')
-        self.stringindex = 0
-        
-    def feedParser(self):
-        #NOT CURRENTLY IN USE
-        #nice and simple. We can modify this so that memory is no wasted on the stringlist,
-        #and we only work with the string. 
-        #does using feed mean that the endDocument event is never created / handled?
-        #the use case for this function is in next(), whenever self._list is empty, 
-        #feed some more content in. 
-        while len(self._list) == 0:
-            try:
-                self.log.debug('feeding %i: %s' % (self.stringindex, str(self.stringlist[self.stringindex])))
-                self.parser.feed(self.stringlist[self.stringindex])
-            except IndexError:
-                #can't raise StopIteration here because that would cause any remaining content
-                #in self._list to not be processed. StopIteration is raised in next()
-                self.log.debug('feeding %i: IndexError' % self.stringindex)
-                return False
-            self.stringindex += 1
-        return True
+    """Iterate over the element events of a document. The document is a string, bytes, 
+    or a file object opened in text or binary mode. With the lxml backend it is an 
+    lxml element or element tree instead, which is walked rather than parsed.
+    
+    The document is fed to the parser chunksize characters or bytes at a time, and the
+    events are returned as the parser finds them, so the whole document is never in 
+    memory. Character data is added to the text of the event before it (see 
+    SAXIterateContentHandler), so the last event found is held back until the next 
+    one starts or the document ends. 
+    
+    backend is the name of the parser, see _backends below. All the backends return 
+    the same events."""
     
+    def __init__(self, source, chunksize=CHUNKSIZE, backend=None):
+        self.log = logging.getLogger()
+        if backend is None:
+            backend = BACKEND
+        try:
+            iterate = _backends[backend]
+        except KeyError:
+            raise ValueError('unknown backend %s' % str(backend))
+        self._events = iterate(source, chunksize)
         
     def next(self):
-        try:
-            return self._list.pop(0)
-        except IndexError:
-            raise StopIteration    
+        return next(self._events)
         
     def __next__(self):
         return self.next()
         
     def __iter__(self):
         return self
+
+
+
+#The backends are generators of the events of a document, fed chunksize at a time:
+#   sax     xml.sax, through SAXIterateContentHandler
+#   expat   pyexpat directly, with handlers that build the events themselves instead
+#           of the layers of xml.sax and SAXIterateContentHandler. Expat collects the 
+#           character data between two tags into one string, and interns the tags. 
+#           Errors are raised as xml.parsers.expat.ExpatError instead of 
+#           xml.sax.SAXParseException.
+#   lxml    lxml.etree.iterwalk() over an lxml tree that is already in memory, 
+#           instead of serialising it for another backend. The text of an event is 
+#           the text or tail of its element, see _lxmlEvents(). Documents are not 
+#           parsed with lxml, it is slower than xml.sax here.
+
+def _saxEvents(source, chunksize):
+    #the handler appends the events to the right of the queue, they are taken from 
+    #the left
+    events = collections.deque()
+    parser = xml.sax.make_parser()
+    parser.setFeature(xml.sax.handler.feature_string_interning, True)
+    parser.setContentHandler(SAXIterateContentHandler(events))
+    
+    for chunk in _chunks(source, chunksize):
+        parser.feed(chunk)
+        while len(events) > 1:
+            yield events.popleft()
+    parser.close()
+    
+    while events:
+        yield events.popleft()
+
+
+def _expatEvents(source, chunksize):
+    #the events are built by the handlers themselves, without a content handler in
+    #between. The text is collected and cleaned as in SAXIterateContentHandler. 
+    #Expat returns a new dict of attributes for every element, so it is used as is. 
+    events = collections.deque()
+    append = events.append
+    texts = []
+    
+    def start(tag, attr):
+        if texts:
+            events[-1].text += _cleanText(''.join(texts))
+            texts.clear()
+        event = StartElementEvent(tag)
+        if attr:
+            event.attr = attr
+        append(event)
+    
+    def end(tag):
+        if texts:
+            events[-1].text += _cleanText(''.join(texts))
+            texts.clear()
+        append(EndElementEvent(tag))
+    
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    parser.buffer_size = CHUNKSIZE
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = texts.append
+    
+    for chunk in _chunks(source, chunksize):
+        parser.Parse(chunk, False)
+        while len(events) > 1:
+            yield events.popleft()
+    parser.Parse(b'', True)
+    if texts and events:
+        events[-1].text += _cleanText(''.join(texts))
+    
+    while events:
+        yield events.popleft()
+
+
+def _lxmlEvents(source, chunksize):
+    #lxml gives the text of an element and the tail after it instead of character 
+    #events. The text of the start event of an element is its text, and the text of its
+    #end event is its tail. Comments and processing instructions are not events, so 
+    #their tails are added to the text before them, as the sax parser would. The text
+    #is complete once the next event is found, so, as with the other backends, every
+    #event is held back until then.
+    #The sax parser reports namespace declarations as attributes, lxml reports them as
+    #start-ns events just before the start event of their element.
+    #The tree is only read. chunksize is not used, the tree is already in memory. 
+    if not isinstance(source, (lxml.etree._Element, lxml.etree._ElementTree)):
+        raise TypeError('the lxml backend only reads lxml trees')
+    
+    previous = None
+    declarations = []
+    for event, item in lxml.etree.iterwalk(source, events=('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            declarations.append(item)
+            continue
+        if previous is not None:
+            yield _lxmlEvent(previous)
+        previous = (event, item, declarations)
+        declarations = []
+    if previous is not None:
+        yield _lxmlEvent(previous)
+
+
+def _lxmlEvent(item):
+    """Return the event of the element, now that its text is complete"""
+    event, element, declarations = item
+    if event == 'start':
+        result = StartElementEvent(_tagname(element), _lxmlAttributes(element, declarations))
+        result.text = _lxmlText(element.text, _firstChild(element))
+        return result
+    
+    result = EndElementEvent(_tagname(element))
+    result.text = _lxmlText(element.tail, element.getnext())
+    return result
+
+
+def _firstChild(element):
+    for child in element:
+        return child
+    return None
+
+
+def _lxmlText(text, node):
+    """Return the text, and the tails of the comments and processing instructions from 
+    node on, cleaned as in SAXIterateContentHandler"""
+    if (node is None) or isinstance(node.tag, str):
+        return _cleanText(text) if text else ''
+    texts = [text or '']
+    while (node is not None) and (not isinstance(node.tag, str)):
+        texts.append(node.tail or '')
+        node = node.getnext()
+    return _cleanText(''.join(texts))
+
+
+def _tagname(element):
+    """Return the tag as written in the document, with its prefix instead of its
+    namespace"""
+    tag = element.tag
+    if tag[0] != '{':
+        return tag
+    localname = tag.split('}', 1)[1]
+    if element.prefix:
+        return element.prefix + ':' + localname
+    return localname
+
+
+def _qname(name, element):
+    """Return the attribute name as written in the document, with a prefix instead of
+    its namespace"""
+    if name[0] != '{':
+        return name
+    namespace, localname = name[1:].split('}', 1)
+    if namespace == _XMLNAMESPACE:
+        return 'xml:' + localname
+    for prefix, uri in element.nsmap.items():
+        if uri == namespace and prefix is not None:
+            return prefix + ':' + localname
+    return localname
+
+_XMLNAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+
+def _lxmlAttributes(element, declarations):
+    """Return the attributes as the sax parser would, ie with the namespace 
+    declarations made by the element, a list of (prefix, uri)"""
+    attributes = {}
+    for key, value in element.items():
+        attributes[_qname(key, element)] = value
+    for prefix, uri in declarations:
+        if prefix:
+            attributes['xmlns:' + prefix] = uri
+        else:
+            attributes['xmlns'] = uri
+    return attributes
+
+
+_backends = {'sax': _saxEvents, 'expat': _expatEvents, 'lxml': _lxmlEvents}
+
+
+
+def _chunks(source, chunksize):
+    """Return the document in chunks of utf-8 encoded bytes"""
+    if isinstance(source, str):
+        for start in range(0, len(source), chunksize):
+            yield source[start:start + chunksize].encode('utf-8')
+    elif isinstance(source, bytes):
+        for start in range(0, len(source), chunksize):
+            yield source[start:start + chunksize]
+    elif isinstance(source, (lxml.etree._Element, lxml.etree._ElementTree)):
+        raise TypeError('lxml trees can only be read by the lxml backend')
+    else:
+        while True:
+            chunk = source.read(chunksize)
+            if not chunk:
+                return
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield chunk
         
        
 
@@ -246,15 +537,21 @@ class Ordering:
     #if you want to check syntax while doing the other operations (ie make sure all closing 
     #tags are present, have the right value etc) then this class is the place to do it.
     
-    def __init__(self):
+    #the ordering holds a position for every event, so it grows with the document. With 
+    #record=False only the current position is kept, for add() and equal() on documents 
+    #that do not fit in memory. 
+    
+    def __init__(self, record=True):
         self._position = []
         self._ordering = []
+        self._record = record
         self.index = -1
         self.log = logging.getLogger()
         
     def updateOrdering(self, event):
         self.updatePosition(event)
-        self._ordering.append(copy.copy(self.getCurrentPosition()))    
+        if self._record:
+            self._ordering.append(copy.copy(self.getCurrentPosition()))    
         
     def updatePosition(self, event):
         if event is None:
@@ -311,10 +608,13 @@ class SAXEventAndOrderingIterator:
     #catch StopIteration, make sure that everything is consistent before raising 
     #it again
     
-    def __init__(self, string):
+    #only the current event and position are kept, unless record is True, in which case
+    #the positions of all the events are kept for getCurrentOrdering()
+    
+    def __init__(self, string, backend=None, record=False):
         self.log = logging.getLogger()
-        self._iterator = SAXIterator(string)
-        self._ordering = Ordering()
+        self._iterator = SAXIterator(string, backend=backend)
+        self._ordering = Ordering(record)
         self._currentevent = None
         
     def __iter__(self):
@@ -344,9 +644,9 @@ class SAXEventAndOrderingIterator:
 
 
 
-def getOrdering(tree):
+def getOrdering(tree, backend=None):
     """just a convenience function initially built for unit tests"""
-    iterator = SAXEventAndOrderingIterator(tree)
+    iterator = SAXEventAndOrderingIterator(tree, backend=backend, record=True)
     for i in iterator:
         pass
     return iterator.getCurrentOrdering()
@@ -358,15 +658,20 @@ def getOrdering(tree):
     
 
 
-def equal(string1, string2):
-    """Given two trees defined by string1 and string2, return True if they are equal, False otherwise"""
-    iterator1 = SAXIterator(string1)
-    iterator2 = SAXIterator(string2)
+def equal(string1, string2, backend=None):
+    """Given two trees defined by string1 and string2, return True if they are equal, False otherwise. 
     
-    for event1 in iterator1:
-        try:
-            event2 = iterator2.next()
-        except: 
+    The trees can also be bytes or file objects, see SAXIterator. Both documents are 
+    parsed together, a chunk at a time, and the comparison stops at the first events 
+    that differ, so only the part of the documents up to there is read. backend is the 
+    parser used, see SAXIterator."""
+    iterator1 = SAXIterator(string1, backend=backend)
+    iterator2 = SAXIterator(string2, backend=backend)
+    
+    #events are never None, None is only returned when one of the documents has ended 
+    #before the other
+    for event1, event2 in itertools.zip_longest(iterator1, iterator2):
+        if event1 is None or event2 is None:
             return False
         
         if event1 != event2:
@@ -422,22 +727,34 @@ def isUnitEvent(event):
 
 
 
-def add(string1, string2):
-    """Given two trees defined by string1 and string2, add them together and return the result"""
+def add(string1, string2, sink=None, backend=None):
+    """Given two trees defined by string1 and string2, add them together and return the result. 
+    
+    The trees can also be bytes or file objects, see SAXIterator. If sink is given the 
+    result is written to it as it is built, see SAXWriter, and None is returned, so the 
+    result is never in memory as a whole. Only the current events and positions of the 
+    documents are kept, so with file objects and a sink the memory used does not grow 
+    with the size of the documents. The text and attribute values of the result are 
+    escaped. backend is the parser used, see SAXIterator."""
     
     log = logging.getLogger()
     
     #iterators will go over the two input trees and get events and positions
-    iterator1 = SAXEventAndOrderingIterator(string1)
-    iterator2 = SAXEventAndOrderingIterator(string2)
+    iterator1 = SAXEventAndOrderingIterator(string1, backend=backend)
+    iterator2 = SAXEventAndOrderingIterator(string2, backend=backend)
     
-    #result is the string that will be returned
-    result = ""
+    #result is where the events are written
+    if sink is None:
+        output = io.StringIO()
+    else:
+        output = sink
+    result = SAXWriter(output)
     
-    #buffer is used for removing trailing units
+    #buffer is used for removing trailing units. Only the positions of the last two 
+    #events are compared, so no more are kept. 
     buffer = []
-    bufferordering = Ordering()
-    positionlist = []
+    bufferordering = Ordering(record=False)
+    positionlist = collections.deque(maxlen=2)
     
     while True:
         
@@ -486,7 +803,7 @@ def add(string1, string2):
             
             while move.getCurrentPosition() != hold.getCurrentPosition():
                 log.debug('\tposition: %s event: %s' % (str(move.getCurrentPosition()), move.getCurrentEvent().toString()))
-                result += move.getCurrentEvent().toString()
+                result.write(move.getCurrentEvent())
                 #should never encounter StopIteration here
                 e, p = move.next()
             
@@ -502,15 +819,15 @@ def add(string1, string2):
         if len(positionlist) <= 1:
             #if newevent is the first, write it.
             for e in buffer: 
-                result += e.toString()
-            result += newevent.toString()
+                result.write(e)
+            result.write(newevent)
             
         elif len(positionlist[-1]) == len(positionlist[-2]):
             if not isUnitEvent(newevent):
                 #if we are on the same level, write buffer if this event is not the unit
                 for e in buffer: 
-                    result += e[0].toString()
-                result += newevent.toString()
+                    result.write(e[0])
+                result.write(newevent)
             else:
                 #if this is the unit, save it in the buffer
                 buffer.append((newevent, bufferordering.getCurrentPosition()))
@@ -518,21 +835,22 @@ def add(string1, string2):
         elif len(positionlist[-1]) > len(positionlist[-2]):
             #if we move down, write
             for e in buffer: 
-                result += e.toString()
-            result += newevent.toString()
+                result.write(e)
+            result.write(newevent)
             
         elif len(positionlist[-1]) < len(positionlist[-2]):
             #if we move up, discard the buffer (?)  
-            result += newevent.toString()
+            result.write(newevent)
             
         else:
             #should never happen
-            result += newevent.toString()
+            result.write(newevent)
             
     
-    log.debug('')
-    log.debug("result: %s" % result)
-    return result
+    result.flush()
+    if sink is None:
+        return output.getvalue()
+    return None
         
         
         
\ No newline at end of file
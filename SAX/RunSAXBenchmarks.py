@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""Time the SAX operations with each parser backend"""
+
+#usage: RunSAXBenchmarks.py [elements]
+#A document with the given number of elements is generated, and iterating over its
+#events, comparing it with itself and adding it to itself are timed with every backend
+#in SAX.Operations. The lxml backend walks the document parsed into an lxml tree 
+#beforehand. The times are printed along with the speedup over xml.sax.
+
+import sys, os.path, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import lxml.etree
+
+import TreeGroup.SAX.Operations as Operations
+
+
+def document(elements):
+    """Return a document of sections of paragraphs, with about this many elements"""
+    parts = ['<doc>']
+    for section in range(elements // 50 + 1):
+        parts.append('<section id="s%i" lang="en">\n  <title>Section %i</title>\n' % (section, section))
+        for paragraph in range(48):
+            parts.append('  <p class="body">Paragraph %i of section %i, with <b>some</b> text.</p>\n' % (paragraph, section))
+        parts.append('</section>\n')
+    parts.append('</doc>')
+    return ''.join(parts)
+
+
+def best(function, repeat=3):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main(elements):
+    source = document(elements)
+    tree = lxml.etree.fromstring(source.encode('utf-8'))
+    print('%i elements, %i characters' % (elements, len(source)))
+    print('%-12s%-8s%12s%10s' % ('operation', 'backend', 'seconds', 'speedup'))
+
+    benchmarks = [
+        ('iterate', lambda document, backend: lambda: sum(1 for event in Operations.SAXIterator(document, backend=backend))),
+        ('equal', lambda document, backend: lambda: Operations.equal(document, document, backend=backend)),
+        ('add', lambda document, backend: lambda: Operations.add(document, document, sink=lambda string: None, backend=backend)),
+    ]
+    for name, benchmark in benchmarks:
+        reference = None
+        for backend, data in (('sax', source), ('expat', source), ('lxml', tree)):
+            seconds = best(benchmark(data, backend))
+            if reference is None:
+                reference = seconds
+            print('%-12s%-8s%12.3f%9.1fx' % (name, backend, seconds, reference / seconds))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main(20000)
@@ -1,4 +1,4 @@
-import unittest, os.path, sys, logging
+import unittest, os.path, sys, logging, io
 
 import lxml.etree, copy
 
@@ -39,6 +39,82 @@ class test_SAXIterator(unittest.TestCase):
         self.assertEqual(result, expected, "Expected: \n%s\nGot:\n%s\n" % (str(expected), str(result)))
         
         
+    def test_Chunks(self):
+        tree = "<xml>some\n  text <a id='1'>more text</a>  tail\n</xml>"
+        expected = ["<xml>sometext", "<a id=\"1\">more text", "</a>tail", "</xml>"]
+        for chunksize in (1, 2, 5, 1000):
+            result = [e.toString() for e in Operations.SAXIterator(tree, chunksize=chunksize)]
+            self.assertEqual(result, expected, "chunksize %i: Expected: \n%s\nGot:\n%s\n" % (chunksize, str(expected), str(result)))
+            
+            
+    def test_File(self):
+        tree = "<xml><a>text</a></xml>"
+        expected = [e.toString() for e in Operations.SAXIterator(tree)]
+        for f in (io.BytesIO(tree.encode('utf-8')), io.StringIO(tree)):
+            result = [e.toString() for e in Operations.SAXIterator(f, chunksize=3)]
+            self.assertEqual(result, expected, "Expected: \n%s\nGot:\n%s\n" % (str(expected), str(result)))
+            
+            
+    def test_CompactEvents(self):
+        events = list(Operations.SAXIterator("<xml><a/><a x='1'/></xml>"))
+        self.assertFalse(hasattr(events[1], '__dict__'), "events have a __dict__")
+        self.assertTrue(events[1].tag is events[3].tag, "tags are not interned")
+        self.assertTrue(events[0].attr is events[1].attr, "empty attributes are not shared")
+        self.assertEqual(events[3].attr, {'x': '1'})
+        self.assertEqual(Operations.StartElementEvent('a').attr, {})
+            
+            
+    def test_Incremental(self):
+        #events are returned before the rest of the document is read
+        f = io.BytesIO(("<xml>" + "<a/>" * 1000 + "</xml>").encode('utf-8'))
+        iterator = Operations.SAXIterator(f, chunksize=16)
+        iterator.next()
+        self.assertTrue(f.tell() < 100, "SAXIterator read %i bytes for the first event" % f.tell())
+
+
+    def test_TextAcrossMarkup(self):
+        #the text of an event is all its character data, with every line stripped
+        cases = [
+                 ("<a>x &amp; y</a>", ["<a>x &amp; y", "</a>"]),
+                 ("<a>x &lt; y<b/> p &#65; q</a>", ["<a>x &lt; y", "<b>", "</b>p A q", "</a>"]),
+                 ("<a>a <?pi x?> b</a>", ["<a>a  b", "</a>"]),
+                 ("<a>a <!-- c --> b\n  c <![CDATA[ d ]]></a>", ["<a>a  bc  d", "</a>"]),
+                 ("<a> x\u2028y </a>", ["<a>x\u2028y", "</a>"]),
+                ]
+        for tree, expected in cases:
+            for backend in ('sax', 'expat'):
+                for chunksize in (1, 3, 1000):
+                    result = [e.toXML() for e in Operations.SAXIterator(tree, chunksize=chunksize, backend=backend)]
+                    self.assertEqual(result, expected, "%s, %s, chunksize %i: Expected: \n%s\nGot:\n%s\n" % (tree, backend, chunksize, str(expected), str(result)))
+            result = [e.toXML() for e in Operations.SAXIterator(lxml.etree.fromstring(tree), backend='lxml')]
+            self.assertEqual(result, expected, "%s, lxml: Expected: \n%s\nGot:\n%s\n" % (tree, str(expected), str(result)))
+
+
+    def test_Backends(self):
+        tree = "<xml xmlns:n='urn:n'>some\n  text <!-- c -->more<n:a id='1' n:x='&amp;'>a &lt; b<?p i?>c</n:a>  tail\n<![CDATA[<d>]]></xml>"
+        expected = [e.toString() for e in Operations.SAXIterator(tree, backend='sax')]
+        for chunksize in (1, 7, 1000):
+            result = [e.toString() for e in Operations.SAXIterator(tree, chunksize=chunksize, backend='expat')]
+            self.assertEqual(result, expected, "chunksize %i: Expected: \n%s\nGot:\n%s\n" % (chunksize, str(expected), str(result)))
+
+        #lxml trees are walked rather than parsed
+        result = [e.toString() for e in Operations.SAXIterator(lxml.etree.fromstring(tree), backend='lxml')]
+        self.assertEqual(result, expected, "Expected: \n%s\nGot:\n%s\n" % (str(expected), str(result)))
+
+        tree = "<xml>some <a id='1'>text</a><b/></xml>"
+        self.assertTrue(Operations.equal(tree, tree, backend='expat'))
+        self.assertEqual(Operations.add(lxml.etree.fromstring(tree), lxml.etree.fromstring(tree), backend='lxml'), Operations.add(tree, tree))
+
+
+    def test_UnknownBackend_ShouldFail(self):
+        self.assertRaises(ValueError, Operations.SAXIterator, "<xml/>", backend='minidom')
+
+    def test_LxmlBackendDocument_ShouldFail(self):
+        #the lxml backend only walks trees, documents are parsed by the other backends
+        self.assertRaises(TypeError, list, Operations.SAXIterator("<xml/>", backend='lxml'))
+        self.assertRaises(TypeError, list, Operations.SAXIterator(lxml.etree.fromstring("<xml/>"), backend='expat'))
+
+        
         
         
         
@@ -109,6 +185,24 @@ class test_Equal(unittest.TestCase):
         
         
         
+    def test_Longer_NotEqual(self):
+        tree1 = "<xml><a/></xml>"
+        tree2 = "<xml><a/><a/></xml>"
+        
+        self.assertFalse(Operations.equal(tree1, tree2), 'equal() returned True for a longer second tree')
+        self.assertFalse(Operations.equal(tree2, tree1), 'equal() returned True for a longer first tree')
+        
+        
+    def test_StopsAtFirstDifference(self):
+        body = "<a>text</a>" * 100000
+        tree1 = io.BytesIO(("<xml>" + body + "</xml>").encode('utf-8'))
+        tree2 = io.BytesIO(("<lmx>" + body + "</lmx>").encode('utf-8'))
+        
+        self.assertFalse(Operations.equal(tree1, tree2))
+        self.assertTrue(tree1.tell() <= Operations.CHUNKSIZE, 'equal() read %i bytes' % tree1.tell())
+        
+        
+        
 class test_Add(unittest.TestCase):
     def setUp(self):
         self.testfilesdir = os.path.join(os.path.dirname(__file__), '..', 'testfiles', 'SAX', 'Operations', 'Add')
@@ -193,6 +287,69 @@ class test_Add(unittest.TestCase):
         self.assertTrue(Operations.equal(result, expected), "Expected:\n%s\nGot:\n%s\n" % (expected, result))
         
         
+    def test_Sinks(self):
+        tree1 = "<a><b id='1'>a</b></a>"
+        tree2 = "<d><e id='a'>a</e><a/></d>"
+        expected = Operations.add(tree1, tree2)
+        
+        stream = io.StringIO()
+        self.assertEqual(Operations.add(tree1, tree2, sink=stream), None)
+        self.assertEqual(stream.getvalue(), expected)
+        
+        stream = io.BytesIO()
+        Operations.add(io.BytesIO(tree1.encode('utf-8')), tree2, sink=stream)
+        self.assertEqual(stream.getvalue(), expected.encode('utf-8'))
+        
+        data = bytearray()
+        Operations.add(tree1, tree2, sink=data)
+        self.assertEqual(data, expected.encode('utf-8'))
+        
+        chunks = []
+        Operations.add(tree1, tree2, sink=chunks.append)
+        self.assertEqual(''.join(chunks), expected)
+        
+        
+    def test_Escaping(self):
+        tree1 = "<a x='&quot;&lt;'>&amp;&lt;</a>"
+        tree2 = "<_/>"
+        result = Operations.add(tree1, tree2)
+        self.assertTrue(Operations.equal(result, tree1), "Expected:\n%s\nGot:\n%s\n" % (tree1, result))
+        
+        
+    def test_Buffering(self):
+        chunks = []
+        writer = Operations.SAXWriter(chunks.append, buffersize=10)
+        for i in range(5):
+            writer.write(Operations.StartElementEvent('abc'))
+        self.assertEqual(chunks, ['<abc><abc>', '<abc><abc>'])
+        writer.flush()
+        self.assertEqual(''.join(chunks), '<abc>' * 5)
+        
+        
+    def test_ConstantMemory(self):
+        #nothing is kept for every event, so adding a larger document does not take 
+        #more memory
+        import tracemalloc
+        def document(n):
+            return "<xml>" + ("<a x='1'>%s<b>b</b></a>\n" % ("text " * 50)) * n + "</xml>"
+        
+        iterator = Operations.SAXEventAndOrderingIterator(document(10))
+        for e in iterator:
+            pass
+        self.assertEqual(iterator.getCurrentOrdering(), [])
+        
+        peaks = []
+        for n in (1000, 4000):
+            tree = document(n)
+            tracemalloc.start()
+            try:
+                Operations.add(tree, tree, sink=lambda string: None)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        self.assertTrue(peaks[1] < peaks[0] * 1.5, 'add() used %i bytes for 1000 elements, %i bytes for 4000' % tuple(peaks))
+        
+        
     def test_SimpleTrees_EqualStructures(self):
     
         expectedtree  = ''.join(open(os.path.join(self.testfilesdir, 'test1', 'expected_add1.xml'), 'r'))